@@ -0,0 +1,135 @@
+"""
+Anomaly and change-point detection on the monthly accident series of every
+state at once (plus the national total as State "US").
+
+Per series, on log1p(monthly counts):
+  trend     2x12 centered moving average (edges padded with the nearest value)
+  seasonal  median of the detrended values for each calendar month
+  residual  value - trend - seasonal, scored as a robust z-score (median / MAD)
+Months with |z| >= Z_THRESHOLD are reported as "spike" / "drop".
+
+Change points: the split that maximizes the two-sample t statistic of the
+deseasonalized series (level shift), found for all split positions with
+cumulative sums; reported as "change_point" when the statistic exceeds
+SHIFT_THRESHOLD.
+
+Everything is vectorized over the (series x month) matrix, so the national
+pass is a few NumPy operations. build_analytics_tables.py runs it on the
+daily_counts table and writes the result as the `anomalies` table.
+"""
+import numpy as np
+import pandas as pd
+
+from streamlit_app.timeseries import DailyCounts, period_starts
+
+Z_THRESHOLD = 3.5
+SHIFT_THRESHOLD = 6.0
+MIN_MAD = 0.05        # log 尺度上的 MAD 下限，避免小州的 z 被放大
+MIN_MONTHS = 24
+NATIONAL = "US"
+
+
+def monthly_matrix(dc: DailyCounts):
+    """(series labels, month starts, counts[n_series, n_months]) for each state plus NATIONAL, full months only."""
+    states = sorted(set(dc.states))
+    by_state = np.stack([dc.series(s) for s in states] + [dc.series()])
+    days = dc.days
+    starts = period_starts(days, "M")
+    edges = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+    counts = np.add.reduceat(by_state, edges, axis=1)
+    months = starts[edges]
+
+    # 首尾不完整的月份不参与检测
+    n_days = np.diff(np.r_[edges, len(days)])
+    full_days = ((months.astype("datetime64[M]") + 1).astype("datetime64[D]") - months).astype(int)
+    full = n_days == full_days
+    return states + [NATIONAL], months[full], counts[:, full]
+
+
+def _nearest_fill(a: np.ndarray) -> np.ndarray:
+    """Fill NaNs along axis 1 with the previous valid value, then the next one."""
+    idx = np.where(np.isnan(a), 0, np.arange(a.shape[1]))
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    out = np.take_along_axis(a, idx, axis=1)
+    rev = out[:, ::-1]
+    idx = np.where(np.isnan(rev), 0, np.arange(a.shape[1]))
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return np.take_along_axis(rev, idx, axis=1)[:, ::-1]
+
+
+def _centered_ma12(y: np.ndarray) -> np.ndarray:
+    """2x12 centered moving average along axis 1 (NaN-padded, then nearest-filled)."""
+    cs = np.concatenate([np.zeros((y.shape[0], 1)), np.cumsum(y, axis=1)], axis=1)
+    ma12 = (cs[:, 12:] - cs[:, :-12]) / 12          # 窗口 [t, t+12)
+    ma2x12 = (ma12[:, 1:] + ma12[:, :-1]) / 2        # 以 t+6 为中心
+    trend = np.full(y.shape, np.nan)
+    trend[:, 6:6 + ma2x12.shape[1]] = ma2x12
+    return _nearest_fill(trend)
+
+
+def _robust_z(x: np.ndarray) -> np.ndarray:
+    med = np.median(x, axis=1, keepdims=True)
+    mad = np.median(np.abs(x - med), axis=1, keepdims=True) * 1.4826
+    return (x - med) / np.maximum(mad, MIN_MAD)
+
+
+def detect(labels, months: np.ndarray, counts: np.ndarray) -> pd.DataFrame:
+    """
+    Anomalies of every series in `counts` (n_series x n_months).
+    Returns State, month, kind, count, expected, score.
+    """
+    columns = ["State", "month", "kind", "count", "expected", "score"]
+    n_series, n_months = counts.shape
+    if n_months < MIN_MONTHS:
+        return pd.DataFrame(columns=columns)
+
+    y = np.log1p(counts.astype(np.float64))
+    trend = _centered_ma12(y)
+    detrended = y - trend
+
+    moy = months.astype("datetime64[M]").astype(int) % 12
+    seasonal = np.zeros_like(y)
+    for m in range(12):
+        cols = moy == m
+        if cols.any():
+            seasonal[:, cols] = np.median(detrended[:, cols], axis=1, keepdims=True)
+    seasonal -= seasonal.mean(axis=1, keepdims=True)
+
+    z = _robust_z(y - trend - seasonal)
+    expected = np.expm1(trend + seasonal)
+
+    rows = []
+    si, ti = np.nonzero(np.abs(z) >= Z_THRESHOLD)
+    for s, t in zip(si, ti):
+        rows.append((labels[s], months[t], "spike" if z[s, t] > 0 else "drop",
+                     int(counts[s, t]), float(expected[s, t]), float(z[s, t])))
+
+    # level shift：对每个切分点 k（前 k 个 / 后 n-k 个），用前缀和求两段均值差的 t 统计量
+    x = y - seasonal
+    n = n_months
+    k = np.arange(1, n)
+    cs = np.cumsum(x, axis=1)
+    cs2 = np.cumsum(x * x, axis=1)
+    left_mean = cs[:, :-1] / k
+    right_mean = (cs[:, -1:] - cs[:, :-1]) / (n - k)
+    sse = (cs2[:, -1:] - cs[:, :-1] ** 2 / k - (cs[:, -1:] - cs[:, :-1]) ** 2 / (n - k))
+    sigma = np.sqrt(np.maximum(sse / (n - 2), 1e-12))
+    t_stat = (right_mean - left_mean) / (sigma * np.sqrt(1 / k + 1 / (n - k)))
+    # 至少留 6 个月在两边
+    t_stat[:, :5] = 0
+    t_stat[:, n - 6:] = 0
+    best = np.argmax(np.abs(t_stat), axis=1)
+    for s, b in enumerate(best):
+        score = t_stat[s, b]
+        if abs(score) >= SHIFT_THRESHOLD:
+            rows.append((labels[s], months[b + 1], "change_point", int(counts[s, b + 1]),
+                         float(np.expm1(left_mean[s, b] + seasonal[s, b + 1])), float(score)))
+
+    out = pd.DataFrame(rows, columns=columns)
+    out["month"] = pd.to_datetime(out["month"])
+    return out.sort_values(["State", "month", "kind"]).reset_index(drop=True)
+
+
+def detect_anomalies(dc: DailyCounts) -> pd.DataFrame:
+    """Anomalies for every state and the national total from a DailyCounts."""
+    return detect(*monthly_matrix(dc))
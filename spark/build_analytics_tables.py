@@ -1,5 +1,29 @@
+import json
+import math
+import os
+import tempfile
+from datetime import datetime, timezone
+from functools import reduce
+
+import pandas as pd
+from pyarrow import fs as pafs
 from pyspark.sql import functions as F
+from pyspark.sql.types import StructType
+from pyspark.sql.window import Window
+from spark.anomalies import detect_anomalies
+from spark.heavy_hitters import merge_summaries, partition_summaries
+from spark.hotspots import EPS_METERS, HOTSPOT_SCHEMA, MIN_SAMPLES, hotspots_of_city
+from spark.parquet_layout import benchmark_layouts, get_layout, measure, write_with_layout
+from spark.polygon_index import COUNTY_POLYGONS_URL, PolygonIndex, load_geojson
 from spark.session_start import get_spark
+from streamlit_app.arrow_bundle import write_bundle
+from streamlit_app.constants import ROAD_FEATURES
+from streamlit_app.log_histogram import DISTANCE_BINS, DURATION_BINS, LogBins
+from streamlit_app.spatial_grid import MAX_RES, MIN_RES, cell_size
+from streamlit_app.text_index import DOC_COLUMNS, POSTINGS_SCHEMA, TOKEN_RE, index_tables, term_postings
+from streamlit_app.timeseries import DailyCounts
+from streamlit_app.vector_tiles import write_mbtiles
+from streamlit_app.weather_groups import LOOKUP_COLUMNS, build_lookup
 
 # -------------------------
 # Config
@@ -9,22 +33,67 @@ spark = get_spark("us-accidents-build-analytics")
 raw_path = "s3a://us-accidents-dashboard-1445/US_Accidents_March23_sampled_500k.csv"
 out_prefix = "s3a://us-accidents-dashboard-1445/analytics"
 
+# LAYOUT_BENCHMARK=1 时，每张表额外写出候选 layout 做大小 / 读取时间对比
+LAYOUT_BENCHMARK = os.environ.get("LAYOUT_BENCHMARK") == "1"
+layout_report = []
+
+# 行数不超过这个阈值的表会打进 Arrow IPC bundle（Streamlit 启动时整体 mmap）
+BUNDLE_MAX_ROWS = 200_000
+bundle_name = "dashboard_bundle.arrow"
+
+# 版本化输出的快照目录名：_versions/<table>/<BUILD_VERSION>
+BUILD_VERSION = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+SEVERITY_NAMES = {1: "Low", 2: "Medium", 3: "High", 4: "Critical"}
+
+# 点表共用的确定性抽样优先级：ID 的 63 位非负哈希 / 2^63，与分区、读取顺序无关，每次构建都一样
+sample_priority = F.xxhash64("ID").bitwiseAND(F.lit(0x7FFFFFFFFFFFFFFF)) / F.lit(float(2 ** 63))
+
 # -------------------------
 # Load raw
 # -------------------------
 df = spark.read.csv(raw_path, header=True, inferSchema=True)
 
-# Normalize time once (reused by multiple tables)
+# Weather_Condition -> (family, condition) lookup, built once on the driver from the
+# ~100 distinct raw strings (see streamlit_app/weather_groups.py)
+weather_lookup = build_lookup([r[0] for r in df.select("Weather_Condition").distinct().collect()])
+weather_names = spark.createDataFrame(weather_lookup[LOOKUP_COLUMNS]).select(
+    "Weather_Condition",
+    F.col("family_code").cast("byte").alias("family_code"),
+    "Family",
+    F.col("condition_code").cast("short").alias("condition_code"),
+    "Condition",
+)
+
+# Normalize time and weather once (reused by multiple tables)
 df2 = (
     df
     .withColumn("Start_Time_ts", F.to_timestamp("Start_Time"))
     .filter(F.col("Start_Time_ts").isNotNull())
+    # 广播 join：null 天气也要匹配到 Unknown 行
+    .join(
+        F.broadcast(weather_names.select(
+            F.col("Weather_Condition").alias("_weather_raw"), "family_code", "condition_code"
+        )),
+        F.col("Weather_Condition").eqNullSafe(F.col("_weather_raw")),
+        "left",
+    )
+    .drop("_weather_raw")
 )
 
-def write_parquet(df_out, name: str, coalesce_one: bool = True):
+def write_parquet(df_out, name: str, **layout_overrides):
+    """
+    Write a table with its layout from spark/parquet_layout.TABLE_LAYOUTS
+    (sort keys, row-group size, dictionary, ZSTD level, partitioning) and
+    record its size / pandas read time in layout_report.
+    """
     out_path = f"{out_prefix}/{name}"
-    w = df_out.coalesce(1) if coalesce_one else df_out
-    w.write.mode("overwrite").parquet(out_path)
+    layout = get_layout(name, **layout_overrides)
+    write_with_layout(df_out, out_path, layout)
+    layout_report.append(measure(spark, name, out_path, layout))
+
+    if LAYOUT_BENCHMARK:
+        print(f"\n=== layout benchmark: {name} ===")
+        print(benchmark_layouts(spark, df_out, name, f"{out_prefix}/_layout_bench").to_string(index=False))
     return out_path
 
 def validate_parquet(path: str, n: int = 10):
@@ -81,6 +150,78 @@ path_weather_sev = write_parquet(weather_severity_counts, "weather_severity_coun
 print("\n=== weather_severity_counts ===")
 validate_parquet(path_weather_sev, 10)
 
+# ============================================================
+# 3b) analytics/weather_conditions, weather_family_severity_counts,
+#     weather_condition_severity_counts  (for Weather)
+#    The raw -> family / condition lookup itself, and counts at both levels of
+#    the hierarchy. `rank` orders families / conditions by total accidents
+#    (1 = most); `family_rank` ranks a condition within its family, so the
+#    page reads a top-N per family with a filter instead of sorting.
+#    Output (family):    family_code (tinyint), Family, Severity, accident_count, rank
+#    Output (condition): family_code, condition_code (smallint), Condition, Severity,
+#                        accident_count, rank, family_rank
+# ============================================================
+path_weather_lookup = write_parquet(weather_names.orderBy("condition_code", "Weather_Condition"), "weather_conditions")
+print("\n=== weather_conditions ===")
+validate_parquet(path_weather_lookup, 10)
+
+weather_condition_base = (
+    df2
+    .filter(F.col("Severity").isNotNull())
+    .groupBy("family_code", "condition_code", "Severity")
+    .agg(F.count("*").cast("int").alias("accident_count"))
+    .cache()
+)
+
+family_names = weather_names.select("family_code", "Family").distinct()
+condition_names = weather_names.select("condition_code", "Condition").distinct()
+
+# 排名在各自的总数上算（几十行，单分区 window 没问题）
+family_totals = weather_condition_base.groupBy("family_code").agg(F.sum("accident_count").alias("total"))
+family_rank = family_totals.select(
+    "family_code",
+    F.row_number().over(Window.orderBy(F.desc("total"), "family_code")).cast("short").alias("rank"),
+)
+weather_family_severity_counts = (
+    weather_condition_base
+    .groupBy("family_code", "Severity")
+    .agg(F.sum("accident_count").cast("int").alias("accident_count"))
+    .join(family_rank, "family_code")
+    .join(family_names, "family_code")
+    .select("family_code", "Family", F.col("Severity").cast("byte").alias("Severity"), "accident_count", "rank")
+    .orderBy("rank", "Severity")
+)
+
+condition_totals = weather_condition_base.groupBy("family_code", "condition_code").agg(
+    F.sum("accident_count").alias("total")
+)
+condition_rank = condition_totals.select(
+    "condition_code",
+    F.row_number().over(Window.orderBy(F.desc("total"), "condition_code")).cast("short").alias("rank"),
+    F.row_number().over(
+        Window.partitionBy("family_code").orderBy(F.desc("total"), "condition_code")
+    ).cast("short").alias("family_rank"),
+)
+weather_condition_severity_counts = (
+    weather_condition_base
+    .join(condition_rank, "condition_code")
+    .join(condition_names, "condition_code")
+    .select(
+        "family_code", "condition_code", "Condition",
+        F.col("Severity").cast("byte").alias("Severity"), "accident_count", "rank", "family_rank",
+    )
+    .orderBy("rank", "Severity")
+)
+
+path_weather_family = write_parquet(weather_family_severity_counts, "weather_family_severity_counts")
+print("\n=== weather_family_severity_counts ===")
+validate_parquet(path_weather_family, 10)
+
+path_weather_condition = write_parquet(weather_condition_severity_counts, "weather_condition_severity_counts")
+print("\n=== weather_condition_severity_counts ===")
+validate_parquet(path_weather_condition, 10)
+weather_condition_base.unpersist()
+
 # ============================================================
 # 4) analytics/state_yearly_counts  (for Regional)
 #    Output: State, year, accident_count
@@ -137,7 +278,6 @@ state_quarter_counts = (
     .agg(F.count("*").alias("accident_count"))
 )
 
-from pyspark.sql.window import Window
 
 w = Window.partitionBy("year", "quarter").orderBy(F.desc("accident_count"))
 top_states_by_quarter = (
@@ -152,4 +292,689 @@ path_top_states_quarter = write_parquet(top_states_by_quarter, "top_states_by_qu
 print("\n=== top_states_by_quarter ===")
 validate_parquet(path_top_states_quarter, 20)
 
+# ============================================================
+# 7) analytics/state_*  (for Temporal, single-state views)
+#    Partitioned by State and sorted by year (see TABLE_LAYOUTS), so the Streamlit
+#    loader can push a State / year-range filter into the Parquet read.
+# ============================================================
+state_time = (
+    df2
+    .filter(F.col("State").isNotNull())
+    .withColumn("year", F.year("Start_Time_ts"))
+)
+
+state_tables = {
+    "state_year_severity_counts": ["State", "year", "Severity"],
+    "state_year_total_counts": ["State", "year"],
+}
+
+for name, keys in state_tables.items():
+    tbl = (
+        state_time
+        .groupBy(*keys)
+        .agg(F.count("*").alias("accident_count"))
+    )
+    path = write_parquet(tbl, name)
+    print(f"\n=== {name} ===")
+    validate_parquet(path, 10)
+
+# ------------------------------------------------------------
+# 7b) analytics/temporal_matrix  (for Temporal hour / weekday views)
+#    One row per (State, year) with a dense int32 `counts` array of
+#    weekday (0=Monday) x hour x severity (1..4) = 7 * 24 * 4 cells, flattened
+#    row-major; the page reshapes it into a NumPy array and slices hour,
+#    weekday and hour x weekday views out of it.
+# ------------------------------------------------------------
+MATRIX_CELLS = 7 * 24 * 4
+cell_counts = (
+    state_time
+    .withColumn("weekday", (F.dayofweek("Start_Time_ts") + 5) % 7)  # dayofweek: 1=Sunday ... 7=Saturday
+    .withColumn("cell", (F.col("weekday") * 24 + F.hour("Start_Time_ts")) * 4 + F.col("Severity").cast("int") - 1)
+    .filter(F.col("Severity").between(1, 4))
+    .groupBy("State", "year", "cell")
+    .agg(F.count("*").cast("int").alias("n"))
+)
+temporal_matrix = (
+    cell_counts
+    .groupBy("State", "year")
+    .agg(F.map_from_entries(F.collect_list(F.struct("cell", "n"))).alias("cells"))
+    .select(
+        "State",
+        F.col("year").cast("short").alias("year"),
+        # 稀疏 map -> 定长稠密数组，缺的格子补 0
+        F.transform(
+            F.sequence(F.lit(0), F.lit(MATRIX_CELLS - 1)),
+            lambda i: F.coalesce(F.element_at("cells", i), F.lit(0)),
+        ).alias("counts"),
+    )
+)
+
+path_matrix = write_parquet(temporal_matrix, "temporal_matrix")
+print("\n=== temporal_matrix ===")
+validate_parquet(path_matrix, 5)
+
+# ------------------------------------------------------------
+# 7c) analytics/daily_counts  (for Temporal trend charts, streamlit_app/timeseries.py)
+#    One row per (State, Severity) with a dense int32 `counts` array indexed by
+#    day number since `first_day` (shared by all rows); the page computes
+#    weekly / monthly / quarterly rollups, moving averages and YoY from it.
+# ------------------------------------------------------------
+daily = (
+    state_time
+    .withColumn("day", F.to_date("Start_Time_ts"))
+    .groupBy("State", "Severity", "day")
+    .agg(F.count("*").cast("int").alias("n"))
+)
+first_day, last_day = daily.agg(F.min("day"), F.max("day")).first()
+n_days = (last_day - first_day).days + 1
+
+daily_counts = (
+    daily
+    .withColumn("day_idx", F.datediff("day", F.lit(first_day)))
+    .groupBy("State", "Severity")
+    .agg(F.map_from_entries(F.collect_list(F.struct("day_idx", "n"))).alias("days"))
+    .select(
+        "State",
+        F.col("Severity").cast("byte").alias("Severity"),
+        F.lit(first_day).alias("first_day"),
+        F.transform(
+            F.sequence(F.lit(0), F.lit(n_days - 1)),
+            lambda i: F.coalesce(F.element_at("days", i), F.lit(0)),
+        ).alias("counts"),
+    )
+)
+
+path_daily = write_parquet(daily_counts, "daily_counts")
+print(f"\n=== daily_counts ({first_day} .. {last_day}, {n_days} days) ===")
+validate_parquet(path_daily, 5)
+
+# ------------------------------------------------------------
+# 7d) analytics/anomalies  (for Temporal trend annotations, see spark/anomalies.py)
+#    Monthly spikes / drops (robust z-score of the seasonal residual) and the
+#    strongest level shift per state and for the national total ("US").
+#    Output: State, month (timestamp), kind, count, expected, score
+# ------------------------------------------------------------
+anomalies = detect_anomalies(DailyCounts.from_table(spark.read.parquet(path_daily).toPandas()))
+path_anomalies = write_parquet(
+    spark.createDataFrame(
+        anomalies,
+        schema="State string, month timestamp, kind string, count int, expected double, score double",
+    ),
+    "anomalies",
+)
+print(f"\n=== anomalies ({len(anomalies)} flagged) ===")
+validate_parquet(path_anomalies, 20)
+
+# ============================================================
+# 8) analytics/county_year_severity_counts + county_severity_counts
+#    (for Severity county bubble map)
+#    Every accident is assigned to a county FIPS by point-in-polygon on its
+#    coordinates (spark/polygon_index.py, county polygons from COUNTY_POLYGONS),
+#    so county name spellings in the raw data no longer matter.
+#    county_fips.csv supplies display name + centroid where it has the county;
+#    otherwise the polygon's name and vertex centroid are used.
+#    county_year_severity_counts: fips (int), County, State, lat, lng (float32), year, Severity, accident_count
+#    county_severity_counts:      fips, County, State, lat, lng, Count, Critical, High, Medium, Low (all years)
+#    Each build also keeps an immutable copy under _versions/<table>/<BUILD_VERSION>.
+# ============================================================
+COUNTY_POLYGONS = os.environ.get("COUNTY_POLYGONS", COUNTY_POLYGONS_URL)
+
+
+def assign_region(df_points, index: PolygonIndex, col: str):
+    """Add `col` (region id, null outside every polygon): vectorized point-in-polygon per Arrow batch."""
+    index_bc = spark.sparkContext.broadcast(index)
+
+    def batches(it):
+        idx = index_bc.value
+        for pdf in it:
+            pdf[col] = idx.assign_ids(pdf["Start_Lat"].to_numpy(), pdf["Start_Lng"].to_numpy())
+            yield pdf
+
+    return df_points.mapInPandas(batches, StructType(list(df_points.schema.fields)).add(col, "string"))
+
+
+region_points = (
+    df2
+    .filter(F.col("Start_Lat").isNotNull() & F.col("Start_Lng").isNotNull())
+    .select(
+        "Start_Lat",
+        "Start_Lng",
+        F.year("Start_Time_ts").alias("year"),
+        "Severity",
+    )
+)
+
+county_index = PolygonIndex(load_geojson(COUNTY_POLYGONS), name_property="NAME")
+county_region_counts = (
+    assign_region(region_points, county_index, "region")
+    .groupBy("region", "year", "Severity")
+    .agg(F.count("*").cast("int").alias("accident_count"))
+    .withColumn("fips", F.col("region").cast("int"))
+    .cache()
+)
+unassigned = county_region_counts.filter(F.col("fips").isNull()).agg(F.sum("accident_count")).first()[0] or 0
+print(f"\n=== county assignment: {len(county_index.ids)} polygons, {unassigned} points outside every county ===")
+
+county_fips_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "county_fips.csv")
+county_dim = (
+    spark.read.csv(f"file://{os.path.abspath(county_fips_path)}", header=True, inferSchema=True)
+    .select(
+        F.col("STCOUNTYFP").cast("int").alias("fips"),
+        "County",
+        F.col("State").alias("State_Name"),
+        F.col("lat").cast("float").alias("lat"),
+        F.col("lng").cast("float").alias("lng"),
+    )
+    .dropDuplicates(["fips"])
+)
+# 州 FIPS（县 FIPS 的前两位）-> 州名
+state_fips_names = (
+    county_dim
+    .select(F.floor(F.col("fips") / 1000).cast("int").alias("state_fips"), F.col("State_Name").alias("fips_state_name"))
+    .dropDuplicates(["state_fips"])
+)
+polygon_dim = spark.createDataFrame(
+    county_index.regions(),
+    schema="region string, name string, lat double, lng double",
+).select(
+    F.col("region").cast("int").alias("fips"),
+    F.col("name").alias("polygon_name"),
+    F.col("lat").cast("float").alias("polygon_lat"),
+    F.col("lng").cast("float").alias("polygon_lng"),
+)
+
+county_year_severity_counts = (
+    county_region_counts
+    .filter(F.col("fips").isNotNull())
+    # 维表都很小：broadcast join，不 shuffle 聚合结果
+    .join(F.broadcast(polygon_dim), "fips", "left")
+    .join(F.broadcast(county_dim), "fips", "left")
+    .join(F.broadcast(state_fips_names), F.floor(F.col("fips") / 1000).cast("int") == F.col("state_fips"), "left")
+    .select(
+        "fips",
+        F.coalesce("County", "polygon_name").alias("County"),
+        F.coalesce("State_Name", "fips_state_name").alias("State"),
+        F.coalesce("lat", "polygon_lat").alias("lat"),
+        F.coalesce("lng", "polygon_lng").alias("lng"),
+        F.col("year").cast("int").alias("year"),
+        "Severity",
+        "accident_count",
+    )
+)
+county_year_severity_counts = county_year_severity_counts.cache()
+
+county_severity_counts = (
+    county_year_severity_counts
+    .groupBy("fips", "County", "State", "lat", "lng")
+    .pivot("Severity", list(SEVERITY_NAMES))
+    .agg(F.sum("accident_count"))
+    .na.fill(0)
+    .select(
+        "fips", "County", "State", "lat", "lng",
+        *[F.col(str(code)).cast("int").alias(label) for code, label in SEVERITY_NAMES.items()],
+    )
+    .withColumn("Count", sum(F.col(label) for label in SEVERITY_NAMES.values()).cast("int"))
+    .select("fips", "County", "State", "lat", "lng", "Count", "Critical", "High", "Medium", "Low")
+)
+
+for name, df_county in [
+    ("county_year_severity_counts", county_year_severity_counts),
+    ("county_severity_counts", county_severity_counts),
+]:
+    path_county = write_parquet(df_county, name)
+    write_with_layout(df_county, f"{out_prefix}/_versions/{name}/{BUILD_VERSION}", get_layout(name))
+    print(f"\n=== {name} (version {BUILD_VERSION}) ===")
+    validate_parquet(path_county, 10)
+
+county_year_severity_counts.unpersist()
+county_region_counts.unpersist()
+
+# ------------------------------------------------------------
+# 8b) analytics/region_year_severity_counts  (REGION_POLYGONS set)
+#    Same point-in-polygon pass against any GeoJSON polygon set, e.g. ZIP code
+#    tabulation areas (REGION_ID_PROPERTY=ZCTA5CE10) or custom sales regions.
+#    Output: region, name, lat, lng (vertex centroid), year, Severity, accident_count
+# ------------------------------------------------------------
+REGION_POLYGONS = os.environ.get("REGION_POLYGONS")
+if REGION_POLYGONS:
+    region_index = PolygonIndex(
+        load_geojson(REGION_POLYGONS),
+        id_property=os.environ.get("REGION_ID_PROPERTY"),
+        name_property=os.environ.get("REGION_NAME_PROPERTY"),
+    )
+    region_year_severity_counts = (
+        assign_region(region_points, region_index, "region")
+        .filter(F.col("region").isNotNull())
+        .groupBy("region", "year", "Severity")
+        .agg(F.count("*").cast("int").alias("accident_count"))
+        .join(
+            F.broadcast(spark.createDataFrame(
+                region_index.regions(),
+                schema="region string, name string, lat double, lng double",
+            )),
+            "region",
+        )
+        .select(
+            "region", "name",
+            F.col("lat").cast("float").alias("lat"),
+            F.col("lng").cast("float").alias("lng"),
+            "year", "Severity", "accident_count",
+        )
+    )
+    path_regions = write_parquet(region_year_severity_counts, "region_year_severity_counts")
+    print(f"\n=== region_year_severity_counts ({len(region_index.ids)} polygons from {REGION_POLYGONS}) ===")
+    validate_parquet(path_regions, 10)
+
+# ============================================================
+# 9) analytics/grid_severity_year_counts  (for Regional national density map)
+#    Exact counts per square grid cell at every resolution of
+#    streamlit_app/spatial_grid.py (res 0 = 4° cells ... MAX_RES ≈ 0.03°).
+#    Points are assigned once at MAX_RES; coarser levels are re-aggregated
+#    from it by shifting the cell index (parent = index >> 1).
+#    Output: res (tinyint, partition), cell_x, cell_y (int), year (smallint), Severity (tinyint), accident_count (int)
+# ============================================================
+finest_size = cell_size(MAX_RES)
+grid_finest = (
+    df2
+    .filter(F.col("Start_Lat").isNotNull() & F.col("Start_Lng").isNotNull())
+    .select(
+        F.floor((F.col("Start_Lng") + 180.0) / finest_size).cast("int").alias("cell_x"),
+        F.floor((F.col("Start_Lat") + 90.0) / finest_size).cast("int").alias("cell_y"),
+        F.year("Start_Time_ts").cast("short").alias("year"),
+        F.col("Severity").cast("byte").alias("Severity"),
+    )
+    .groupBy("cell_x", "cell_y", "year", "Severity")
+    .agg(F.count("*").cast("int").alias("accident_count"))
+    .cache()
+)
+
+grid_levels = []
+for res in range(MIN_RES, MAX_RES + 1):
+    shift = MAX_RES - res
+    grid_levels.append(
+        grid_finest
+        .select(
+            F.shiftright("cell_x", shift).alias("cell_x"),
+            F.shiftright("cell_y", shift).alias("cell_y"),
+            "year", "Severity", "accident_count",
+        )
+        .groupBy("cell_x", "cell_y", "year", "Severity")
+        .agg(F.sum("accident_count").cast("int").alias("accident_count"))
+        .withColumn("res", F.lit(res).cast("byte"))
+    )
+grid_counts = reduce(lambda a, b: a.unionByName(b), grid_levels)
+
+path_grid = write_parquet(grid_counts, "grid_severity_year_counts")
+print("\n=== grid_severity_year_counts ===")
+validate_parquet(path_grid, 10)
+grid_finest.unpersist()
+
+# ============================================================
+# 10) analytics/accident_points  (for Regional city heatmap + Severity LA heatmap)
+#    One row per accident with a stable pseudo-random sample_priority in [0, 1)
+#    (hash of the accident ID), stored sorted by (City, sample_priority): the
+#    pages take the first N rows matching a filter instead of a random sample.
+#    Output: City, State, year (smallint), hour, Severity (tinyint), Start_Lat, Start_Lng (float), sample_priority (double)
+# ============================================================
+accident_points = (
+    df2
+    .filter(F.col("City").isNotNull() & F.col("Start_Lat").isNotNull() & F.col("Start_Lng").isNotNull())
+    .select(
+        "City",
+        "State",
+        F.year("Start_Time_ts").cast("short").alias("year"),
+        F.hour("Start_Time_ts").cast("byte").alias("hour"),
+        F.col("Severity").cast("byte").alias("Severity"),
+        F.col("Start_Lat").cast("float").alias("Start_Lat"),
+        F.col("Start_Lng").cast("float").alias("Start_Lng"),
+        sample_priority.alias("sample_priority"),
+    )
+)
+
+path_points = write_parquet(accident_points, "accident_points")
+print("\n=== accident_points ===")
+validate_parquet(path_points, 10)
+
+# ============================================================
+# 11) analytics/accident_points.mbtiles  (vector tiles served by streamlit_app/tile_server.py)
+#    accident_points cut into MVT tiles for zooms MIN_ZOOM..MAX_ZOOM in one
+#    MBTiles (SQLite) file; each tile keeps its lowest-priority points.
+# ============================================================
+tile_points = (
+    spark.read.parquet(path_points)
+    .select("City", "year", "Severity", "Start_Lat", "Start_Lng", "sample_priority")
+    .toPandas()
+)
+mbtiles_name = "accident_points.mbtiles"
+with tempfile.TemporaryDirectory() as tmp_dir:
+    local_mbtiles = os.path.join(tmp_dir, mbtiles_name)
+    tile_counts = write_mbtiles(tile_points, local_mbtiles)
+    pafs.copy_files(local_mbtiles, f"{out_prefix}/{mbtiles_name}".replace("s3a://", "s3://", 1))
+del tile_points
+
+print(f"\n=== {mbtiles_name} ===")
+for z, n_tiles in tile_counts.items():
+    print(f"zoom {z}: {n_tiles} tiles")
+
+# ------------------------------------------------------------
+# 11b) analytics/hotspots  (for Regional city heatmap overlay, see spark/hotspots.py)
+#    Grid DBSCAN (EPS_METERS, MIN_SAMPLES) over all accident points of each
+#    city_counts_topN city, one (City, State) group per applyInPandas call.
+#    Output: City, State, cluster (1 = largest), Count, lat, lng (centroid),
+#            min_lat, min_lng, max_lat, max_lng, radius_m, Critical, High, Medium, Low
+# ------------------------------------------------------------
+hotspots = (
+    spark.read.parquet(path_points)
+    .join(F.broadcast(city_counts_topN.select("City", "State")), ["City", "State"])
+    .select("City", "State", "Severity", "Start_Lat", "Start_Lng")
+    .groupBy("City", "State")
+    .applyInPandas(hotspots_of_city, HOTSPOT_SCHEMA)
+)
+path_hotspots = write_parquet(hotspots, "hotspots")
+print(f"\n=== hotspots (eps {EPS_METERS:.0f} m, min_samples {MIN_SAMPLES}) ===")
+validate_parquet(path_hotspots, 10)
+
+# ============================================================
+# 12) analytics/text_index.arrow  (Description / Street search, streamlit_app/text_index.py)
+#    Inverted index: term -> delta + varint encoded row ids, with per-term
+#    severity / state counts, plus the matching point rows, in one Arrow bundle.
+#    Tokenizing and the per-term posting lists run in Spark; the driver only
+#    collects the doc columns (no text) and the encoded posting bytes.
+# ============================================================
+ranked_docs = (
+    df2
+    .select(
+        "ID",
+        "Description",
+        "Street",
+        "State",
+        "City",
+        F.col("Severity").cast("byte").alias("Severity"),
+        F.year("Start_Time_ts").cast("short").alias("year"),
+        F.col("Start_Lat").cast("float").alias("Start_Lat"),
+        F.col("Start_Lng").cast("float").alias("Start_Lng"),
+        sample_priority.alias("sample_priority"),
+    )
+    .orderBy("sample_priority", "ID")
+    # 排序后各分区按顺序排列，分区内 monotonically_increasing_id 连续：
+    # row id = 分区起点（前面各分区行数之和）+ 分区内序号，不用单分区 window
+    .withColumn("_part", F.spark_partition_id())
+    .withColumn("_local", F.monotonically_increasing_id() - F.shiftleft(F.col("_part").cast("long"), 33))
+    .cache()
+)
+part_starts, n_docs = [], 0
+for r in sorted(ranked_docs.groupBy("_part").count().collect()):
+    part_starts.append((r["_part"], n_docs))
+    n_docs += r["count"]
+text_docs = ranked_docs.join(
+    F.broadcast(spark.createDataFrame(part_starts, "_part int, _start long")), "_part"
+).withColumn("doc_id", (F.col("_start") + F.col("_local")).cast("int"))
+
+text_terms = (
+    text_docs
+    .select(
+        "doc_id",
+        "Severity",
+        "State",
+        # 与 text_index.TOKEN_RE 相同的切词；同一条记录里重复的词只记一次
+        F.explode(F.array_distinct(F.regexp_extract_all(
+            F.lower(F.concat_ws(" ", F.coalesce("Description", F.lit("")), F.coalesce("Street", F.lit("")))),
+            F.lit(TOKEN_RE),
+            0,
+        ))).alias("term"),
+    )
+    .groupBy("term")
+    .applyInPandas(term_postings, POSTINGS_SCHEMA)
+    .orderBy("term")
+    .toPandas()
+)
+text_doc_rows = text_docs.select("doc_id", *DOC_COLUMNS).orderBy("doc_id").toPandas()
+ranked_docs.unpersist()
+
+text_index_name = "text_index.arrow"
+with tempfile.TemporaryDirectory() as tmp_dir:
+    local_index = os.path.join(tmp_dir, text_index_name)
+    text_header = write_bundle(index_tables(text_doc_rows, text_terms), local_index)
+    pafs.copy_files(local_index, f"{out_prefix}/{text_index_name}".replace("s3a://", "s3://", 1))
+
+print(f"\n=== {text_index_name} ===")
+for name, meta in text_header["tables"].items():
+    print(f"{name}: {meta['rows']} rows, {meta['length']:,} bytes")
+
+# ============================================================
+# 13) analytics/street_rankings  (for Regional street ranking)
+#    Exact top TOP_K_STREETS streets per scope and year (year null = all years):
+#      national  State, City null
+#      state     per State (code)
+#      city      per (City, State) of the city_counts_topN cities
+#    Output: scope, State, City, year (smallint), rank (smallint), Street, Count, Critical, High, Medium, Low
+# ============================================================
+TOP_K_STREETS = 25
+STREET_SCOPES = {"national": [], "state": ["State"], "city": ["State", "City"]}
+street_count_cols = ["Count", *reversed(list(SEVERITY_NAMES.values()))]
+
+street_rows = (
+    df2
+    .filter(F.col("Street").isNotNull() & F.col("State").isNotNull())
+    .select(
+        "State",
+        "City",
+        F.trim("Street").alias("Street"),
+        F.year("Start_Time_ts").cast("short").alias("year"),
+        F.col("Severity").cast("byte").alias("Severity"),
+    )
+)
+street_base = (
+    street_rows
+    .groupBy("State", "City", "Street", "year")
+    .agg(
+        F.count("*").cast("int").alias("Count"),
+        *[F.sum((F.col("Severity") == code).cast("int")).alias(label) for code, label in SEVERITY_NAMES.items()],
+    )
+    .cache()
+)
+top_city_keys = city_counts_topN.select("City", "State")
+
+
+def rank_streets(base, scope: str):
+    keys = STREET_SCOPES[scope]
+    sums = [F.sum(c).cast("int").alias(c) for c in street_count_cols]
+    per_year = base.groupBy(*keys, "Street", "year").agg(*sums)
+    all_years = per_year.groupBy(*keys, "Street").agg(*sums).withColumn("year", F.lit(None).cast("short"))
+    w = Window.partitionBy(*keys, "year").orderBy(F.desc("Count"), "Street")
+    ranked = (
+        per_year.unionByName(all_years)
+        .withColumn("rank", F.row_number().over(w).cast("short"))
+        .filter(F.col("rank") <= TOP_K_STREETS)
+        .withColumn("scope", F.lit(scope))
+    )
+    for c in ["State", "City"]:
+        if c not in keys:
+            ranked = ranked.withColumn(c, F.lit(None).cast("string"))
+    return ranked.select("scope", "State", "City", "year", "rank", "Street", *street_count_cols)
+
+
+street_rankings = reduce(
+    lambda a, b: a.unionByName(b),
+    [
+        rank_streets(street_base, "national"),
+        rank_streets(street_base, "state"),
+        # 只给 Top 城市排名，城市维表很小，broadcast join
+        rank_streets(street_base.join(F.broadcast(top_city_keys), ["City", "State"]), "city"),
+    ],
+)
+
+path_streets = write_parquet(street_rankings, "street_rankings")
+print("\n=== street_rankings ===")
+validate_parquet(path_streets, 10)
+street_base.unpersist()
+
+# ------------------------------------------------------------
+# 13b) analytics/_versions/street_sketches  (STREET_SKETCHES=1, for incremental runs)
+#    One Space-Saving summary (spark/heavy_hitters.py) per ranking key, built
+#    per partition and merged with reduceByKey, written to
+#    _versions/street_sketches/<BUILD_VERSION>. With STREET_SKETCH_PREVIOUS set
+#    to an earlier version, the raw input is treated as a new batch and merged
+#    into the stored summaries instead of rescanning all history.
+#    Severity splits are only in the exact table.
+#    Output: scope, State, City, year, n (rows summarized), summary (JSON)
+# ------------------------------------------------------------
+STREET_SKETCHES = os.environ.get("STREET_SKETCHES") == "1"
+STREET_SKETCH_PREVIOUS = os.environ.get("STREET_SKETCH_PREVIOUS")
+STREET_SKETCH_K = 200  # 每个 key 的计数器个数：真实计数 > n / k 的街道一定在 summary 里
+
+if STREET_SKETCHES:
+    top_cities = {(r["City"], r["State"]) for r in top_city_keys.collect()}
+
+    def street_sketch_keys(row):
+        for year in (row["year"], None):
+            yield ("national", None, None, year)
+            yield ("state", row["State"], None, year)
+            if (row["City"], row["State"]) in top_cities:
+                yield ("city", row["State"], row["City"], year)
+
+    sketches = (
+        street_rows.rdd
+        .mapPartitions(lambda rows: partition_summaries(rows, street_sketch_keys, "Street", STREET_SKETCH_K))
+        .reduceByKey(merge_summaries)
+    )
+    if STREET_SKETCH_PREVIOUS:
+        previous = (
+            spark.read.parquet(STREET_SKETCH_PREVIOUS).rdd
+            .map(lambda r: ((r["scope"], r["State"], r["City"], r["year"]), json.loads(r["summary"])))
+        )
+        sketches = sketches.union(previous).reduceByKey(merge_summaries)
+
+    street_sketches = spark.createDataFrame(
+        sketches.map(lambda kv: (*kv[0], kv[1]["n"], json.dumps(kv[1]))),
+        schema="scope string, State string, City string, year short, n long, summary string",
+    )
+    # summary 是构建状态：只写版本目录（下次增量读它），不进 layout_report / dashboard bundle
+    path_sketches = f"{out_prefix}/_versions/street_sketches/{BUILD_VERSION}"
+    write_with_layout(street_sketches, path_sketches, get_layout("street_sketches"))
+    print(f"\n=== street_sketches (version {BUILD_VERSION}) ===")
+    validate_parquet(path_sketches, 5)
+
+# ============================================================
+# 14) analytics/impact_histograms  (for Severity clearance-time section)
+#    Per (State, Severity, year, Weather_Condition): fixed log-bin histograms
+#    (streamlit_app/log_histogram.py) of the clearance time End_Time - Start_Time
+#    in minutes and of the impact length Distance(mi). The bins are the same for
+#    every row, so any filter merges by adding arrays and the page reads
+#    quantiles from the merged counts.
+#    Output: State, Severity (tinyint), year (smallint), Weather_Condition, n (rows with a clearance time),
+#            duration_counts (array<int>, DURATION_BINS), distance_counts (array<int>, DISTANCE_BINS)
+# ============================================================
+IMPACT_KEYS = ["State", "Severity", "year", "Weather_Condition"]
+
+
+def log_bin(col, bins: LogBins):
+    """LogBins.index as a Spark expression (col >= 0)."""
+    i = F.floor(F.log(col / F.lit(bins.lo)) / F.lit(math.log(bins.ratio))).cast("int") + 1
+    return F.when(col < bins.lo, 0).otherwise(F.least(i, F.lit(bins.n - 1)))
+
+
+def dense_histogram(df_values, value_col: str, bins: LogBins, name: str):
+    return (
+        df_values
+        .filter(F.col(value_col).isNotNull() & (F.col(value_col) >= 0))
+        .groupBy(*IMPACT_KEYS, log_bin(F.col(value_col), bins).alias("bin"))
+        .agg(F.count("*").cast("int").alias("n"))
+        .groupBy(*IMPACT_KEYS)
+        .agg(F.map_from_entries(F.collect_list(F.struct("bin", "n"))).alias("bins"))
+        .select(
+            *IMPACT_KEYS,
+            F.transform(
+                F.sequence(F.lit(0), F.lit(bins.n - 1)),
+                lambda i: F.coalesce(F.element_at("bins", i), F.lit(0)),
+            ).alias(name),
+        )
+    )
+
+
+impact_values = (
+    df2
+    .filter(F.col("State").isNotNull() & F.col("Severity").isNotNull())
+    .select(
+        "State",
+        F.col("Severity").cast("byte").alias("Severity"),
+        F.year("Start_Time_ts").cast("short").alias("year"),
+        F.coalesce("Weather_Condition", F.lit("Unknown")).alias("Weather_Condition"),
+        ((F.unix_timestamp(F.to_timestamp("End_Time")) - F.unix_timestamp("Start_Time_ts")) / 60.0).alias("duration_min"),
+        F.col("Distance(mi)").cast("double").alias("distance_mi"),
+    )
+    .cache()
+)
+impact_histograms = (
+    dense_histogram(impact_values, "duration_min", DURATION_BINS, "duration_counts")
+    .join(dense_histogram(impact_values, "distance_mi", DISTANCE_BINS, "distance_counts"), IMPACT_KEYS, "full")
+    .select(
+        *IMPACT_KEYS,
+        F.coalesce("duration_counts", F.array_repeat(F.lit(0), DURATION_BINS.n)).alias("duration_counts"),
+        F.coalesce("distance_counts", F.array_repeat(F.lit(0), DISTANCE_BINS.n)).alias("distance_counts"),
+    )
+    .withColumn("n", F.aggregate("duration_counts", F.lit(0), lambda acc, x: acc + x))
+    .select(*IMPACT_KEYS, "n", "duration_counts", "distance_counts")
+)
+
+path_impact = write_parquet(impact_histograms, "impact_histograms")
+print(f"\n=== impact_histograms ({DURATION_BINS.n} duration bins, {DISTANCE_BINS.n} distance bins) ===")
+validate_parquet(path_impact, 5)
+impact_values.unpersist()
+
+# ============================================================
+# 15) analytics/road_feature_counts  (for Severity radar + road feature comparison)
+#    The eight boolean road-feature columns are packed into one `flags`
+#    bitmask (bit i = ROAD_FEATURES[i]) and counted per distinct combination,
+#    so a handful of rows per (State, year, Severity) carry every per-feature
+#    count and co-occurrence; the page expands the bits with NumPy.
+#    Output: State, year (smallint), Severity (tinyint), flags (smallint), accident_count (int)
+# ============================================================
+road_flags = reduce(
+    lambda a, b: a.bitwiseOR(b),
+    [
+        F.shiftleft(F.coalesce(F.col(c).cast("boolean"), F.lit(False)).cast("int"), bit)
+        for bit, c in enumerate(ROAD_FEATURES)
+    ],
+)
+road_feature_counts = (
+    df2
+    .filter(F.col("State").isNotNull() & F.col("Severity").isNotNull())
+    .groupBy(
+        "State",
+        F.year("Start_Time_ts").cast("short").alias("year"),
+        F.col("Severity").cast("byte").alias("Severity"),
+        road_flags.cast("short").alias("flags"),
+    )
+    .agg(F.count("*").cast("int").alias("accident_count"))
+)
+
+path_road = write_parquet(road_feature_counts, "road_feature_counts")
+print("\n=== road_feature_counts ===")
+validate_parquet(path_road, 10)
+
+print("\n=== layout report ===")
+print(pd.DataFrame(layout_report).drop(columns="path").to_string(index=False))
+
+# ============================================================
+# 16) analytics/dashboard_bundle.arrow  (for Streamlit table store)
+#    All small tables above in one memory-mappable Arrow IPC file, with
+#    low-cardinality string columns dictionary encoded.
+# ============================================================
+bundle_tables = {}
+for row in layout_report:
+    tbl = spark.read.parquet(row["path"])
+    if tbl.count() <= BUNDLE_MAX_ROWS:
+        bundle_tables[row["table"]] = tbl.toPandas()
+
+with tempfile.TemporaryDirectory() as tmp_dir:
+    local_bundle = os.path.join(tmp_dir, bundle_name)
+    header = write_bundle(bundle_tables, local_bundle)
+    # pyarrow 的 S3 filesystem 用 s3:// URI
+    pafs.copy_files(local_bundle, f"{out_prefix}/{bundle_name}".replace("s3a://", "s3://", 1))
+
+print("\n=== dashboard_bundle.arrow ===")
+for name, meta in header["tables"].items():
+    print(f"{name}: {meta['rows']} rows, {meta['length']:,} bytes")
+
 print("\nAll analytics tables generated under:", out_prefix)
@@ -0,0 +1,115 @@
+"""
+Space-Saving heavy-hitter summaries for the street rankings.
+
+The builder computes the exact top-K streets with Spark aggregations. For
+incremental runs (only a new batch of rows is scanned) it keeps one
+Space-Saving summary per ranking key instead: k counters, every street whose
+true count exceeds n / k is guaranteed to be in it, and each estimate
+overshoots by at most its recorded error.
+
+Summaries merge (partition summaries -> one summary; stored summary + new
+batch) and serialize to plain dicts, so they can be stored between runs.
+
+Evictions pop the smallest counter from a min-heap with lazy deletion:
+increments push a new (count, item) entry and leave the old one behind,
+stale entries are skipped when popped, and the heap is rebuilt from the
+counters once it grows past a few times k.
+"""
+import heapq
+import itertools
+
+
+class SpaceSaving:
+    def __init__(self, k: int = 200):
+        self.k = k
+        self.counts = {}  # item -> count
+        self.errors = {}  # item -> 可能多算的上限
+        self.n = 0
+        self._heap = None  # [(count, seq, item)]，可能含过期项；None 表示需要从 counts 重建
+        self._seq = itertools.count()  # 计数相同时不比较 item 本身
+
+    def _push(self, item):
+        if self._heap is not None:
+            heapq.heappush(self._heap, (self.counts[item], next(self._seq), item))
+
+    def _pop_min(self):
+        """Remove and return the item with the smallest counter."""
+        if self._heap is None or len(self._heap) > 4 * self.k:
+            self._heap = [(c, next(self._seq), i) for i, c in self.counts.items()]
+            heapq.heapify(self._heap)
+        while True:
+            count, _, item = heapq.heappop(self._heap)
+            # 过期项：该 item 已被替换，或之后又被加过计数
+            if self.counts.get(item) == count:
+                return item
+
+    def update(self, item, weight: int = 1):
+        self.n += weight
+        if item in self.counts:
+            self.counts[item] += weight
+        elif len(self.counts) < self.k:
+            self.counts[item] = weight
+            self.errors[item] = 0
+        else:
+            # 替换当前最小的计数器，新项继承它的计数作为误差
+            victim = self._pop_min()
+            floor = self.counts.pop(victim)
+            self.errors.pop(victim)
+            self.counts[item] = floor + weight
+            self.errors[item] = floor
+        self._push(item)
+
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        """Mergeable summary: add counters, then keep the k largest."""
+        out = SpaceSaving(max(self.k, other.k))
+        out.n = self.n + other.n
+        # 不在某一侧 summary 里的项，最多有该侧最小计数那么多
+        floor_a = min(self.counts.values()) if len(self.counts) >= self.k else 0
+        floor_b = min(other.counts.values()) if len(other.counts) >= other.k else 0
+        for item in set(self.counts) | set(other.counts):
+            a, b = self.counts.get(item), other.counts.get(item)
+            out.counts[item] = (a if a is not None else floor_a) + (b if b is not None else floor_b)
+            out.errors[item] = (self.errors.get(item, floor_a) if a is not None else floor_a) + \
+                               (other.errors.get(item, floor_b) if b is not None else floor_b)
+        keep = sorted(out.counts, key=out.counts.get, reverse=True)[:out.k]
+        out.counts = {i: out.counts[i] for i in keep}
+        out.errors = {i: out.errors[i] for i in keep}
+        return out
+
+    def top(self, n: int):
+        """[(item, estimated count, max overcount)] for the n largest counters."""
+        items = sorted(self.counts, key=lambda i: (-self.counts[i], str(i)))[:n]
+        return [(i, self.counts[i], self.errors[i]) for i in items]
+
+    def to_dict(self) -> dict:
+        return {"k": self.k, "n": self.n, "items": [[i, c, self.errors[i]] for i, c in self.counts.items()]}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "SpaceSaving":
+        out = cls(d["k"])
+        out.n = d["n"]
+        for item, count, err in d["items"]:
+            out.counts[item] = count
+            out.errors[item] = err
+        return out
+
+
+def partition_summaries(rows, keys_of, item_col: str, k: int):
+    """
+    mapPartitions body: one SpaceSaving per ranking key for the rows of a
+    partition. `keys_of(row)` yields the keys a row counts towards (e.g. its
+    state and its city). Yields (key, summary dict).
+    """
+    summaries = {}
+    for row in rows:
+        for key in keys_of(row):
+            summary = summaries.get(key)
+            if summary is None:
+                summary = summaries[key] = SpaceSaving(k)
+            summary.update(row[item_col])
+    for key, summary in summaries.items():
+        yield key, summary.to_dict()
+
+
+def merge_summaries(a: dict, b: dict) -> dict:
+    return SpaceSaving.from_dict(a).merge(SpaceSaving.from_dict(b)).to_dict()
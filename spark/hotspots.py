@@ -0,0 +1,188 @@
+"""
+Accident hotspot clusters per city (DBSCAN on a uniform grid).
+
+Coordinates are projected to local meters (equirectangular around the city's
+mean latitude) and bucketed into square cells of side EPS_METERS / sqrt(2), so
+any two points of one cell are within EPS_METERS of each other:
+
+  core points    every point of a cell holding >= MIN_SAMPLES points; for the
+                 other cells, neighbours are counted in the 21 cells that can
+                 contain points within EPS_METERS
+  clusters       union-find over cells with core points: two cells are joined
+                 when a pair of their core points is within EPS_METERS
+  border points  non-core points take the cluster of their nearest core point
+                 within EPS_METERS; everything else is noise
+
+Each city is independent: build_analytics_tables.py groups the points by
+(City, State) and runs `hotspots_of_city` per group with applyInPandas, then
+writes the summaries as the `hotspots` table.
+"""
+import numpy as np
+import pandas as pd
+
+EPS_METERS = 200.0
+MIN_SAMPLES = 25
+MAX_CLUSTERS_PER_CITY = 50
+EARTH_RADIUS_M = 6_371_000.0
+SEVERITY_COLUMNS = ["Critical", "High", "Medium", "Low"]
+
+# hotspots 表的列：(name, Spark 类型, pandas dtype)
+HOTSPOT_COLUMNS = [
+    ("City", "string", object), ("State", "string", object), ("cluster", "short", "int16"),
+    ("Count", "int", "int32"), ("lat", "double", "float64"), ("lng", "double", "float64"),
+    ("min_lat", "double", "float64"), ("min_lng", "double", "float64"),
+    ("max_lat", "double", "float64"), ("max_lng", "double", "float64"),
+    ("radius_m", "float", "float32"),
+] + [(c, "int", "int32") for c in SEVERITY_COLUMNS]
+HOTSPOT_SCHEMA = ", ".join(f"{name} {spark_type}" for name, spark_type, _ in HOTSPOT_COLUMNS)
+
+# 与中心格子可能有距离 <= eps 的点的格子偏移（5x5 去掉四个角）
+_OFFSETS = np.array([(dx, dy) for dx in range(-2, 3) for dy in range(-2, 3) if abs(dx) + abs(dy) < 4])
+
+
+def project(lat: np.ndarray, lng: np.ndarray):
+    """Local x / y in meters around the mean latitude (accurate at city scale)."""
+    lat0 = np.radians(np.mean(lat))
+    x = np.radians(lng) * np.cos(lat0) * EARTH_RADIUS_M
+    y = np.radians(lat) * EARTH_RADIUS_M
+    return x, y
+
+
+def grid_dbscan(x: np.ndarray, y: np.ndarray, eps: float = EPS_METERS, min_samples: int = MIN_SAMPLES) -> np.ndarray:
+    """DBSCAN labels (0..k-1, -1 = noise) for points in a metric plane; neighbourhoods include the point itself."""
+    n = len(x)
+    labels = np.full(n, -1, dtype=np.int64)
+    if n == 0:
+        return labels
+
+    side = eps / np.sqrt(2)
+    gx = np.floor(x / side).astype(np.int64)
+    gy = np.floor(y / side).astype(np.int64)
+    gx -= gx.min() - 2
+    gy -= gy.min() - 2
+    width = int(gy.max()) + 3
+    key = gx * width + gy
+
+    order = np.argsort(key, kind="stable")
+    xs, ys = x[order], y[order]
+    cells, starts, counts = np.unique(key[order], return_index=True, return_counts=True)
+    ends = starts + counts
+
+    # neighbors[c, j]: 第 j 个偏移对应的格子下标，不存在为 -1
+    nkeys = cells[:, None] + (_OFFSETS[:, 0] * width + _OFFSETS[:, 1])[None, :]
+    pos = np.minimum(np.searchsorted(cells, nkeys), len(cells) - 1)
+    neighbors = np.where(cells[pos] == nkeys, pos, -1)
+    eps2 = eps * eps
+
+    def members(cs):
+        return np.concatenate([np.arange(starts[c], ends[c]) for c in cs])
+
+    def sq_dist(a, b):
+        return (xs[a, None] - xs[b][None, :]) ** 2 + (ys[a, None] - ys[b][None, :]) ** 2
+
+    # 1) core points
+    core = np.repeat(counts >= min_samples, counts)
+    hood = np.where(neighbors >= 0, counts[np.maximum(neighbors, 0)], 0).sum(axis=1)
+    for c in np.flatnonzero((counts < min_samples) & (hood >= min_samples)):
+        own = np.arange(starts[c], ends[c])
+        near = members(neighbors[c][neighbors[c] >= 0])
+        core[own] = (sq_dist(own, near) <= eps2).sum(axis=1) >= min_samples
+
+    # 2) union-find over cells that hold core points
+    has_core = np.add.reduceat(core.astype(np.int64), starts) > 0
+    parent = np.arange(len(cells))
+
+    def find(c):
+        while parent[c] != c:
+            parent[c] = parent[parent[c]]
+            c = parent[c]
+        return c
+
+    core_idx = {c: np.arange(starts[c], ends[c])[core[starts[c]:ends[c]]] for c in np.flatnonzero(has_core)}
+    for c, own in core_idx.items():
+        for b in neighbors[c]:
+            if b <= c or not has_core[b]:
+                continue
+            ra, rb = find(c), find(b)
+            if ra != rb and (sq_dist(own, core_idx[b]) <= eps2).any():
+                parent[max(ra, rb)] = min(ra, rb)
+
+    roots = np.array([find(c) for c in range(len(cells))])
+    cell_of = np.repeat(np.arange(len(cells)), counts)
+    sorted_labels = np.where(core, roots[cell_of], -1)
+
+    # 3) border points -> 最近的 core 点所在的 cluster
+    for c in np.flatnonzero(counts > 0):
+        own = np.arange(starts[c], ends[c])
+        own = own[~core[own]]
+        nb = [b for b in neighbors[c] if b >= 0 and has_core[b]]
+        if len(own) == 0 or not nb:
+            continue
+        near = np.concatenate([core_idx[b] for b in nb])
+        d2 = sq_dist(own, near)
+        best = d2.argmin(axis=1)
+        hit = d2[np.arange(len(own)), best] <= eps2
+        sorted_labels[own[hit]] = sorted_labels[near[best[hit]]]
+
+    # root 下标 -> 0..k-1
+    clustered = sorted_labels >= 0
+    _, sorted_labels[clustered] = np.unique(sorted_labels[clustered], return_inverse=True)
+    labels[order] = sorted_labels
+    return labels
+
+
+def city_hotspots(city: str, state: str, lat: np.ndarray, lng: np.ndarray, severity: np.ndarray,
+                  eps: float = EPS_METERS, min_samples: int = MIN_SAMPLES) -> pd.DataFrame:
+    """
+    Cluster summaries for one city, largest first (cluster = 1, 2, ...):
+    Count, centroid lat / lng, bounding box, radius_m (90th percentile distance
+    to the centroid) and per-severity counts.
+    """
+    x, y = project(lat, lng)
+    labels = grid_dbscan(x, y, eps, min_samples)
+    keep = labels >= 0
+    if not keep.any():
+        return pd.DataFrame()
+
+    df = pd.DataFrame({
+        "label": labels[keep], "lat": lat[keep], "lng": lng[keep],
+        "x": x[keep], "y": y[keep], "Severity": severity[keep],
+    })
+    g = df.groupby("label")
+    out = g.agg(
+        Count=("lat", "size"), lat=("lat", "mean"), lng=("lng", "mean"),
+        min_lat=("lat", "min"), min_lng=("lng", "min"), max_lat=("lat", "max"), max_lng=("lng", "max"),
+    )
+    dist = np.hypot(df["x"] - g["x"].transform("mean"), df["y"] - g["y"].transform("mean"))
+    out["radius_m"] = dist.groupby(df["label"]).quantile(0.9)
+    sev = pd.crosstab(df["label"], df["Severity"]).reindex(columns=[4, 3, 2, 1], fill_value=0)
+    out[SEVERITY_COLUMNS] = sev.to_numpy()
+
+    out = out.sort_values("Count", ascending=False).head(MAX_CLUSTERS_PER_CITY).reset_index(drop=True)
+    out.insert(0, "cluster", np.arange(1, len(out) + 1))
+    out.insert(0, "State", state)
+    out.insert(0, "City", city)
+    return out
+
+
+def hotspots_of_city(points: pd.DataFrame) -> pd.DataFrame:
+    """
+    applyInPandas function: all points of one (City, State) -> its cluster
+    summaries in HOTSPOT_SCHEMA.
+
+    points: City, State, Severity, Start_Lat, Start_Lng
+    """
+    dtypes = {name: dtype for name, _, dtype in HOTSPOT_COLUMNS}
+    empty = pd.DataFrame({name: pd.Series(dtype=dtype) for name, dtype in dtypes.items()})
+    if points.empty:
+        return empty
+    out = city_hotspots(
+        points["City"].iloc[0],
+        points["State"].iloc[0],
+        points["Start_Lat"].to_numpy(np.float64),
+        points["Start_Lng"].to_numpy(np.float64),
+        points["Severity"].to_numpy(np.int64),
+    )
+    if out.empty:
+        return empty
+    return out[list(dtypes)].astype(dtypes)
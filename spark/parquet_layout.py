@@ -0,0 +1,146 @@
+"""
+Per-table Parquet layouts for the analytics outputs.
+
+Every table written by build_analytics_tables.py gets a layout (sort keys,
+row-group size, dictionary encoding, ZSTD level, optional partitioning) from
+TABLE_LAYOUTS, and each write is measured (bytes on storage + pandas read time,
+i.e. what the Streamlit loaders pay) so layouts can be compared.
+"""
+import time
+
+import pandas as pd
+
+DEFAULT_LAYOUT = {
+    "coalesce": 1,                        # 输出文件数（每个分区目录）；None 保持 Spark 的分区
+    "partition_by": None,                 # 例如 ["State"]：过滤读时只打开 State=XX/ 目录
+    "sort_by": None,                      # 文件内排序，让 row-group min/max 统计可用于裁剪
+    "row_group_bytes": 8 * 1024 * 1024,   # dashboard 表都很小，小 row group 让裁剪更细
+    "dictionary": True,
+    "compression": "zstd",
+    "zstd_level": 9,
+}
+
+# 没列出的表使用 DEFAULT_LAYOUT
+# 小的汇总表保持 builder 里 orderBy 的顺序（不设 sort_by），页面直接按这个顺序展示
+TABLE_LAYOUTS = {
+    "weather_severity_counts": {"zstd_level": 12},
+    "weather_conditions": {"sort_by": ["condition_code"]},
+    # 按 rank 排好，页面按 family_code / family_rank 过滤
+    "weather_condition_severity_counts": {"sort_by": ["family_code", "family_rank", "Severity"]},
+    "state_yearly_counts": {"sort_by": ["State", "year"]},
+    "top_states_by_quarter": {"sort_by": ["year", "quarter"]},
+    "state_year_severity_counts": {"partition_by": ["State"], "sort_by": ["year", "Severity"]},
+    "state_year_total_counts": {"partition_by": ["State"], "sort_by": ["year"]},
+    "temporal_matrix": {"sort_by": ["State", "year"]},
+    "daily_counts": {"sort_by": ["State", "Severity"]},
+    "county_severity_counts": {"sort_by": ["fips"]},
+    "county_year_severity_counts": {"sort_by": ["year", "fips"]},
+    "region_year_severity_counts": {"sort_by": ["region", "year"]},
+    # City 内按 sample_priority 排序：按城市过滤后的前 N 行就是确定性的抽样
+    "accident_points": {"sort_by": ["City", "sample_priority"]},
+    # 按分辨率分目录；cell_y 排序让 bbox 读取能按 row-group 统计裁剪
+    "grid_severity_year_counts": {"partition_by": ["res"], "sort_by": ["cell_y", "cell_x"]},
+    "hotspots": {"sort_by": ["City", "cluster"]},
+    "impact_histograms": {"sort_by": ["State", "year", "Severity"]},
+    "road_feature_counts": {"sort_by": ["State", "year", "Severity"]},
+    # 页面按 scope + State / City 过滤，每组 rank 连续
+    "street_rankings": {"sort_by": ["scope", "State", "City", "year", "rank"]},
+    "street_sketches": {"sort_by": ["scope", "State", "City", "year"]},
+}
+
+# LAYOUT_BENCHMARK 模式下，每张表额外对比的候选 layout（在该表自己的 layout 上覆盖）
+CANDIDATE_LAYOUTS = [
+    {"compression": "snappy", "dictionary": True},
+    {"compression": "zstd", "zstd_level": 3},
+    {"compression": "zstd", "zstd_level": 19},
+    {"dictionary": False},
+    {"row_group_bytes": 128 * 1024 * 1024},
+    {"partition_by": None},
+]
+
+
+def get_layout(name: str, **overrides) -> dict:
+    layout = {**DEFAULT_LAYOUT, **TABLE_LAYOUTS.get(name, {})}
+    layout.update(overrides)
+    return layout
+
+
+def describe_layout(layout: dict) -> str:
+    codec = layout["compression"]
+    if codec == "zstd":
+        codec = f"zstd-{layout['zstd_level']}"
+    parts = [codec, f"rg={layout['row_group_bytes'] // (1024 * 1024)}MB"]
+    if not layout["dictionary"]:
+        parts.append("no-dict")
+    if layout["sort_by"]:
+        parts.append("sort=" + ",".join(layout["sort_by"]))
+    if layout["partition_by"]:
+        parts.append("part=" + ",".join(layout["partition_by"]))
+    return " ".join(parts)
+
+
+def write_with_layout(df_out, out_path: str, layout: dict) -> str:
+    w = df_out
+    if layout["coalesce"]:
+        w = w.coalesce(layout["coalesce"])
+    if layout["sort_by"]:
+        w = w.sortWithinPartitions(*layout["sort_by"])
+
+    # parquet.* 选项会被 Spark 合并进写 Parquet 时的 Hadoop conf
+    writer = (
+        w.write.mode("overwrite")
+        .option("compression", layout["compression"])
+        .option("parquet.block.size", str(layout["row_group_bytes"]))
+        .option("parquet.enable.dictionary", str(layout["dictionary"]).lower())
+    )
+    if layout["compression"] == "zstd":
+        writer = writer.option("parquet.compression.codec.zstd.level", str(layout["zstd_level"]))
+    if layout["partition_by"]:
+        writer = writer.partitionBy(*layout["partition_by"])
+    writer.parquet(out_path)
+    return out_path
+
+
+def storage_size(spark, path: str):
+    """(bytes, file count) under `path`, via the Hadoop FileSystem Spark wrote with."""
+    jvm = spark._jvm
+    hpath = jvm.org.apache.hadoop.fs.Path(path)
+    fs = hpath.getFileSystem(spark._jsc.hadoopConfiguration())
+    summary = fs.getContentSummary(hpath)
+    return int(summary.getLength()), int(summary.getFileCount())
+
+
+def pandas_read_seconds(path: str, repeat: int = 3) -> float:
+    """Best-of-`repeat` pd.read_parquet time, the same call the Streamlit loaders make."""
+    # Streamlit 侧走 fsspec/s3fs，用 s3:// 而不是 s3a://
+    url = path.replace("s3a://", "s3://", 1)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pd.read_parquet(url)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def measure(spark, name: str, path: str, layout: dict) -> dict:
+    n_bytes, n_files = storage_size(spark, path)
+    return {
+        "table": name,
+        "layout": describe_layout(layout),
+        "bytes": n_bytes,
+        "files": n_files,
+        "read_s": round(pandas_read_seconds(path), 4),
+        "path": path,
+    }
+
+
+def benchmark_layouts(spark, df_out, name: str, scratch_prefix: str, candidates=None) -> pd.DataFrame:
+    """Write `df_out` once per candidate layout under `scratch_prefix` and report size / read time."""
+    rows = []
+    df_out = df_out.cache()
+    for i, overrides in enumerate(candidates or CANDIDATE_LAYOUTS):
+        layout = get_layout(name, **overrides)
+        path = write_with_layout(df_out, f"{scratch_prefix}/{name}/{i}", layout)
+        rows.append(measure(spark, name, path, layout))
+    df_out.unpersist()
+    return pd.DataFrame(rows).sort_values(["bytes", "read_s"])
@@ -0,0 +1,167 @@
+"""
+Point-in-polygon assignment of accidents to regions (county FIPS, ZIP, or any
+polygon set given as GeoJSON).
+
+PolygonIndex flattens every ring of every (Multi)Polygon into one edge array,
+sorted by polygon, and buckets polygon bounding boxes into a uniform lat / lng
+grid (GRID_DEG cells). `assign` then
+
+  1. looks up each point's grid cell -> candidate polygons (CSR arrays),
+  2. drops candidates whose bounding box does not contain the point,
+  3. ray casts (even-odd rule, so holes work) each polygon against all of its
+     remaining points at once, in chunks of at most MAX_PAIRS point x edge pairs.
+
+A point outside every polygon gets -1. The index is plain NumPy arrays, so it
+pickles cheaply into Spark's Python workers; build_analytics_tables.py runs
+`assign` per Arrow batch with mapInPandas.
+"""
+import json
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+GRID_DEG = 0.25
+MAX_PAIRS = 4_000_000
+
+# plotly 的美国县界，feature id 为 5 位 FIPS
+COUNTY_POLYGONS_URL = "https://raw.githubusercontent.com/plotly/datasets/master/geojson-counties-fips.json"
+
+
+def load_geojson(path_or_url: str) -> dict:
+    if path_or_url.startswith(("http://", "https://")):
+        with urllib.request.urlopen(path_or_url) as resp:
+            return json.load(resp)
+    with open(path_or_url) as f:
+        return json.load(f)
+
+
+def _rings(geometry: dict):
+    if geometry is None:
+        return []
+    if geometry["type"] == "Polygon":
+        return geometry["coordinates"]
+    if geometry["type"] == "MultiPolygon":
+        return [ring for polygon in geometry["coordinates"] for ring in polygon]
+    return []
+
+
+class PolygonIndex:
+    def __init__(self, geojson: dict, id_property: str = None, name_property: str = None):
+        """
+        id_property: feature property holding the region id (None = the feature `id`)
+        name_property: optional property kept as the region name
+        """
+        ids, names, edges, owner = [], [], [], []
+        for feature in geojson["features"]:
+            rings = [np.asarray(r, dtype=np.float64)[:, :2] for r in _rings(feature.get("geometry")) if len(r) >= 3]
+            if not rings:
+                continue
+            props = feature.get("properties") or {}
+            ids.append(str(feature.get("id") if id_property is None else props.get(id_property)))
+            names.append(props.get(name_property) if name_property else None)
+            for ring in rings:
+                # 首尾相连：最后一个点到第一个点也是一条边
+                edges.append(np.hstack([ring, np.roll(ring, -1, axis=0)]))
+                owner.append(np.full(len(ring), len(ids) - 1))
+
+        self.ids = np.asarray(ids, dtype=object)
+        self.names = np.asarray(names, dtype=object)
+        e = np.vstack(edges)
+        self.x0, self.y0, self.x1, self.y1 = e[:, 0], e[:, 1], e[:, 2], e[:, 3]
+        owner = np.concatenate(owner)
+        self.edge_start = np.searchsorted(owner, np.arange(len(ids) + 1))
+
+        # 每个多边形的 bbox 和顶点均值（作为 label 位置的近似质心）
+        self.min_x = np.minimum.reduceat(np.minimum(self.x0, self.x1), self.edge_start[:-1])
+        self.max_x = np.maximum.reduceat(np.maximum(self.x0, self.x1), self.edge_start[:-1])
+        self.min_y = np.minimum.reduceat(np.minimum(self.y0, self.y1), self.edge_start[:-1])
+        self.max_y = np.maximum.reduceat(np.maximum(self.y0, self.y1), self.edge_start[:-1])
+        counts = np.diff(self.edge_start)
+        self.center_x = np.add.reduceat(self.x0, self.edge_start[:-1]) / counts
+        self.center_y = np.add.reduceat(self.y0, self.edge_start[:-1]) / counts
+        self._build_grid()
+
+    def _build_grid(self):
+        self.grid_x0 = np.floor(self.min_x.min() / GRID_DEG) * GRID_DEG
+        self.grid_y0 = np.floor(self.min_y.min() / GRID_DEG) * GRID_DEG
+        self.nx = int((self.max_x.max() - self.grid_x0) // GRID_DEG) + 1
+        self.ny = int((self.max_y.max() - self.grid_y0) // GRID_DEG) + 1
+
+        cx0, cx1 = self._cell_x(self.min_x), self._cell_x(self.max_x)
+        cy0, cy1 = self._cell_y(self.min_y), self._cell_y(self.max_y)
+        cells, polys = [], []
+        for p in range(len(self.ids)):
+            gx, gy = np.meshgrid(np.arange(cx0[p], cx1[p] + 1), np.arange(cy0[p], cy1[p] + 1))
+            cells.append((gx * self.ny + gy).ravel())
+            polys.append(np.full(gx.size, p))
+        cells, polys = np.concatenate(cells), np.concatenate(polys)
+        order = np.argsort(cells, kind="stable")
+        # CSR：格子 c 的候选多边形是 cell_polys[cell_start[c]:cell_start[c + 1]]
+        self.cell_polys = polys[order]
+        self.cell_start = np.searchsorted(cells[order], np.arange(self.nx * self.ny + 1))
+
+    def _cell_x(self, x):
+        return np.floor((x - self.grid_x0) / GRID_DEG).astype(np.int64)
+
+    def _cell_y(self, y):
+        return np.floor((y - self.grid_y0) / GRID_DEG).astype(np.int64)
+
+    def _candidates(self, lng, lat):
+        """(point index, polygon index) pairs whose grid cell and bbox match."""
+        cx, cy = self._cell_x(lng), self._cell_y(lat)
+        ok = (cx >= 0) & (cx < self.nx) & (cy >= 0) & (cy < self.ny) & np.isfinite(lng) & np.isfinite(lat)
+        pts = np.flatnonzero(ok)
+        cell = cx[ok] * self.ny + cy[ok]
+        start, n = self.cell_start[cell], self.cell_start[cell + 1] - self.cell_start[cell]
+        pt = np.repeat(pts, n)
+        # 每个点展开成 start..start+n-1
+        offs = np.arange(len(pt)) - np.repeat(np.cumsum(n) - n, n)
+        poly = self.cell_polys[np.repeat(start, n) + offs]
+        inside = (
+            (lng[pt] >= self.min_x[poly]) & (lng[pt] <= self.max_x[poly])
+            & (lat[pt] >= self.min_y[poly]) & (lat[pt] <= self.max_y[poly])
+        )
+        return pt[inside], poly[inside]
+
+    def _contains(self, p: int, px: np.ndarray, py: np.ndarray) -> np.ndarray:
+        s, e = self.edge_start[p], self.edge_start[p + 1]
+        x0, y0, x1, y1 = self.x0[s:e], self.y0[s:e], self.x1[s:e], self.y1[s:e]
+        out = np.zeros(len(px), dtype=bool)
+        step = max(1, MAX_PAIRS // (e - s))
+        for i in range(0, len(px), step):
+            X, Y = px[i:i + step, None], py[i:i + step, None]
+            straddle = (y0 > Y) != (y1 > Y)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                x_cross = x0 + (Y - y0) * (x1 - x0) / (y1 - y0)
+            out[i:i + step] = ((straddle & (X < x_cross)).sum(axis=1) % 2) == 1
+        return out
+
+    def assign(self, lat, lng) -> np.ndarray:
+        """Polygon index (into `ids`) containing each point, -1 when none does."""
+        lat = np.asarray(lat, dtype=np.float64)
+        lng = np.asarray(lng, dtype=np.float64)
+        result = np.full(len(lat), -1, dtype=np.int64)
+        pt, poly = self._candidates(lng, lat)
+        if len(pt) == 0:
+            return result
+
+        order = np.argsort(poly, kind="stable")
+        pt, poly = pt[order], poly[order]
+        bounds = np.flatnonzero(np.r_[True, poly[1:] != poly[:-1], True])
+        for s, e in zip(bounds[:-1], bounds[1:]):
+            p, idx = poly[s], pt[s:e]
+            # 区域不重叠：已经命中的点不再测试
+            idx = idx[result[idx] < 0]
+            if len(idx):
+                result[idx[self._contains(p, lng[idx], lat[idx])]] = p
+        return result
+
+    def assign_ids(self, lat, lng) -> np.ndarray:
+        """Region id for each point (None outside every polygon)."""
+        idx = self.assign(lat, lng)
+        return np.where(idx >= 0, self.ids[np.maximum(idx, 0)], None)
+
+    def regions(self) -> pd.DataFrame:
+        """One row per polygon: region, name, lat / lng (vertex mean)."""
+        return pd.DataFrame({"region": self.ids, "name": self.names, "lat": self.center_y, "lng": self.center_x})
@@ -2,13 +2,10 @@ import streamlit as st
 import plotly.express as px
 import pandas as pd
 from constants import STATE_COORDINATES
+from table_store import load_table
+from cache_warmer import start_cache_warmer
 st.set_page_config(layout="wide")
-S3_BASE = "s3://us-accidents-dashboard-1445/processed"
-
-@st.cache_data(ttl=3600)
-def load_table(name: str) -> pd.DataFrame:
-    return pd.read_parquet(f"{S3_BASE}/{name}/")
-
+start_cache_warmer()
 
 @st.cache_data(ttl=3600)
 def build_state_yearly_data() -> pd.DataFrame:
@@ -0,0 +1,89 @@
+"""
+Background cache warmer.
+
+Started once per Streamlit server process (st.cache_resource) by the first script
+run. It loads every registered table and the default view of each page, then
+keeps refilling the *next* cache epoch shortly before the current one rolls over,
+so visitors never pay for S3 reads or aggregation.
+"""
+import threading
+import time
+
+import streamlit as st
+
+import views
+from spatial_grid import CONTIGUOUS_US_BBOX
+from table_store import CACHE_TTL_SECONDS, TABLES, current_epoch, open_point_index, prefetch_tables
+from tile_server import refresh_tiles
+from weather_groups import UNKNOWN_FAMILY
+
+# 提前多少秒开始预热下一个 epoch
+REFRESH_LEAD_SECONDS = 300
+RETRY_SECONDS = 60
+
+
+def warm_all(epoch: int):
+    """Load all tables and default page views into the cache bucket `epoch`."""
+    start = time.perf_counter()
+    prefetch_tables(TABLES, epoch=epoch)
+
+    # Regional / Severity: 全部年份 (2016-2023)
+    views.state_severity_totals(epoch=epoch)
+    cities = views.city_rank(epoch=epoch)
+    if not cities.empty:
+        views.city_points(cities["City"].iloc[0], epoch=epoch)
+    views.grid_cells(CONTIGUOUS_US_BBOX, 3.5, epoch=epoch)
+    views.street_ranking(epoch=epoch)
+    open_point_index(epoch)
+
+    # Severity: 面积图 + 默认 severity 的 LA 热力图
+    views.severity_by_yearquarter(epoch=epoch)
+    views.county_severity_totals(epoch=epoch)
+    views.la_severity_points("Critical", epoch=epoch)
+
+    # Temporal: All States
+    views.top_states_by_quarter(epoch=epoch)
+    views.temporal_matrix(epoch=epoch)
+    views.daily_counts(epoch=epoch)
+
+    # Weather: 默认选中全部已知 family，KDE 默认前 5 个 family
+    views.weather_condition_totals(epoch=epoch)
+    families = views.weather_families(epoch=epoch)
+    known = families.loc[families["family_code"] != UNKNOWN_FAMILY, "family_code"].astype(int).tolist()
+    views.weather_family_severity(known, epoch=epoch)
+    views.weather_top_conditions(known, 3, epoch=epoch)
+    views.weather_samples(views.weather_family_raw_conditions(known[:5], epoch=epoch), epoch=epoch)
+
+    # 矢量瓦片文件跟着数据一起刷新；取不到时 tile server 继续用旧文件
+    try:
+        refresh_tiles()
+    except OSError as e:
+        print(f"[cache_warmer] vector tiles not refreshed: {e!r}")
+
+    print(f"[cache_warmer] epoch {epoch} warmed in {time.perf_counter() - start:.1f}s")
+
+
+def _warm_loop():
+    epoch = current_epoch()
+    while True:
+        try:
+            warm_all(epoch)
+        except Exception as e:
+            print(f"[cache_warmer] warming epoch {epoch} failed: {e!r}")
+            time.sleep(RETRY_SECONDS)
+            epoch = max(epoch, current_epoch())
+            continue
+
+        # 等到换桶前 REFRESH_LEAD_SECONDS 再预热下一个 epoch
+        epoch += 1
+        wait = (epoch * CACHE_TTL_SECONDS - time.time()) - REFRESH_LEAD_SECONDS
+        if wait > 0:
+            time.sleep(wait)
+
+
+@st.cache_resource(show_spinner=False)
+def start_cache_warmer() -> threading.Thread:
+    """Start the warmer thread once per server process; later calls are no-ops."""
+    thread = threading.Thread(target=_warm_loop, name="cache-warmer", daemon=True)
+    thread.start()
+    return thread
@@ -58,6 +58,9 @@ US_STATES = {'AK': 'Alaska',
 
 us_states = US_STATES
 
+# Full name to state code mapping
+STATE_NAME_TO_CODE = {name: code for code, name in US_STATES.items()}
+
 
 # State coordinates for mapping
 state_coordinates = {
@@ -181,4 +184,7 @@ all_states = [
     "Wisconsin", "Wyoming"
 ]
 
-ALL_STATES = all_states
\ No newline at end of file
+ALL_STATES = all_states
+
+# 道路设施标记：builder 把它们按这个顺序打包成 flags 的第 0..7 位
+ROAD_FEATURES = ['Bump', 'Crossing', 'Give_Way', 'Junction', 'Stop', 'No_Exit', 'Traffic_Signal', 'Turning_Loop']
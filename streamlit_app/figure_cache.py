@@ -0,0 +1,103 @@
+"""
+Process-wide cache of Plotly figures, stored as plain figure dicts.
+
+Every widget interaction reruns the whole page script; `cached_figure` lets a
+page skip rebuilding figures whose inputs did not change. Entries are keyed by
+page, builder and the exact builder arguments (plus the table_store cache
+epoch, so refreshed data rebuilds figures), and evicted least-recently-used
+once the cached figures exceed MAX_CACHE_BYTES of JSON.
+
+Builders must therefore be pure functions of their arguments: they may read
+epoch-cached views and constants, but not page globals or session state,
+which are not part of the key.
+"""
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import plotly.graph_objects as go
+
+from table_store import current_epoch
+
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # key -> (figure dict, JSON size in bytes)
+_total_bytes = 0
+
+# 命中率统计（load test 会读取）
+STATS = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _update_digest(h, obj):
+    if isinstance(obj, pd.DataFrame):
+        h.update(repr(list(obj.columns)).encode())
+        h.update(pd.util.hash_pandas_object(obj, index=True).values.tobytes())
+    elif isinstance(obj, pd.Series):
+        h.update(pd.util.hash_pandas_object(obj, index=True).values.tobytes())
+    elif isinstance(obj, (list, tuple)):
+        h.update(b"[")
+        for item in obj:
+            _update_digest(h, item)
+            h.update(b",")
+        h.update(b"]")
+    elif isinstance(obj, dict):
+        _update_digest(h, sorted(obj.items()))
+    else:
+        h.update(repr(obj).encode())
+
+
+def figure_key(page: str, builder, args=(), kwargs=None) -> str:
+    h = hashlib.sha1()
+    _update_digest(h, [page, builder.__module__, builder.__qualname__, current_epoch(), args, kwargs or {}])
+    return h.hexdigest()
+
+
+def _put(key: str, fig_dict: dict, size: int):
+    global _total_bytes
+    with _lock:
+        if key in _entries:
+            _total_bytes -= _entries.pop(key)[1]
+        _entries[key] = (fig_dict, size)
+        _total_bytes += size
+        while _total_bytes > MAX_CACHE_BYTES and len(_entries) > 1:
+            _, (_, old_size) = _entries.popitem(last=False)
+            _total_bytes -= old_size
+            STATS["evictions"] += 1
+
+
+def _from_dict(fig_dict: dict) -> go.Figure:
+    # dict 来自一个已经校验过的 Figure：跳过逐属性校验（pio.from_json 的主要开销），
+    # 深拷贝保证调用方修改返回的 figure 不会改到缓存
+    return go.Figure(copy.deepcopy(fig_dict), skip_invalid=True, _validate=False)
+
+
+def cached_figure(page: str, builder, *args, **kwargs):
+    """
+    Return builder(*args, **kwargs), rebuilding it only when the (page, builder,
+    arguments) key is not cached. DataFrame arguments are keyed by content.
+    `builder` must be a pure function of its arguments (see module docstring).
+    Builders returning None are not cached.
+    """
+    key = figure_key(page, builder, args, kwargs)
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            _entries.move_to_end(key)
+            STATS["hits"] += 1
+    if entry is not None:
+        return _from_dict(entry[0])
+
+    with _lock:
+        STATS["misses"] += 1
+    fig = builder(*args, **kwargs)
+    if fig is not None:
+        _put(key, fig.to_dict(), len(fig.to_json()))
+    return fig
+
+
+def cache_info() -> dict:
+    with _lock:
+        return {**STATS, "entries": len(_entries), "bytes": _total_bytes}
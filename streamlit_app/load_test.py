@@ -0,0 +1,298 @@
+"""
+Headless concurrent-session load test for the dashboard pages.
+
+Every simulated session is a streamlit.testing AppTest driven by its own
+thread: it opens a page, then replays that page's SCENARIOS steps (pick a
+widget by kind + label, set a value, rerun) for a number of iterations. All
+sessions live in this one process and share the table_store / views /
+figure_cache caches, i.e. they model the sessions of a single server worker.
+
+Reported at the end:
+  - rerun latency p50 / p90 / p99 / max per page and step, plus errors
+  - process RSS before / after the sessions and the growth per open session
+  - cache hit rates: figure_cache.STATS and table_store.LOAD_STATS, the
+    slowest table loads (table_store.LOAD_TIMINGS) and the per-section times
+    from rerun_stats
+
+Run it from this directory against a local copy of the processed tables
+(e.g. `aws s3 sync s3://us-accidents-dashboard-1445/processed ./processed`):
+
+    ACCIDENTS_DATA_BASE=../processed python load_test.py --sessions 50 --concurrency 10
+
+Widget interactions inside an st.fragment rerun the whole script under
+AppTest, so latencies are full-page reruns (an upper bound for fragments).
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+import numpy as np
+import pandas as pd
+
+# 在导入页面模块之前打开 section 计时
+os.environ.setdefault("DASHBOARD_RERUN_STATS", "1")
+
+from streamlit import config, runtime  # noqa: E402
+from streamlit.components.lib.local_component_registry import LocalComponentRegistry  # noqa: E402
+from streamlit.components.v1 import component_registry  # noqa: E402
+from streamlit.runtime import Runtime  # noqa: E402
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager  # noqa: E402
+from streamlit.runtime.media_file_manager import MediaFileManager  # noqa: E402
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+import figure_cache  # noqa: E402
+import rerun_stats  # noqa: E402
+import table_store  # noqa: E402
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# page -> (script, steps)；step = (widget kind, label, 候选值)，候选值为 None 时从 widget 的 options 里随机选
+# 带 format_func 的 widget（options 显示的是格式化后的文字）必须给出原始候选值
+SCENARIOS = {
+    "home": ("Project_Introduction.py", []),
+    "severity": ("pages/1_Severity_Analysis.py", [
+        ("selectbox", "# Select Severity Level", None),
+        ("selectbox", "Select Weather Condition", None),
+        ("radio", "Measure", None),
+        ("selectbox", "State", ["All States", "California", "Texas", "Florida", "New York"]),
+        ("selectbox", "Region A", ["California", "Texas", "Florida", "Ohio"]),
+        ("selectbox", "Severity", None),
+    ]),
+    "regional": ("pages/2_Regional_Analysis.py", [
+        ("selectbox", "Select a city to display heatmap:", None),
+        ("checkbox", "Show hotspot clusters", None),
+        ("selectbox", "Focus", None),
+        ("multiselect", "Severity", None),
+        ("radio", "Scope", None),
+        ("selectbox", "State", ["CA", "TX", "FL", "NY", "PA"]),
+        ("selectbox", "Year", None),
+        ("selectbox", "Location", None),
+        ("slider", "Radius (miles)", [0.5, 1.0, 2.0, 5.0]),
+    ]),
+    "temporal": ("pages/3_Temporal_Analysis.py", [
+        ("selectbox", "Select State", None),
+        ("selectbox", "Granularity", None),
+        ("checkbox", "Moving average", None),
+    ]),
+    "weather": ("pages/4_Weather_Impact.py", [
+        ("multiselect", "Weather Families", [[1, 2, 6], [6, 7, 8, 9], [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12]]),
+        ("slider", "Conditions per family", [1, 3, 5, 10]),
+        ("multiselect", "Select Weather Families", [[-1], [1, 6], [7, 8, 9], [3]]),
+    ]),
+}
+PERCENTILES = [50, 90, 99]
+
+
+def share_runtime():
+    """
+    AppTest installs a fresh mock Runtime for every run and clears it when the
+    run ends, which breaks other sessions running at the same time. Point
+    streamlit.runtime at one shared mock instead (one cache storage manager,
+    as in a real server process).
+    """
+    shared = MagicMock(spec=Runtime)
+    shared.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    shared.cache_storage_manager = MemoryCacheStorageManager()
+    shared.component_registry = LocalComponentRegistry()
+    runtime.get_instance = lambda: shared
+    runtime.exists = lambda: True
+    component_registry.get_instance = lambda: shared
+    Runtime._instance = shared
+    # AppTest 只在每次 run 期间临时打开这个选项，多线程下会互相还原
+    config.set_option("global.appTest", True)
+
+
+def rss_bytes() -> int:
+    """Current resident set size (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def apply_step(at: AppTest, step, rng: random.Random) -> bool:
+    """Set one widget of the current page; False when it is not on the page right now."""
+    kind, label, values = step
+    widget = next((w for w in getattr(at, kind) if w.label == label), None)
+    if widget is None or getattr(widget.proto, "disabled", False):
+        return False
+    if values:
+        value = rng.choice(values)
+    elif kind == "checkbox":
+        value = not widget.value
+    elif kind == "multiselect":
+        value = rng.sample(widget.options, rng.randint(1, min(3, len(widget.options))))
+    elif widget.options:
+        value = rng.choice(widget.options)
+    else:
+        return False
+    widget.set_value(value)
+    return True
+
+
+def run_session(page: str, session_id: int, iterations: int, timeout: float, think_s: float, seed: int):
+    """Open `page` and replay its steps; returns (AppTest, [timing records])."""
+    script, steps = SCENARIOS[page]
+    rng = random.Random(seed * 100_003 + session_id)
+    at = AppTest.from_file(os.path.join(APP_DIR, script), default_timeout=timeout)
+    records = []
+
+    def rerun(step_label):
+        start = time.perf_counter()
+        error = None
+        try:
+            at.run()
+            if len(at.exception):
+                error = at.exception[0].value
+        except Exception as e:  # 超时等：记为错误，session 继续
+            error = repr(e)
+        records.append({
+            "page": page, "session": session_id, "step": step_label,
+            "ms": (time.perf_counter() - start) * 1000, "error": error,
+        })
+
+    rerun("open")
+    for _ in range(iterations):
+        for step in steps:
+            if not apply_step(at, step, rng):
+                continue
+            rerun(f"{step[0]}: {step[1]}")
+            if think_s:
+                time.sleep(rng.uniform(0, 2 * think_s))
+    return at, records
+
+
+def latency_table(records: pd.DataFrame) -> pd.DataFrame:
+    g = records.groupby(["page", "step"], sort=False)["ms"]
+    out = g.agg(runs="size", max_ms="max")
+    for p in PERCENTILES:
+        out[f"p{p}_ms"] = g.quantile(p / 100)
+    out["errors"] = records["error"].notna().groupby([records["page"], records["step"]], sort=False).sum()
+    return out[["runs"] + [f"p{p}_ms" for p in PERCENTILES] + ["max_ms", "errors"]].round(1).reset_index()
+
+
+def hit_rate(hits: int, total: int):
+    return round(hits / total * 100, 1) if total else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--sessions", type=int, default=20, help="total sessions, spread over the pages")
+    parser.add_argument("--concurrency", type=int, default=10, help="sessions running at the same time")
+    parser.add_argument("--iterations", type=int, default=3, help="passes over each page's steps per session")
+    parser.add_argument("--think", type=float, default=0.0, help="mean pause between interactions (seconds)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-rerun timeout (seconds)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-warmup", action="store_true", help="measure a cold worker (no sequential first run)")
+    parser.add_argument("--json", help="also write the raw timing records and summary to this file")
+    args = parser.parse_args(argv)
+
+    share_runtime()
+    print(f"data: {table_store.S3_BASE}")
+
+    # 预热：每个页面先顺序跑一次（import、组件注册、表加载），之后测的是热 worker
+    if not args.no_warmup:
+        for page in args.pages:
+            start = time.perf_counter()
+            _, rec = run_session(page, -1, 0, args.timeout, 0.0, args.seed)
+            status = "ok" if rec[0]["error"] is None else f"error: {rec[0]['error']}"
+            print(f"warm-up {page}: {time.perf_counter() - start:.1f}s ({status})")
+
+    figure_before = figure_cache.cache_info()
+    loads_before = table_store.load_stats()
+    rss_before = rss_bytes()
+    peak_rss = [rss_before]
+    done = threading.Event()
+
+    def sample_rss():
+        while not done.wait(0.5):
+            peak_rss[0] = max(peak_rss[0], rss_bytes())
+
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+
+    jobs = [(args.pages[i % len(args.pages)], i) for i in range(args.sessions)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [
+            pool.submit(run_session, page, i, args.iterations, args.timeout, args.think, args.seed)
+            for page, i in jobs
+        ]
+        # AppTest 对象（含各自的 session_state）保留到最后，RSS 才包含所有打开的 session
+        sessions = [f.result() for f in futures]
+    wall_s = time.perf_counter() - start
+    rss_after = rss_bytes()
+    done.set()
+
+    records = pd.DataFrame([r for _, rec in sessions for r in rec])
+    figure_after = figure_cache.cache_info()
+    loads_after = table_store.load_stats()
+    fig_hits = figure_after["hits"] - figure_before["hits"]
+    fig_total = fig_hits + figure_after["misses"] - figure_before["misses"]
+    load_calls = loads_after["calls"] - loads_before["calls"]
+    load_misses = loads_after["misses"] - loads_before["misses"]
+
+    summary = {
+        "sessions": args.sessions,
+        "concurrency": args.concurrency,
+        "reruns": int(len(records)),
+        "errors": int(records["error"].notna().sum()),
+        "wall_s": round(wall_s, 1),
+        "reruns_per_s": round(len(records) / wall_s, 2) if wall_s else None,
+        "latency_ms": {f"p{p}": round(float(np.percentile(records["ms"], p)), 1) for p in PERCENTILES},
+        "rss_before_mb": round(rss_before / 2**20, 1),
+        "rss_after_mb": round(rss_after / 2**20, 1),
+        "rss_peak_mb": round(max(peak_rss[0], rss_after) / 2**20, 1),
+        "rss_per_session_mb": round((rss_after - rss_before) / 2**20 / max(args.sessions, 1), 2),
+        "figure_cache_hit_pct": hit_rate(fig_hits, fig_total),
+        "figure_cache": figure_after,
+        "table_cache_hit_pct": hit_rate(load_calls - load_misses, load_calls),
+        "table_loads": {"calls": load_calls, "misses": load_misses},
+    }
+
+    pd.set_option("display.width", 200)
+    print("\n=== rerun latency ===")
+    print(latency_table(records).to_string(index=False))
+    print("\n=== summary ===")
+    for k, v in summary.items():
+        print(f"{k:>22}: {v}")
+
+    timings = sorted(table_store.get_load_timings().items(), key=lambda kv: kv[1], reverse=True)[:10]
+    print("\n=== slowest table loads (s) ===")
+    for name, secs in timings:
+        print(f"{name:>40}: {secs:.3f}")
+
+    sections = [
+        {"page": p, "section": s, "runs": v["runs"], "avg_ms": round(v["total_s"] / v["runs"] * 1000, 1),
+         "last_kb": round(v["last_bytes"] / 1024, 1)}
+        for (p, s), v in rerun_stats.get_stats().items() if v["runs"]
+    ]
+    if sections:
+        print("\n=== page sections ===")
+        print(pd.DataFrame(sections).sort_values(["page", "avg_ms"], ascending=[True, False]).to_string(index=False))
+
+    errors = records[records["error"].notna()]
+    if not errors.empty:
+        print("\n=== first errors ===")
+        for _, r in errors.drop_duplicates("error").head(5).iterrows():
+            print(f"[{r['page']} / {r['step']}] {r['error']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"summary": summary, "records": records.to_dict("records")}, f, indent=2, default=str)
+    return 0 if summary["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
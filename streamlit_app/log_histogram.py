@@ -0,0 +1,66 @@
+"""
+Fixed log-spaced histograms used as mergeable quantile sketches.
+
+`LogBins(lo, hi, n)` has n bins: bin 0 is [0, lo), bins 1..n-2 split [lo, hi)
+geometrically (constant ratio, so every bin has the same relative width) and
+bin n-1 is [hi, inf). Because the edges are fixed, histograms of any two
+groups merge by adding their count arrays, and a quantile read from the
+merged counts is off by at most one bin ratio (relative error, like DDSketch).
+
+The builder computes the bin index in Spark with the same formula as
+`index`; the pages sum count arrays and read quantiles.
+
+Only depends on numpy.
+"""
+import math
+
+import numpy as np
+
+
+class LogBins:
+    def __init__(self, lo: float, hi: float, n: int):
+        self.lo, self.hi, self.n = lo, hi, n
+        self.ratio = (hi / lo) ** (1.0 / (n - 2))
+
+    @property
+    def edges(self) -> np.ndarray:
+        """n + 1 edges: 0, lo, lo * ratio, ..., hi, inf."""
+        return np.r_[0.0, self.lo * self.ratio ** np.arange(self.n - 1), np.inf]
+
+    def index(self, values) -> np.ndarray:
+        v = np.asarray(values, dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            i = np.floor(np.log(v / self.lo) / math.log(self.ratio)).astype(np.int64) + 1
+        return np.where(v < self.lo, 0, np.minimum(i, self.n - 1))
+
+    def quantiles(self, counts, qs) -> np.ndarray:
+        """Approximate quantiles `qs` (0..1) of a count array (geometric interpolation inside a bin)."""
+        counts = np.asarray(counts, dtype=np.float64)
+        total = counts.sum()
+        if total == 0:
+            return np.full(len(qs), np.nan)
+        cum = np.cumsum(counts)
+        edges = self.edges
+        out = []
+        for q in qs:
+            b = int(np.searchsorted(cum, q * total, side="left"))
+            b = min(b, self.n - 1)
+            before = cum[b] - counts[b]
+            frac = (q * total - before) / counts[b] if counts[b] else 0.0
+            lo, hi = edges[b], edges[b + 1]
+            if b == 0:
+                out.append(lo + frac * (hi - lo))
+            elif b == self.n - 1:
+                out.append(lo)
+            else:
+                out.append(lo * (hi / lo) ** frac)
+        return np.array(out)
+
+    def labels(self, fmt="{:.3g}") -> list:
+        e = self.edges
+        return [f"<{fmt.format(e[1])}"] + [f"{fmt.format(a)}–{fmt.format(b)}" for a, b in zip(e[1:-2], e[2:-1])] + [f"≥{fmt.format(e[-2])}"]
+
+
+# 持续时间（分钟）：1 分钟到 30 天；影响距离（英里）：0.01 到 100 英里
+DURATION_BINS = LogBins(1.0, 43200.0, 48)
+DISTANCE_BINS = LogBins(0.01, 100.0, 40)
@@ -7,321 +7,654 @@ from streamlit_folium import st_folium
 from folium.plugins import HeatMap
 from constants import US_CITIES_COORDS, US_STATES
 from data_processing import create_geojson_data
+from table_store import load_table, prefetch_tables
+from views import (
+    SEVERITY_ORDER, accidents_near, city_hotspots, city_points, city_rank, grid_cells, search_accidents,
+    route_risk, route_risk_batch, state_severity_totals, street_ranking, street_ranking_cities,
+)
+from spatial_grid import CONTIGUOUS_US_BBOX, bbox_around, cell_size, zoom_to_res
+from cache_warmer import start_cache_warmer
+from tile_server import start_tile_server, tile_url_template
+from vector_tiles import LAYER_NAME, MIN_ZOOM
+from figure_cache import cached_figure
+from rerun_stats import chart, timed_page, timed_section
 st.set_page_config(layout="wide")
+with timed_page("regional"):
 
-S3_BASE = "s3://us-accidents-dashboard-1445/processed"
+    start_cache_warmer()
+    tile_server = start_tile_server()
 
-@st.cache_data(ttl=3600)
-def load_table(name: str):
-    return pd.read_parquet(f"{S3_BASE}/{name}/")
+    # 页面用到的表并发预取，后面的 load_table 全部命中缓存
+    prefetch_tables(["state_yearly_summary", "city_year_counts_top200"])
 
-CARD_HEIGHT = 520  
-PLOT_HEIGHT = 400
+    CARD_HEIGHT = 520  
+    PLOT_HEIGHT = 400
 
-st.title("Location Analysis")
-# st.write("""
-#          In this dataset, we have different attributes like City, State, Timezone
-#          and even street for each accident records. Here we will analyze these four
-#          features based on the no. of cases for each distinct location.
-#          """)
+    st.title("Location Analysis")
+    # st.write("""
+    #          In this dataset, we have different attributes like City, State, Timezone
+    #          and even street for each accident records. Here we will analyze these four
+    #          features based on the no. of cases for each distinct location.
+    #          """)
 
 
-st.sidebar.title("Select Filters")
-state_yearly = load_table("state_yearly_summary").copy()
-years = sorted(state_yearly["Year"].unique().tolist())
-years_label = ["2016-2023"] + [str(y) for y in years]
-def normalize_year_selection(selected_years, all_years):
-    """
+    st.sidebar.title("Select Filters")
+    state_yearly = load_table("state_yearly_summary").copy()
+    years = sorted(state_yearly["Year"].unique().tolist())
+    years_label = ["2016-2023"] + [str(y) for y in years]
+    def normalize_year_selection(selected_years, all_years):
+        """
     selected_years: list like ['2016-2023'] or ['2019','2020'] or []
     all_years: list[int] like [2016,2017,...,2023]
     returns:
       year_filter: list[int]
       year_label: str
     """
-    # empty -> fallback
-    if not selected_years:
-        selected_years = ["2016-2023"]
-
-    if "2016-2023" in selected_years:
-        return all_years, "2016–2023"
+        # empty -> fallback
+        if not selected_years:
+            selected_years = ["2016-2023"]
 
-    # selected_years are strings or ints depending on your options; normalize to int
-    years_int = sorted([int(y) for y in selected_years])
-    if len(years_int) == 1:
-        return years_int, str(years_int[0])
+        if "2016-2023" in selected_years:
+            return all_years, "2016–2023"
 
-    return years_int, f"{years_int[0]}–{years_int[-1]}"
+        # selected_years are strings or ints depending on your options; normalize to int
+        years_int = sorted([int(y) for y in selected_years])
+        if len(years_int) == 1:
+            return years_int, str(years_int[0])
 
-all_years = sorted(state_yearly["Year"].unique().tolist())  # 或其它来源
-selected_years = st.sidebar.multiselect("Select Year", years_label, default=[years_label[0]])
+        return years_int, f"{years_int[0]}–{years_int[-1]}"
 
-year_filter, year_label = normalize_year_selection(selected_years, all_years)
+    all_years = sorted(state_yearly["Year"].unique().tolist())  # 或其它来源
+    selected_years = st.sidebar.multiselect("Select Year", years_label, default=[years_label[0]])
 
+    year_filter, year_label = normalize_year_selection(selected_years, all_years)
+    # 全部年份时用 None 作为缓存 key，与 cache warmer 预热的默认视图一致
+    view_years = None if year_filter == all_years else year_filter
 
-col1, col2 = st.columns([1,1])
 
-# Get processed state data
-df = state_yearly[state_yearly["Year"].isin(year_filter)].copy()
+    col1, col2 = st.columns([1,1])
 
-# 聚合多年份：总数相加
-agg = (
-    df.groupby("State_Code", as_index=False)[["Accident_Count","Low","Medium","High","Critical"]]
-      .sum()
-)
-
-# 州名（你说你希望用 full name）
-agg["State"] = agg["State_Code"].map(US_STATES)
+    # 聚合多年份：总数相加（含州名）
+    agg = state_severity_totals(view_years)
 
-top10 = agg.sort_values("Accident_Count", ascending=False).head(10).copy()
+    top10 = agg.sort_values("Accident_Count", ascending=False).head(10).copy()
 
-top10["Tooltip"] = (
-    "State: " + top10["State"].astype(str) + "<br>"
-    "Years: " + ("All" if "2016-2023" in selected_years else ", ".join(map(str, year_filter))) + "<br>"
-    "Total: " + top10["Accident_Count"].astype(int).map(lambda x: f"{x:,}") + "<br>"
-    "Critical: " + top10["Critical"].astype(int).map(lambda x: f"{x:,}") + "<br>"
-    "High: " + top10["High"].astype(int).map(lambda x: f"{x:,}") + "<br>"
-    "Medium: " + top10["Medium"].astype(int).map(lambda x: f"{x:,}") + "<br>"
-    "Low: " + top10["Low"].astype(int).map(lambda x: f"{x:,}")
-)
+    top10["Tooltip"] = (
+        "State: " + top10["State"].astype(str) + "<br>"
+        "Years: " + ("All" if "2016-2023" in selected_years else ", ".join(map(str, year_filter))) + "<br>"
+        "Total: " + top10["Accident_Count"].astype(int).map(lambda x: f"{x:,}") + "<br>"
+        "Critical: " + top10["Critical"].astype(int).map(lambda x: f"{x:,}") + "<br>"
+        "High: " + top10["High"].astype(int).map(lambda x: f"{x:,}") + "<br>"
+        "Medium: " + top10["Medium"].astype(int).map(lambda x: f"{x:,}") + "<br>"
+        "Low: " + top10["Low"].astype(int).map(lambda x: f"{x:,}")
+    )
 
-long = top10.melt(
-    id_vars=["State","Accident_Count","Tooltip"],
-    value_vars=["Critical","High","Medium","Low"],
-    var_name="Severity",
-    value_name="Severity_Count",
-)
+    long = top10.melt(
+        id_vars=["State","Accident_Count","Tooltip"],
+        value_vars=["Critical","High","Medium","Low"],
+        var_name="Severity",
+        value_name="Severity_Count",
+    )
 
-state_order = top10.sort_values("Accident_Count", ascending=False)["State"].tolist()
-
-# Create state bar chart
-top10_bar = px.bar(
-    long,
-    y="State",
-    x="Severity_Count",
-    color="Severity",
-    orientation="h",
-    custom_data=["Tooltip"],
-    hover_data={"Tooltip": True},
-    category_orders={"State": state_order, "Severity": ["Critical","High","Medium","Low"]},
-    color_discrete_map={
-        "Critical": "#FF5733",
-        "High": "#FF8C00",
-        "Medium": "#FFD700",
-        "Low": "#28A745"
-    },
-)
+    state_order = top10.sort_values("Accident_Count", ascending=False)["State"].tolist()
+
+    # Create state bar chart
+    top10_bar = px.bar(
+        long,
+        y="State",
+        x="Severity_Count",
+        color="Severity",
+        orientation="h",
+        custom_data=["Tooltip"],
+        hover_data={"Tooltip": True},
+        category_orders={"State": state_order, "Severity": ["Critical","High","Medium","Low"]},
+        color_discrete_map={
+            "Critical": "#FF5733",
+            "High": "#FF8C00",
+            "Medium": "#FFD700",
+            "Low": "#28A745"
+        },
+    )
 
-top10_bar.for_each_trace(lambda t: t.update(hovertemplate="%{customdata[0]}<extra></extra>"))
-top10_bar.update_layout(barmode="stack", height=PLOT_HEIGHT)
+    top10_bar.for_each_trace(lambda t: t.update(hovertemplate="%{customdata[0]}<extra></extra>"))
+    top10_bar.update_layout(barmode="stack", height=PLOT_HEIGHT)
 
 
-top10_bar.for_each_trace(
-    lambda trace: trace.update(
-        hovertemplate="%{customdata[0]}<extra></extra>"  # Use Tooltip column and remove default hover info
+    top10_bar.for_each_trace(
+        lambda trace: trace.update(
+            hovertemplate="%{customdata[0]}<extra></extra>"  # Use Tooltip column and remove default hover info
+        )
     )
-)
 
-top10_bar.update_layout(
-    yaxis_title="State",
-    xaxis_title="Accident Count",
-    barmode="stack",
-    height = 400,
-    margin={"r": 0, "t": 50, "l": 0, "b": 50},  # Adjust margins for better fit
-    legend=dict(
-        yanchor="top",
-        y=0.33,
-        xanchor="right",
-        x=0.9
+    top10_bar.update_layout(
+        yaxis_title="State",
+        xaxis_title="Accident Count",
+        barmode="stack",
+        height = 400,
+        margin={"r": 0, "t": 50, "l": 0, "b": 50},  # Adjust margins for better fit
+        legend=dict(
+            yanchor="top",
+            y=0.33,
+            xanchor="right",
+            x=0.9
+        )
     )
-)
 
-# Get state yearly data
-state_map_df = agg[["State","Accident_Count","Low","Medium","High","Critical"]].copy()
+    # Get state yearly data
+    state_map_df = agg[["State","Accident_Count","Low","Medium","High","Critical"]].copy()
 
-state_map_df["tooltip"] = (
-    "Total: " + state_map_df["Accident_Count"].astype(int).map(lambda x: f"{x:,}") + "<br>"
-    "Critical: " + state_map_df["Critical"].astype(int).map(lambda x: f"{x:,}") + "<br>"
-    "High: " + state_map_df["High"].astype(int).map(lambda x: f"{x:,}") + "<br>"
-    "Medium: " + state_map_df["Medium"].astype(int).map(lambda x: f"{x:,}") + "<br>"
-    "Low: " + state_map_df["Low"].astype(int).map(lambda x: f"{x:,}")
-)
+    state_map_df["tooltip"] = (
+        "Total: " + state_map_df["Accident_Count"].astype(int).map(lambda x: f"{x:,}") + "<br>"
+        "Critical: " + state_map_df["Critical"].astype(int).map(lambda x: f"{x:,}") + "<br>"
+        "High: " + state_map_df["High"].astype(int).map(lambda x: f"{x:,}") + "<br>"
+        "Medium: " + state_map_df["Medium"].astype(int).map(lambda x: f"{x:,}") + "<br>"
+        "Low: " + state_map_df["Low"].astype(int).map(lambda x: f"{x:,}")
+    )
 
-# Process GeoJSON data
-geojson_file = "https://raw.githubusercontent.com/PublicaMundi/MappingAPI/master/data/geojson/us-states.json"
-geojson_data = requests.get(geojson_file).json()
-geojson_data = create_geojson_data(state_map_df, geojson_data)
-
-# Create map
-m = folium.Map(location=[37.0902, -95.7129], zoom_start=4, tiles="cartodbpositron")
-
-# Merge the DataFrame into the GeoJSON
-for feature in geojson_data["features"]:
-    state_name = feature["properties"]["name"]  # GeoJSON state name
-    # Match state name and add Accident_Count and tooltip data
-    match = state_map_df[state_map_df["State"] == state_name]
-
-    if not match.empty:
-        feature["properties"]["Accident_Count"] = int(match["Accident_Count"].iloc[0])
-        feature["properties"]["tooltip"] = match["tooltip"].values[0]
-    else:
-        feature["properties"]["Accident_Count"] = 0
-        feature["properties"]["tooltip"] = "No data available"
-
-folium.Choropleth(
-    geo_data=geojson_data,  # GeoJSON data for US states
-    data=state_map_df,  # Changed from adjusted_data to state_map_df
-    columns=["State", "Accident_Count"],
-    key_on="feature.properties.name",
-    fill_opacity=0.7,
-    line_opacity=0.2,
-    fill_color="viridis",
-    legend_name="Accident Count by State"
-).add_to(m)
-
-
-tooltip = folium.GeoJsonTooltip(
-    fields=["name", "tooltip"],
-    aliases=["State:", "Severity:"],
-    localize=True,
-    sticky=True,
-    labels=False,
-    style="""
+    # Process GeoJSON data
+    geojson_file = "https://raw.githubusercontent.com/PublicaMundi/MappingAPI/master/data/geojson/us-states.json"
+    geojson_data = requests.get(geojson_file).json()
+    geojson_data = create_geojson_data(state_map_df, geojson_data)
+
+    # Create map
+    m = folium.Map(location=[37.0902, -95.7129], zoom_start=4, tiles="cartodbpositron")
+
+    # Merge the DataFrame into the GeoJSON
+    for feature in geojson_data["features"]:
+        state_name = feature["properties"]["name"]  # GeoJSON state name
+        # Match state name and add Accident_Count and tooltip data
+        match = state_map_df[state_map_df["State"] == state_name]
+
+        if not match.empty:
+            feature["properties"]["Accident_Count"] = int(match["Accident_Count"].iloc[0])
+            feature["properties"]["tooltip"] = match["tooltip"].values[0]
+        else:
+            feature["properties"]["Accident_Count"] = 0
+            feature["properties"]["tooltip"] = "No data available"
+
+    folium.Choropleth(
+        geo_data=geojson_data,  # GeoJSON data for US states
+        data=state_map_df,  # Changed from adjusted_data to state_map_df
+        columns=["State", "Accident_Count"],
+        key_on="feature.properties.name",
+        fill_opacity=0.7,
+        line_opacity=0.2,
+        fill_color="viridis",
+        legend_name="Accident Count by State"
+    ).add_to(m)
+
+
+    tooltip = folium.GeoJsonTooltip(
+        fields=["name", "tooltip"],
+        aliases=["State:", "Severity:"],
+        localize=True,
+        sticky=True,
+        labels=False,
+        style="""
         background-color: #F0EFEF;
         border: 2px solid black;
         border-radius: 3px;
         box-shadow: 3px;
     """,
-    max_width=800,
-)
-
-
-folium.GeoJson(
-    geojson_data,
-    tooltip=tooltip
-).add_to(m)
-
-with col1:
-    with st.container(height=CARD_HEIGHT):
-        st.markdown(f"#### Top 10 State With Severity in {year_label}")
-        st.plotly_chart(top10_bar, use_container_width=True)
-
-    with st.container(height=CARD_HEIGHT):
-        st.markdown(f"#### Accident Location by State in {year_label}")
-        st_folium(m, use_container_width=True, height=PLOT_HEIGHT, returned_objects=[])
-
-
+        max_width=800,
+    )
 
-# Process city data
-city_year_df = load_table("city_year_counts_top200").copy()
 
-# 1) 年份过滤
-city_year_df = city_year_df[city_year_df["Year"].isin(year_filter)]
+    folium.GeoJson(
+        geojson_data,
+        tooltip=tooltip
+    ).add_to(m)
 
-# 2) 如果选了多个年份，把它们合并成一个总排名（与你州级 agg 的逻辑一致）
-city_rank = (
-    city_year_df.groupby("City", as_index=False)["Accident_Count"]
-               .sum()
-               .sort_values("Accident_Count", ascending=False)
-)
+    with col1:
+        with st.container(height=CARD_HEIGHT):
+            st.markdown(f"#### Top 10 State With Severity in {year_label}")
+            chart(top10_bar, use_container_width=True)
 
-top_10_cities = city_rank.head(10).copy()
-top_10_cities["Percentage"] = top_10_cities["Accident_Count"] / top_10_cities["Accident_Count"].sum() * 100
-
-# Create the bar plot
-top_10_city_bar = px.bar(
-    top_10_cities,
-    x="City",
-    y="Accident_Count",
-    text=top_10_cities["Percentage"].apply(lambda x: f"{x:.2f}%"),  # Add percentage as text
-    # title="'\nTop 10 Cities in US with most no. of \nRoad Accident Cases (2016-2020)\n'",
-    labels={"Accident_Count": "Accident Count", "City": "City"},
-    color="City" # Use Rainbow color sequence
-)
+        with st.container(height=CARD_HEIGHT):
+            st.markdown(f"#### Accident Location by State in {year_label}")
+            st_folium(m, use_container_width=True, height=PLOT_HEIGHT, returned_objects=[])
 
-# Customize the layout
-top_10_city_bar.update_traces(
-    textposition="inside",  # Place the percentage text inside the bars
-    textfont=dict(
-        size=12,  # Font size
-        color="white",  # White text
-        family="Arial"  # Font family
-        # Removed the weight property as it's not supported
-    ),   
-    hovertemplate="City: %{x}<br>Accident Count: %{y}<br>Percentage: %{text}<extra></extra>"
-)
 
-top_10_city_bar.update_layout(
-    xaxis_title="City",
-    yaxis_title="Accident Count",
-    margin=dict(l=50, r=50, t=50, b=50),
-    coloraxis_colorbar=dict(
-        title="Accident Count"
-    ),
-    height = PLOT_HEIGHT
-)
 
+    # Process city data
+    # 年份过滤后，多个年份合并成一个总排名（与州级 agg 的逻辑一致）
+    city_ranking = city_rank(view_years)
 
+    top_10_cities = city_ranking.head(10).copy()
+    top_10_cities["Percentage"] = top_10_cities["Accident_Count"] / top_10_cities["Accident_Count"].sum() * 100
 
+    # Create the bar plot
+    top_10_city_bar = px.bar(
+        top_10_cities,
+        x="City",
+        y="Accident_Count",
+        text=top_10_cities["Percentage"].apply(lambda x: f"{x:.2f}%"),  # Add percentage as text
+        # title="'\nTop 10 Cities in US with most no. of \nRoad Accident Cases (2016-2020)\n'",
+        labels={"Accident_Count": "Accident Count", "City": "City"},
+        color="City" # Use Rainbow color sequence
+    )
 
-with col2:
-    with st.container(height=CARD_HEIGHT):
-        st.markdown(f"#### Top 10 Cities in US with most no. of Road Accident Cases in {year_label}")
-        st.plotly_chart(top_10_city_bar, use_container_width=True)
+    # Customize the layout
+    top_10_city_bar.update_traces(
+        textposition="inside",  # Place the percentage text inside the bars
+        textfont=dict(
+            size=12,  # Font size
+            color="white",  # White text
+            family="Arial"  # Font family
+            # Removed the weight property as it's not supported
+        ),   
+        hovertemplate="City: %{x}<br>Accident Count: %{y}<br>Percentage: %{text}<extra></extra>"
+    )
 
-    with st.container(height=CARD_HEIGHT):
+    top_10_city_bar.update_layout(
+        xaxis_title="City",
+        yaxis_title="Accident Count",
+        margin=dict(l=50, r=50, t=50, b=50),
+        coloraxis_colorbar=dict(
+            title="Accident Count"
+        ),
+        height = PLOT_HEIGHT
+    )
 
-        city_options = city_rank.head(200)["City"].tolist()
-        selected_city = st.selectbox(
-            "Select a city to display heatmap:", 
-            options=city_options, 
-            index=0)
 
 
-        # Filter the data for the selected city
-        city_points = load_table("city_points_year_sample")
 
-        # 年份过滤 + 城市过滤
-        pts = city_points[city_points["Year"].isin(year_filter)]
-        pts = pts[pts["City"] == selected_city][["Start_Lat", "Start_Lng"]]
+    # 城市选择只影响城市热力图：作为 fragment 单独重跑，不再重画州级地图
+    @st.fragment
+    def city_heatmap_section(city_options, view_years):
+        with timed_section("regional", "city_heatmap"):
+            selected_city = st.selectbox(
+                "Select a city to display heatmap:", 
+                options=city_options, 
+                index=0)
+            c1, c2 = st.columns(2)
+            stratified = c1.checkbox("Keep severity mix when sampling", value=False)
+            show_hotspots = c2.checkbox("Show hotspot clusters", value=False)
 
-        # 这里可以加一个安全阈值，防止某些城市点数太多拖慢 folium
-        MAX_POINTS = 50000
-        if len(pts) > MAX_POINTS:
-            pts = pts.sample(n=MAX_POINTS, random_state=42)
 
-        filtered_cities = pts
+            # 年份过滤 + 城市过滤，最多取 MAX_POINTS 个（按 sample_priority 的确定性抽样），防止拖慢 folium
+            filtered_cities = city_points(selected_city, view_years, stratified)
 
-        heat_data = [[row['Start_Lat'], row['Start_Lng']] for index, row in filtered_cities.iterrows()]
-        def create_heatmap(df_loc, latitude, longitude, zoom =12, tiles='OpenStreetMap'):
-            """
+            def create_heatmap(df_loc, latitude, longitude, zoom =12, tiles='OpenStreetMap'):
+                """
             Generate a Folium Map with a heatmap of accident locations.
             """
-            # Create a list of coordinates from the dataframe columns 'Start_Lat' and 'Start_Lng'
-            heat_data = [[row['Start_Lat'], row['Start_Lng']] for index, row in df_loc.iterrows()]
-
-            # Create a map centered around the specified coordinates
-            world_map = folium.Map(location=[latitude, longitude], zoom_start=zoom, tiles=tiles)
-
-            # Add the heatmap layer to the map
-            HeatMap(heat_data).add_to(world_map)
-
-            return world_map
-
-        map_us_heatmap = create_heatmap(
-            filtered_cities, 
-            US_CITIES_COORDS[selected_city]['lat'],
-            US_CITIES_COORDS[selected_city]['lon'], 11
+                # Create a list of coordinates from the dataframe columns 'Start_Lat' and 'Start_Lng'
+                heat_data = [[row['Start_Lat'], row['Start_Lng']] for index, row in df_loc.iterrows()]
+
+                # Create a map centered around the specified coordinates
+                world_map = folium.Map(location=[latitude, longitude], zoom_start=zoom, tiles=tiles)
+
+                # Add the heatmap layer to the map
+                HeatMap(heat_data).add_to(world_map)
+
+                return world_map
+
+            map_us_heatmap = create_heatmap(
+                filtered_cities, 
+                US_CITIES_COORDS[selected_city]['lat'],
+                US_CITIES_COORDS[selected_city]['lon'], 11
+            )
+
+
+            if show_hotspots:
+                # builder 预先算好的 DBSCAN 聚类（全部年份）：圆心为质心，半径覆盖 90% 的点
+                city_center = US_CITIES_COORDS[selected_city]
+                city_bbox = bbox_around(city_center["lat"], city_center["lon"])
+                for _, h in city_hotspots(selected_city, city_bbox).iterrows():
+                    folium.Circle(
+                        location=[h["lat"], h["lng"]],
+                        radius=float(h["radius_m"]),
+                        color="#FF5733",
+                        weight=2,
+                        fill=False,
+                        tooltip=(
+                            f"Hotspot #{h['cluster']}: {h['Count']:,} accidents<br>"
+                            f"Critical: {h['Critical']:,} | High: {h['High']:,} | "
+                            f"Medium: {h['Medium']:,} | Low: {h['Low']:,}"
+                        ),
+                    ).add_to(map_us_heatmap)
+
+            st.markdown(f"#### Heatmap of Accidents in {selected_city}")
+            st_folium(map_us_heatmap, width=800, height=300)
+
+
+    with col2:
+        with st.container(height=CARD_HEIGHT):
+            st.markdown(f"#### Top 10 Cities in US with most no. of Road Accident Cases in {year_label}")
+            chart(top_10_city_bar, use_container_width=True)
+
+        with st.container(height=CARD_HEIGHT):
+
+            city_options = city_ranking.head(200)["City"].tolist()
+            city_heatmap_section(city_options, view_years)
+
+    # 全国密度图：builder 预聚合的网格精确计数，不再依赖随机抽样的点
+    # focus -> (bbox, 地图 zoom)
+    DENSITY_FOCUS = {"Contiguous US": (CONTIGUOUS_US_BBOX, 3.5)}
+    DENSITY_FOCUS.update({city: (bbox_around(c["lat"], c["lon"]), 9) for city, c in US_CITIES_COORDS.items()})
+    DETAIL_LEVELS = {"Coarse": -1, "Normal": 0, "Fine": 1}
+
+
+    def national_density_map(focus, detail, view_years, severities, show_points=False):
+        bbox, zoom = DENSITY_FOCUS[focus]
+        grid_zoom = zoom + DETAIL_LEVELS[detail]
+        cells = grid_cells(bbox, grid_zoom, view_years, severities)
+        # 每个格子在屏幕上的像素宽度（Web Mercator 下 256px 对应 360°/2^zoom）
+        cell_px = cell_size(zoom_to_res(grid_zoom)) * 256 * 2 ** zoom / 360
+        fig = px.density_mapbox(
+            cells,
+            lat="lat",
+            lon="lng",
+            z="Count",
+            radius=max(3, int(cell_px)),
+            center={"lat": (bbox[1] + bbox[3]) / 2, "lon": (bbox[0] + bbox[2]) / 2},
+            zoom=zoom,
+            mapbox_style="carto-positron",
+            custom_data=["Count", *SEVERITY_ORDER],
+            height=PLOT_HEIGHT + 100,
         )
-
-
-        st.markdown(f"#### Heatmap of Accidents in {selected_city}")
-        st_folium(map_us_heatmap, width=800, height=300)
-
-st.subheader("Insights:")
-st.write("""
+        fig.update_traces(
+            hovertemplate=(
+                "Accidents: %{customdata[0]:,}<br>"
+                "Critical: %{customdata[1]:,}<br>"
+                "High: %{customdata[2]:,}<br>"
+                "Medium: %{customdata[3]:,}<br>"
+                "Low: %{customdata[4]:,}<extra></extra>"
+            )
+        )
+        fig.update_layout(margin=dict(t=10, r=10, l=10, b=10))
+        if show_points:
+            # 单个事故点来自矢量瓦片：浏览器只下载视野内的 tile，点不进 figure JSON
+            fig.update_layout(mapbox_layers=[{
+                "sourcetype": "vector",
+                "source": [tile_url_template()],
+                "sourcelayer": LAYER_NAME,
+                "type": "circle",
+                "circle": {"radius": 2},
+                "color": "#FF5733",
+                "opacity": 0.6,
+                "minzoom": MIN_ZOOM,
+            }])
+        return fig
+
+
+    @st.fragment
+    def national_density_section(view_years):
+        with timed_section("regional", "national_density"):
+            st.markdown(f"#### Accident Density in {year_label}")
+            c1, c2, c3, c4 = st.columns([1, 1, 2, 1])
+            focus = c1.selectbox("Focus", list(DENSITY_FOCUS), index=0)
+            detail = c2.select_slider("Detail", list(DETAIL_LEVELS), value="Normal")
+            severities = c3.multiselect("Severity", SEVERITY_ORDER, default=SEVERITY_ORDER)
+            # 矢量瓦片是全量点（不分年份 / severity），标签里写明
+            show_points = c4.checkbox("Show accidents (all years and severities)", value=False,
+                                      disabled=tile_server is None,
+                                      help="Individual accidents from the vector tile server. The points are not "
+                                           "filtered by the year and severity selections above.")
+            if not severities:
+                st.info("Select at least one severity level.")
+                return
+            chart(cached_figure("regional", national_density_map, focus, detail, view_years, tuple(severities), show_points),
+                  use_container_width=True)
+            if show_points:
+                st.caption("Density: selected years and severities. Red points: all accidents, every year and severity.")
+
+
+    national_density_section(view_years)
+
+
+    # 街道排名：builder 预先算好的 Top 25，不扫描点数据
+    @st.fragment
+    def street_ranking_section(all_years):
+        with timed_section("regional", "street_ranking"):
+            st.markdown("#### Most Dangerous Streets")
+            c1, c2, c3 = st.columns([1, 2, 1])
+            scope = c1.radio("Scope", ["National", "State", "City"], horizontal=True)
+            state = city = None
+            if scope == "State":
+                state = c2.selectbox("State", list(US_STATES), format_func=lambda code: US_STATES[code])
+            elif scope == "City":
+                cities = street_ranking_cities()
+                if cities.empty:
+                    st.info("No city street rankings in this build.")
+                    return
+                labels =(cities["City"].astype(str) + ", " + cities["State"].astype(str)).tolist()
+                i = c2.selectbox("City", range(len(labels)), format_func=lambda i: labels[i])
+                state, city = cities.loc[i, "State"], cities.loc[i, "City"]
+            year = c3.selectbox("Year", ["All"] + all_years)
+
+            ranking = street_ranking(state, city, None if year == "All" else year)
+            if ranking.empty:
+                st.info("No street ranking for this selection.")
+                return
+            long = ranking.melt(id_vars=["rank", "Street", "Count"], value_vars=SEVERITY_ORDER,
+                                var_name="Severity", value_name="Severity_Count")
+            fig = px.bar(
+                long,
+                y="Street",
+                x="Severity_Count",
+                color="Severity",
+                orientation="h",
+                category_orders={"Street": ranking["Street"].tolist(), "Severity": SEVERITY_ORDER},
+                color_discrete_map={"Critical": "#FF5733", "High": "#FF8C00", "Medium": "#FFD700", "Low": "#28A745"},
+                labels={"Severity_Count": "Accident Count"},
+                height=max(PLOT_HEIGHT, 22 * len(ranking)),
+            )
+            fig.update_layout(barmode="stack", margin=dict(t=10, r=10, l=10, b=10))
+            chart(fig, use_container_width=True)
+
+
+    street_ranking_section(all_years)
+
+
+    # 任意坐标附近的事故：内存中的网格索引，查询不经过缓存、不扫描表
+    @st.fragment
+    def nearby_section():
+        with timed_section("regional", "nearby"):
+            st.markdown("#### Accidents Near a Location")
+            c1, c2, c3, c4 = st.columns([2, 1, 1, 2])
+            place = c1.selectbox("Location", ["Custom"] + list(US_CITIES_COORDS), index=1)
+            default = US_CITIES_COORDS.get(place, {"lat": 34.0522, "lon": -118.2437})
+            lat = c2.number_input("Latitude", value=float(default["lat"]), format="%.5f", disabled=place != "Custom")
+            lng = c3.number_input("Longitude", value=float(default["lon"]), format="%.5f", disabled=place != "Custom")
+            mode = c4.radio("Find", ["Within radius", "Nearest"], horizontal=True)
+            if mode == "Within radius":
+                radius = c4.slider("Radius (miles)", 0.25, 10.0, 2.0, 0.25)
+                result = accidents_near(lat, lng, radius_mi=radius)
+            else:
+                k = c4.slider("Number of accidents", 10, 1000, 100, 10)
+                result = accidents_near(lat, lng, k=k)
+
+            if result["count"] == 0:
+                st.info("No accidents found around this location.")
+                return
+            m1, m2, m3 = st.columns([1, 1, 2])
+            m1.metric("Accidents", f"{result['count']:,}")
+            m2.metric("Nearest", f"{result['nearest_mi']:.2f} mi")
+            m3.dataframe(
+                pd.DataFrame({"Severity": SEVERITY_ORDER, "Count": [result["severity"][s] for s in SEVERITY_ORDER]}),
+                hide_index=True, use_container_width=True
+            )
+
+            points = result["points"]
+            points["Severity"] = points["Severity"].map({1: "Low", 2: "Medium", 3: "High", 4: "Critical"})
+            fig = px.scatter_mapbox(
+                points,
+                lat="Start_Lat",
+                lon="Start_Lng",
+                color="Severity",
+                category_orders={"Severity": SEVERITY_ORDER},
+                color_discrete_map={"Critical": "#FF5733", "High": "#FF8C00", "Medium": "#FFD700", "Low": "#28A745"},
+                hover_data={"City": True, "year": True, "distance_mi": ":.2f", "Start_Lat": False, "Start_Lng": False},
+                center={"lat": lat, "lon": lng},
+                zoom=11,
+                mapbox_style="carto-positron",
+                height=PLOT_HEIGHT,
+            )
+            fig.update_layout(margin=dict(t=10, r=10, l=10, b=10))
+            if result["count"] > len(points):
+                st.caption(f"Showing the nearest {len(points):,} of {result['count']:,} accidents.")
+            chart(fig, use_container_width=True)
+
+
+    nearby_section()
+
+
+    # 路线风险：沿折线 buffer 内的历史事故，按段统计
+    SAMPLE_ROUTE = """34.0522, -118.2437
+34.0407, -118.2910
+34.0336, -118.3776
+34.0259, -118.4370
+34.0195, -118.4912"""
+
+
+    ROUTE_COLUMNS = ["route", "lat", "lng"]
+
+
+    def parse_route(text: str):
+        route = []
+        for line in text.strip().splitlines():
+            if line.strip():
+                lat, lng = (float(v) for v in line.replace(";", ",").split(",")[:2])
+                route.append((lat, lng))
+        return route
+
+
+    @st.fragment
+    def route_risk_section():
+        with timed_section("regional", "route_risk"):
+            st.markdown("#### Route Risk")
+            c1, c2 = st.columns([1, 2])
+            text = c1.text_area("Route vertices (lat, lng per line)", SAMPLE_ROUTE, height=160)
+            buffer_mi = c1.slider("Buffer (miles)", 0.05, 2.0, 0.25, 0.05)
+            try:
+                route = parse_route(text)
+            except ValueError:
+                c1.error("Each line must be 'lat, lng'.")
+                return
+            if len(route) < 2:
+                c1.info("Enter at least two vertices.")
+                return
+
+            segments, summary = route_risk(route, buffer_mi)
+            m1, m2, m3 = c1.columns(3)
+            m1.metric("Length", f"{summary['length_mi']:.1f} mi")
+            m2.metric("Accidents", f"{summary['Count']:,}")
+            m3.metric("Per mile", f"{summary['per_mile']:.1f}")
+
+            # 每段两个端点一行，按段分组画线，颜色是每英里事故数
+            lines = pd.concat([
+                segments[["segment", "start_lat", "start_lng", "per_mile", "Count"]].set_axis(
+                    ["segment", "lat", "lng", "per_mile", "Count"], axis=1),
+                segments[["segment", "end_lat", "end_lng", "per_mile", "Count"]].set_axis(
+                    ["segment", "lat", "lng", "per_mile", "Count"], axis=1),
+            ]).sort_values("segment", kind="stable")
+            lines["Risk"] = pd.cut(lines["per_mile"].rank(method="dense", pct=True), [0, 1 / 3, 2 / 3, 1],
+                                   labels=["Lower", "Middle", "Higher"], include_lowest=True)
+            fig = px.line_mapbox(
+                lines,
+                lat="lat",
+                lon="lng",
+                line_group="segment",
+                color="Risk",
+                color_discrete_map={"Lower": "#28A745", "Middle": "#FFD700", "Higher": "#FF5733"},
+                hover_data={"segment": True, "Count": True, "per_mile": ":.1f", "lat": False, "lng": False},
+                zoom=10,
+                mapbox_style="carto-positron",
+                height=PLOT_HEIGHT,
+            )
+            fig.update_traces(line=dict(width=5))
+            fig.update_layout(margin=dict(t=10, r=10, l=10, b=10))
+            with c2:
+                chart(fig, use_container_width=True)
+
+            hours = pd.DataFrame({"Hour": range(24), "Accidents": summary["hours"]})
+            hour_bar = px.bar(hours, x="Hour", y="Accidents", height=250)
+            hour_bar.update_layout(margin=dict(t=10, r=10, l=10, b=10))
+            chart(hour_bar, use_container_width=True)
+
+            upload = st.file_uploader("Score many routes (CSV with route, lat, lng; vertices in order)", type="csv")
+            if upload is not None:
+                try:
+                    df_routes = pd.read_csv(upload)
+                except (ValueError, UnicodeDecodeError) as e:
+                    st.error(f"Could not read the CSV: {e}")
+                    return
+                missing = [c for c in ROUTE_COLUMNS if c not in df_routes.columns]
+                if missing:
+                    st.error(f"The CSV needs the columns {', '.join(ROUTE_COLUMNS)}; missing: {', '.join(missing)}.")
+                    return
+                df_routes["lat"] = pd.to_numeric(df_routes["lat"], errors="coerce")
+                df_routes["lng"] = pd.to_numeric(df_routes["lng"], errors="coerce")
+                if df_routes[["lat", "lng"]].isna().any().any():
+                    st.error("Every lat / lng value must be a number.")
+                    return
+                routes = {rid: list(zip(g["lat"], g["lng"])) for rid, g in df_routes.groupby("route", sort=False) if len(g) >= 2}
+                if not routes:
+                    st.info("No route in the CSV has at least two vertices.")
+                    return
+                scored = route_risk_batch(routes, buffer_mi)
+                st.dataframe(scored, hide_index=True, use_container_width=True)
+                st.download_button("Download scores", scored.to_csv(index=False), "route_risk.csv", "text/csv")
+
+
+    route_risk_section()
+
+
+    # 全文检索 Description / Street：倒排索引，查询不扫描原始文本
+    @st.fragment
+    def accident_search_section():
+        with timed_section("regional", "search"):
+            st.markdown("#### Search Accident Descriptions")
+            query = st.text_input("Keywords (all must match)", placeholder="e.g. ramp closed, I-405")
+            if not query.strip():
+                return
+            result = search_accidents(query)
+            if result is None:
+                st.warning("Search index is not available.")
+                return
+            if result["count"] == 0:
+                st.info(f"No accidents match: {' '.join(result['terms'])}")
+                return
+
+            c1, c2, c3 = st.columns([1, 2, 2])
+            c1.metric("Matching accidents", f"{result['count']:,}")
+            c2.dataframe(
+                pd.DataFrame({"Severity": SEVERITY_ORDER, "Count": [result["severity"][s] for s in SEVERITY_ORDER]}),
+                hide_index=True, use_container_width=True
+            )
+            top_states = pd.DataFrame(list(result["states"].items())[:10], columns=["State", "Count"])
+            top_states["State"] = top_states["State"].map(US_STATES).fillna(top_states["State"])
+            c3.dataframe(top_states, hide_index=True, use_container_width=True)
+
+            points = result["points"]
+            points["Severity"] = points["Severity"].map({1: "Low", 2: "Medium", 3: "High", 4: "Critical"})
+            fig = px.scatter_mapbox(
+                points,
+                lat="Start_Lat",
+                lon="Start_Lng",
+                color="Severity",
+                category_orders={"Severity": SEVERITY_ORDER},
+                color_discrete_map={"Critical": "#FF5733", "High": "#FF8C00", "Medium": "#FFD700", "Low": "#28A745"},
+                hover_data={"Street": True, "City": True, "State": True, "Start_Lat": False, "Start_Lng": False},
+                zoom=3,
+                mapbox_style="carto-positron",
+                height=PLOT_HEIGHT,
+            )
+            fig.update_layout(margin=dict(t=10, r=10, l=10, b=10))
+            if result["count"] > len(points):
+                st.caption(f"Showing {len(points):,} of {result['count']:,} matches.")
+            chart(fig, use_container_width=True)
+
+
+    accident_search_section()
+
+    st.subheader("Insights:")
+    st.write("""
          1. In US, :blue[California] is the state :blue[with highest no. of road accidents] in past 5 years.
          2. About :blue[30%] of the total accident records of past 5 years in US is only from :blue[California].
          3. Florida is the 2nd highest (10% cases) state for no. road accidents in US.
          4. :blue[Miami] is the city with :blue[highest (2.42%)] no. of road accidents in US (2016-2020).
          5. Around :blue[14%] accident records of past 5 years are only from these :blue[10 cities] out of 10,657 cities in US (as per the dataset).
-         """)
\ No newline at end of file
+         """)
@@ -2,388 +2,423 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from data_processing import state_code
+from constants import STATE_NAME_TO_CODE
+from table_store import load_table, prefetch_tables, state_filters
+from views import (anomalies, daily_counts, hour_counts, hour_weekday_counts, severity_hour_counts, time_series,
+                   top_states_by_quarter, weekday_counts)
+from cache_warmer import start_cache_warmer
+from figure_cache import cached_figure
+from rerun_stats import chart, timed_page, timed_section
 st.set_page_config(layout="wide")
-
-S3_BASE = "s3://us-accidents-dashboard-1445/processed"
-
-@st.cache_data(ttl=3600)
-def load_table(name: str) -> pd.DataFrame:
-    return pd.read_parquet(f"{S3_BASE}/{name}/")
-
-def filter_by_selected_state(df: pd.DataFrame, selected_state: str, state_col: str = "State") -> pd.DataFrame:
-    """df[state_col] is state code; selected_state is full name. Return filtered df."""
-    if selected_state == "All States":
-        return df
-    # convert code -> full name for filtering
-    tmp = df.copy()
-    tmp[state_col] = tmp[state_col].apply(state_code)
-    return tmp[tmp[state_col] == selected_state]
-
-st.title("Temporal Analysis")
-st.write("Analyze accident trends over time.")
-st.write("This page will feature visualizations for time-based trends.")
-
-state_time_counts = load_table("state_quarter_counts").rename(columns={
-    "State": "State_Code",
-    "year": "Year",
-    "quarter": "Quarter",
-    "accident_count": "Count"
-})
-
-state_time_counts["State"] = state_time_counts["State_Code"].apply(state_code)
-
-state_time_counts["YearQuarter"] = (
-    state_time_counts["Year"].astype(str) + "-Q" + state_time_counts["Quarter"].astype(str)
-)
-
-# Get top 10 states for each time period and sort them
-top_10_states_by_yr_ = (state_time_counts.groupby('YearQuarter')
-                 .apply(lambda x: x.nlargest(10, 'Count')
-                       .sort_values('Count', ascending=True))
-                 .reset_index(drop=True))
-
-# Get severity counts for each state and time period
-severity_counts = load_table("state_yearquarter_severity_counts")
-severity_map = {1: "Low", 2: "Medium", 3: "High", 4: "Critical"}
-weekday_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-severity_counts["Severity"] = severity_counts["Severity"].map(severity_map)
-severity_counts["State"] = severity_counts["State"].apply(state_code)
-
-# Create base figure
-racing_bar = go.Figure()
-
-# Add initial data
-initial_data = top_10_states_by_yr_[top_10_states_by_yr_['YearQuarter'] == top_10_states_by_yr_['YearQuarter'].iloc[0]]
-racing_bar.add_trace(
-    go.Bar(
-        x=initial_data['Count'],
-        y=initial_data['State'],
-        orientation='h',
-        marker_color=px.colors.qualitative.Set3
-    )
-)
-
-# Create tooltip function
-def get_racing_tooltip(state, yearquarter):
-    state_data = severity_counts[(severity_counts['State'] == state) & 
-                               (severity_counts['YearQuarter'] == yearquarter)]
-    tooltip = f"State: {state}<br>"
-    tooltip += f"Time: {yearquarter}<br>"
-    total = state_data['Severity_Count'].sum()
-    tooltip += f"Total Accidents: {total}<br>"
-    
-    for _, row in state_data.iterrows():
-        pct = (row['Severity_Count'] / total * 100)
-        tooltip += f"{row['Severity']}: {row['Severity_Count']} ({pct:.1f}%)<br>"
-    
-    return tooltip
-
-# Create and add frames
-frames = []
-for yearquarter in top_10_states_by_yr_['YearQuarter'].unique():
-    frame_data = top_10_states_by_yr_[top_10_states_by_yr_['YearQuarter'] == yearquarter].sort_values('Count', ascending=True)
-    
-    # Create tooltips for each state in frame
-    tooltips = [get_racing_tooltip(state, yearquarter) for state in frame_data['State']]
-    
-    # Format total count for text display
-    text_display = frame_data['Count'].apply(lambda x: f'{x:,}')
-    
-    frames.append(
-        go.Frame(
-            data=[go.Bar(
-                x=frame_data['Count'],
-                y=frame_data['State'],
+with timed_page("temporal"):
+
+    # 全国视图用到的表
+    NATIONAL_TABLES = [
+        "accidents_by_year_severity",
+        "accidents_by_year_total",
+        "temporal_matrix",
+        "daily_counts",
+        "anomalies",
+    ]
+    # 选中单个州时用到的表
+    STATE_TABLES = [
+        "state_year_severity_counts",
+        "state_year_total_counts",
+    ]
+
+    def load_selected_state(name: str, selected_state: str) -> pd.DataFrame:
+        """selected_state is full name; only that state's slice is read from Parquet."""
+        return load_table(name, filters=state_filters(STATE_NAME_TO_CODE[selected_state]))
+
+    TREND_FREQS = {"Weekly": "W", "Monthly": "M", "Quarterly": "Q"}
+    # 移动平均窗口：约 3 个月
+    TREND_MA_WINDOWS = {"W": 13, "M": 3, "Q": 2}
+
+
+    def create_trend_chart(state_code, freq_label, start, end, show_ma):
+        freq = TREND_FREQS[freq_label]
+        trend = time_series(state_code, freq, start, end, ma_window=TREND_MA_WINDOWS[freq] if show_ma else None)
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(
+            x=trend['Date'],
+            y=trend['Count'],
+            mode='lines+markers',
+            name='Accidents',
+            customdata=trend[['YoY', 'YoY_pct']].to_numpy(),
+            hovertemplate='%{x|%Y-%m-%d}<br>Accidents: %{y:,}<br>'
+                          'YoY: %{customdata[0]:+,.0f} (%{customdata[1]:+.1f}%)<extra></extra>'
+        ))
+        if show_ma:
+            fig.add_trace(go.Scatter(
+                x=trend['Date'],
+                y=trend['MA'],
+                mode='lines',
+                name=f'{TREND_MA_WINDOWS[freq]}-period average',
+                line=dict(color='green', dash='dash', width=2)
+            ))
+        # builder 标出的异常月份：月度图上标点，变点在所有粒度上画竖线
+        flagged = anomalies(state_code)
+        flagged = flagged[(flagged['month'].dt.date >= start) & (flagged['month'].dt.date <= end)]
+        if freq == 'M':
+            for kind, color in [('spike', 'red'), ('drop', 'royalblue')]:
+                pts = flagged[flagged['kind'] == kind]
+                if not pts.empty:
+                    fig.add_trace(go.Scatter(
+                        x=pts['month'],
+                        y=pts['count'],
+                        mode='markers',
+                        name=kind.capitalize(),
+                        marker=dict(color=color, size=11, symbol='circle-open', line=dict(width=2)),
+                        customdata=pts[['expected', 'score']].to_numpy(),
+                        hovertemplate='%{x|%Y-%m}<br>Accidents: %{y:,}<br>Expected: %{customdata[0]:,.0f}'
+                                      '<br>z: %{customdata[1]:.1f}<extra></extra>'
+                    ))
+        for month in flagged.loc[flagged['kind'] == 'change_point', 'month']:
+            fig.add_vline(x=month.timestamp() * 1000, line_dash='dot', line_color='gray',
+                          annotation_text='level shift', annotation_position='top left')
+
+        fig.update_layout(
+            title=f'{freq_label} Accident Trends',
+            xaxis_title='Date',
+            yaxis_title='Number of Accidents',
+            legend=dict(orientation='h', yanchor='bottom', y=1.02, xanchor='right', x=1)
+        )
+        return fig
+
+
+    @st.fragment
+    def trend_section(state_code):
+        with timed_section("temporal", "trend"):
+            days = daily_counts().days
+            first, last = pd.Timestamp(days[0]).date(), pd.Timestamp(days[-1]).date()
+            c1, c2 = st.columns([1, 1])
+            freq_label = c1.selectbox("Granularity", list(TREND_FREQS), index=1)
+            show_ma = c2.checkbox("Moving average", value=False)
+            start, end = st.slider("Date range", min_value=first, max_value=last, value=(first, last))
+            chart(cached_figure("temporal", create_trend_chart, state_code, freq_label, start, end, show_ma))
+            flagged = anomalies(state_code)
+            if not flagged.empty:
+                with st.expander(f"Flagged months ({len(flagged)})"):
+                    st.dataframe(
+                        flagged.assign(month=flagged['month'].dt.strftime('%Y-%m'),
+                                       expected=flagged['expected'].round(0), score=flagged['score'].round(1)),
+                        hide_index=True,
+                        use_container_width=True
+                    )
+
+
+    st.title("Temporal Analysis")
+    st.write("Analyze accident trends over time.")
+    st.write("This page will feature visualizations for time-based trends.")
+
+    start_cache_warmer()
+    prefetch_tables(["state_quarter_counts", "state_yearquarter_severity_counts"] + NATIONAL_TABLES)
+
+    # Top 10 states for each time period, plus severity counts for each state and time period
+    state_time_counts, top_10_states_by_yr_, severity_counts = top_states_by_quarter()
+    severity_map = {1: "Low", 2: "Medium", 3: "High", 4: "Critical"}
+    weekday_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+    def create_racing_bar():
+        """Animated top-10 states racing bar; depends only on the cached quarter tables."""
+        _, top_10_states_by_yr_, severity_counts = top_states_by_quarter()
+
+        # Create base figure
+        racing_bar = go.Figure()
+
+        # Add initial data
+        initial_data = top_10_states_by_yr_[top_10_states_by_yr_['YearQuarter'] == top_10_states_by_yr_['YearQuarter'].iloc[0]]
+        racing_bar.add_trace(
+            go.Bar(
+                x=initial_data['Count'],
+                y=initial_data['State'],
                 orientation='h',
-                marker_color=px.colors.qualitative.Set3,
-                text=text_display,  # Display total count
-                textposition='outside',  # Show text at end of bars
-                hovertext=tooltips,  # Show detailed info on hover
-                hoverinfo='text'
-            )],
-            name=yearquarter,
-            layout=go.Layout(
-                yaxis=dict(
-                    categoryarray=frame_data['State'].tolist()
-                )
+                marker_color=px.colors.qualitative.Set3
             )
         )
-    )
 
-racing_bar.frames = frames
-
-# Get max count for x-axis range
-max_count = top_10_states_by_yr_['Count'].max()
-
-# Update layout with x-axis range
-racing_bar.update_layout(
-    title='Top 10 States with Most Accidents (2016-2023)',
-    xaxis_title='Number of Accidents',
-    yaxis_title='State',
-    showlegend=False,
-    xaxis=dict(range=[0, max_count * 1.1]),
-    updatemenus=[dict(
-        type='buttons',
-        showactive=False,
-        buttons=[
-            dict(
-                label='Play',
-                method='animate',
-                args=[None, dict(
-                    frame=dict(duration=1000, redraw=False),
-                    fromcurrent=True,
-                    mode='immediate'
-                )]
-            ),
-            dict(
-                label='Stop',
-                method='animate',
-                args=[[None], dict(
-                    frame=dict(duration=0, redraw=False),
-                    mode='immediate',
-                    transition=dict(duration=0)
-                )]
+        # Create tooltip function
+        def get_racing_tooltip(state, yearquarter):
+            state_data = severity_counts[(severity_counts['State'] == state) & 
+                                       (severity_counts['YearQuarter'] == yearquarter)]
+            tooltip = f"State: {state}<br>"
+            tooltip += f"Time: {yearquarter}<br>"
+            total = state_data['Severity_Count'].sum()
+            tooltip += f"Total Accidents: {total}<br>"
+
+            for _, row in state_data.iterrows():
+                pct = (row['Severity_Count'] / total * 100)
+                tooltip += f"{row['Severity']}: {row['Severity_Count']} ({pct:.1f}%)<br>"
+
+            return tooltip
+
+        # Create and add frames
+        frames = []
+        for yearquarter in top_10_states_by_yr_['YearQuarter'].unique():
+            frame_data = top_10_states_by_yr_[top_10_states_by_yr_['YearQuarter'] == yearquarter].sort_values('Count', ascending=True)
+
+            # Create tooltips for each state in frame
+            tooltips = [get_racing_tooltip(state, yearquarter) for state in frame_data['State']]
+
+            # Format total count for text display
+            text_display = frame_data['Count'].apply(lambda x: f'{x:,}')
+
+            frames.append(
+                go.Frame(
+                    data=[go.Bar(
+                        x=frame_data['Count'],
+                        y=frame_data['State'],
+                        orientation='h',
+                        marker_color=px.colors.qualitative.Set3,
+                        text=text_display,  # Display total count
+                        textposition='outside',  # Show text at end of bars
+                        hovertext=tooltips,  # Show detailed info on hover
+                        hoverinfo='text'
+                    )],
+                    name=yearquarter,
+                    layout=go.Layout(
+                        yaxis=dict(
+                            categoryarray=frame_data['State'].tolist()
+                        )
+                    )
+                )
             )
-        ]
-    )],
-    sliders=[{
-        'currentvalue': {'prefix': 'Year-Quarter: ', 'font':{"size": 20}, 'xanchor':"right"},
-        'steps': [
-            {'args': [[f], {'frame': {'duration': 1000, 'redraw': True, "easing": "cubic-in-out"},
-                            "pad": {"b": 10, "t": 50},  "len": 0.9,
-                            "x": 0.1,
-                            "y": 1,
-                          'mode': 'immediate'}],
-             'label': f,
-             'method': 'animate'} for f in top_10_states_by_yr_['YearQuarter'].unique()
-        ]
-    }]
-)
-
-st.plotly_chart(racing_bar)
-
-# Add state selection in sidebar
-states_list = ["All States"] + sorted(state_time_counts["State"].unique().tolist())
-
-
-selected_state = st.sidebar.selectbox(
-    "Select State",
-    options=states_list,
-    index=0  # Default to "All States"
-)
 
-# Filter data based on state selection
-if selected_state == "All States":
-    state_time_counts_f = state_time_counts
-    top_10_states_by_yr_f = top_10_states_by_yr_
-else:
-    state_time_counts_f = state_time_counts[state_time_counts["State"] == selected_state]
-    top_10_states_by_yr_f = top_10_states_by_yr_[top_10_states_by_yr_["State"] == selected_state]
-    st.title(selected_state)
-
-
-# Update all plots with filtered data
-col1, col2 = st.columns(2)
+        racing_bar.frames = frames
+
+        # Get max count for x-axis range
+        max_count = top_10_states_by_yr_['Count'].max()
+
+        # Update layout with x-axis range
+        racing_bar.update_layout(
+            title='Top 10 States with Most Accidents (2016-2023)',
+            xaxis_title='Number of Accidents',
+            yaxis_title='State',
+            showlegend=False,
+            xaxis=dict(range=[0, max_count * 1.1]),
+            updatemenus=[dict(
+                type='buttons',
+                showactive=False,
+                buttons=[
+                    dict(
+                        label='Play',
+                        method='animate',
+                        args=[None, dict(
+                            frame=dict(duration=1000, redraw=False),
+                            fromcurrent=True,
+                            mode='immediate'
+                        )]
+                    ),
+                    dict(
+                        label='Stop',
+                        method='animate',
+                        args=[[None], dict(
+                            frame=dict(duration=0, redraw=False),
+                            mode='immediate',
+                            transition=dict(duration=0)
+                        )]
+                    )
+                ]
+            )],
+            sliders=[{
+                'currentvalue': {'prefix': 'Year-Quarter: ', 'font':{"size": 20}, 'xanchor':"right"},
+                'steps': [
+                    {'args': [[f], {'frame': {'duration': 1000, 'redraw': True, "easing": "cubic-in-out"},
+                                    "pad": {"b": 10, "t": 50},  "len": 0.9,
+                                    "x": 0.1,
+                                    "y": 1,
+                                  'mode': 'immediate'}],
+                     'label': f,
+                     'method': 'animate'} for f in top_10_states_by_yr_['YearQuarter'].unique()
+                ]
+            }]
+        )
+        return racing_bar
 
+    chart(cached_figure("temporal", create_racing_bar))
 
+    # Add state selection in sidebar
+    states_list = ["All States"] + sorted(state_time_counts["State"].unique().tolist())
 
-with col1:
-    severity_order = ['Critical', 'High', 'Medium', 'Low']
 
-    if selected_state == "All States":
-        accidents_per_year_severity = load_table("accidents_by_year_severity").rename(columns={
-            "year": "Year",
-            "accident_count": "Count"
-        })
-        accidents_per_year = load_table("accidents_by_year_total").rename(columns={
-            "year": "Year",
-            "accident_count": "Total_Count"
-        })
-    else:
-        accidents_per_year_severity = load_table("state_year_severity_counts")
-        accidents_per_year_severity = filter_by_selected_state(accidents_per_year_severity, selected_state, "State")
-        accidents_per_year_severity = accidents_per_year_severity.rename(columns={
-            "year": "Year",
-            "accident_count": "Count"
-        })
-
-        accidents_per_year = load_table("state_year_total_counts")
-        accidents_per_year = filter_by_selected_state(accidents_per_year, selected_state, "State")
-        accidents_per_year = accidents_per_year.rename(columns={
-            "year": "Year",
-            "accident_count": "Total_Count"
-        })
-
-    # map severity and set order
-    accidents_per_year_severity["Severity"] = accidents_per_year_severity["Severity"].map(severity_map)
-    accidents_per_year_severity["Severity"] = pd.Categorical(
-        accidents_per_year_severity["Severity"],
-        categories=severity_order,
-        ordered=True
+    selected_state = st.sidebar.selectbox(
+        "Select State",
+        options=states_list,
+        index=0  # Default to "All States"
     )
-    
-    # Plotting the data using Plotly
-    yr_svrt_fig = px.bar(accidents_per_year_severity, x='Year', y='Count', color='Severity', 
-                title='Number of Accidents per Year by Severity',
-                labels={'Year': 'Year', 'Count': 'Number of Accidents', 'Severity': 'Severity'},
-                category_orders={'Severity': severity_order},
-                barmode='group')
-
 
-    # Add a line chart on top of the bar chart
-    yr_svrt_fig.add_trace(go.Scatter(x=accidents_per_year['Year'], 
-                            y=accidents_per_year['Total_Count'],
-                            mode='lines+markers', 
-                            name='Total Accidents', 
-                            line=dict(color='green', dash = 'dashdot', width = 2)
-                            ))
+    if selected_state != "All States":
+        prefetch_tables(STATE_TABLES, filters=state_filters(STATE_NAME_TO_CODE[selected_state]))
 
+    selected_code = None if selected_state == "All States" else STATE_NAME_TO_CODE[selected_state]
 
-    # Display the plot in Streamlit
-    st.plotly_chart(yr_svrt_fig)
-
-    # Extract year and month, create datetime series
+    # Filter data based on state selection
     if selected_state == "All States":
-        accidents_per_month = load_table("accidents_by_year_month").rename(columns={
-            "year": "Year",
-            "month": "Month",
-            "accident_count": "Count"
-        })
+        state_time_counts_f = state_time_counts
+        top_10_states_by_yr_f = top_10_states_by_yr_
     else:
-        accidents_per_month = load_table("state_year_month_counts")
-        accidents_per_month = filter_by_selected_state(accidents_per_month, selected_state, "State")
-        accidents_per_month = accidents_per_month.rename(columns={
-            "year": "Year",
-            "month": "Month",
-            "accident_count": "Count"
-        })
-
-    accidents_per_month["YearMonth"] = pd.to_datetime(
-        accidents_per_month["Year"].astype(str) + "-" + accidents_per_month["Month"].astype(str).str.zfill(2)
-    )
-    accidents_per_month = accidents_per_month.sort_values("YearMonth")
-
-    # Create monthly trend plot
-    monthly_trend = px.line(accidents_per_month, 
-                        x='YearMonth', 
-                        y='Count',
-                        title='Monthly Accident Trends (2016-2023)',
-                        markers=True)
-
-    # Update layout
-    monthly_trend.update_layout(
-        xaxis_title='Year-Month',
-        yaxis_title='Number of Accidents',
-        xaxis=dict(
-            tickformat='%Y-%m',
-            tickangle=45,
-            tickmode='auto',
-            nticks=30
+        state_time_counts_f = state_time_counts[state_time_counts["State"] == selected_state]
+        top_10_states_by_yr_f = top_10_states_by_yr_[top_10_states_by_yr_["State"] == selected_state]
+        st.title(selected_state)
+
+
+    # Update all plots with filtered data
+    col1, col2 = st.columns(2)
+
+
+
+    with col1:
+        severity_order = ['Critical', 'High', 'Medium', 'Low']
+
+        if selected_state == "All States":
+            accidents_per_year_severity = load_table("accidents_by_year_severity").rename(columns={
+                "year": "Year",
+                "accident_count": "Count"
+            })
+            accidents_per_year = load_table("accidents_by_year_total").rename(columns={
+                "year": "Year",
+                "accident_count": "Total_Count"
+            })
+        else:
+            accidents_per_year_severity = load_selected_state("state_year_severity_counts", selected_state)
+            accidents_per_year_severity = accidents_per_year_severity.rename(columns={
+                "year": "Year",
+                "accident_count": "Count"
+            })
+
+            accidents_per_year = load_selected_state("state_year_total_counts", selected_state)
+            accidents_per_year = accidents_per_year.rename(columns={
+                "year": "Year",
+                "accident_count": "Total_Count"
+            })
+
+        # map severity and set order
+        accidents_per_year_severity["Severity"] = accidents_per_year_severity["Severity"].map(severity_map)
+        accidents_per_year_severity["Severity"] = pd.Categorical(
+            accidents_per_year_severity["Severity"],
+            categories=severity_order,
+            ordered=True
         )
-    )
-
-    # Display plot
-    st.plotly_chart(monthly_trend)
-
-
-with col2:
-    if selected_state == "All States":
-        wk = load_table("accidents_by_weekday").rename(columns={"accident_count": "Total_Count"})
-        # national table uses day_of_week 1..7
-        wk["Day of Week"] = wk["day_of_week"].map({2:0, 3:1, 4:2, 5:3, 6:4, 7:5, 1:6})
-    else:
-        wk = load_table("state_weekday_counts").rename(columns={"accident_count": "Total_Count"})
-        wk = filter_by_selected_state(wk, selected_state, "State")
-        wk["Day of Week"] = wk["day_of_week"].map({2:0, 3:1, 4:2, 5:3, 6:4, 7:5, 1:6})
-
-    accidents_per_weekday = wk[["Day of Week", "Total_Count"]].sort_values("Day of Week")
-
-    # hour
-    if selected_state == "All States":
-        hr = load_table("accidents_by_hour").rename(columns={
-            "hour": "Hour",
-            "accident_count": "Total_Count"
-        })
-    else:
-        hr = load_table("state_hour_counts")
-        hr = filter_by_selected_state(hr, selected_state, "State")
-        hr = hr.rename(columns={
-            "hour": "Hour",
-            "accident_count": "Total_Count"
-        })
-
-    accidents_per_hr = hr.sort_values("Hour")
-
-
-    wkdy_barfig = px.bar(accidents_per_weekday,
-                        x = 'Day of Week',
-                        y = 'Total_Count',
-                        color= 'Day of Week',
-                        category_orders={'Day of Week': weekday_order},
-                        title='Accidents by Day of Week',
-                        labels={'Day of Week': 'Day of Week', 'Total_Count': 'Number of Accidents'})
-    wkdy_barfig.update_layout(showlegend=False)
-    st.plotly_chart(wkdy_barfig)
-
-    hour_barfig = px.bar(accidents_per_hr,
-                         x = 'Hour',
-                         y = 'Total_Count',
-                         title = 'Accident by Hour',
-                         color='Hour',
-                         color_continuous_scale='Tealgrn')
     
-    hour_barfig.update_layout(
-        annotations=[
-            dict(
-                x=7,  # Text position x
-                y=accidents_per_hr['Total_Count'].max() * 1.1,  # Text position y
-                text="Morning Peak",
-                showarrow=False,
-                arrowhead=1
-            ),
-            dict(
-                x=16,  # Text position x
-                y=accidents_per_hr['Total_Count'].max() * 1.1,  # Text position y
-                text="Evening Peak",
-                showarrow=False,
-                arrowhead=1
-            ),
-            dict(
-                ax=4,  # Text position x
-                ay=accidents_per_hr['Total_Count'].max() * 0.7,  # Text position y
-                text="go to work",
-                showarrow=True,
-                arrowhead=2,
-                x=6,  # Arrow end x
-                y=10,  # Arrow end y
-                axref='x',  # Use x-axis coordinates
-                ayref='y'   # Use y-axis coordinates
-            ),
-            dict(
-                ax=20,  # Text position x
-                ay=accidents_per_hr['Total_Count'].max() * 0.7,  # Text position y
-                text="get off work",
-                showarrow=True,
-                arrowhead=2,
-                x=16,  # Arrow end x
-                y=10,   # Arrow end y
-                axref='x',  # Use x-axis coordinates
-                ayref='y'   # Use y-axis coordinates
-            )
-        ]
-    )
+        # Plotting the data using Plotly
+        yr_svrt_fig = px.bar(accidents_per_year_severity, x='Year', y='Count', color='Severity', 
+                    title='Number of Accidents per Year by Severity',
+                    labels={'Year': 'Year', 'Count': 'Number of Accidents', 'Severity': 'Severity'},
+                    category_orders={'Severity': severity_order},
+                    barmode='group')
+
+
+        # Add a line chart on top of the bar chart
+        yr_svrt_fig.add_trace(go.Scatter(x=accidents_per_year['Year'], 
+                                y=accidents_per_year['Total_Count'],
+                                mode='lines+markers', 
+                                name='Total Accidents', 
+                                line=dict(color='green', dash = 'dashdot', width = 2)
+                                ))
+
+
+        # Display the plot in Streamlit
+        chart(yr_svrt_fig)
+
+        # 趋势图：按天的稠密计数数组做 rollup，粒度 / 日期范围只重跑这个 fragment
+        trend_section(selected_code)
+
+
+    with col2:
+        # weekday / hour 都从 state x year x weekday x hour x severity 矩阵切出来
+        accidents_per_weekday = weekday_counts(selected_code)
+        accidents_per_hr = hour_counts(selected_code)
+
+
+        wkdy_barfig = px.bar(accidents_per_weekday,
+                            x = 'Day of Week',
+                            y = 'Total_Count',
+                            color= 'Day of Week',
+                            category_orders={'Day of Week': weekday_order},
+                            title='Accidents by Day of Week',
+                            labels={'Day of Week': 'Day of Week', 'Total_Count': 'Number of Accidents'})
+        wkdy_barfig.update_layout(showlegend=False)
+        chart(wkdy_barfig)
+
+        hour_barfig = px.bar(accidents_per_hr,
+                             x = 'Hour',
+                             y = 'Total_Count',
+                             title = 'Accident by Hour',
+                             color='Hour',
+                             color_continuous_scale='Tealgrn')
+    
+        hour_barfig.update_layout(
+            annotations=[
+                dict(
+                    x=7,  # Text position x
+                    y=accidents_per_hr['Total_Count'].max() * 1.1,  # Text position y
+                    text="Morning Peak",
+                    showarrow=False,
+                    arrowhead=1
+                ),
+                dict(
+                    x=16,  # Text position x
+                    y=accidents_per_hr['Total_Count'].max() * 1.1,  # Text position y
+                    text="Evening Peak",
+                    showarrow=False,
+                    arrowhead=1
+                ),
+                dict(
+                    ax=4,  # Text position x
+                    ay=accidents_per_hr['Total_Count'].max() * 0.7,  # Text position y
+                    text="go to work",
+                    showarrow=True,
+                    arrowhead=2,
+                    x=6,  # Arrow end x
+                    y=10,  # Arrow end y
+                    axref='x',  # Use x-axis coordinates
+                    ayref='y'   # Use y-axis coordinates
+                ),
+                dict(
+                    ax=20,  # Text position x
+                    ay=accidents_per_hr['Total_Count'].max() * 0.7,  # Text position y
+                    text="get off work",
+                    showarrow=True,
+                    arrowhead=2,
+                    x=16,  # Arrow end x
+                    y=10,   # Arrow end y
+                    axref='x',  # Use x-axis coordinates
+                    ayref='y'   # Use y-axis coordinates
+                )
+            ]
+        )
 
-    hour_barfig.update_layout(
-        showlegend = False,
-        xaxis=dict(
-        tickmode='array',
-        ticktext=[f'{i:02d}:00' for i in range(24)],  # Format as HH:00
-        tickvals=list(range(24)),
-        title='Hour of Day'
-        ),
-        yaxis=dict(title='Number of Accidents')
-    )
+        hour_barfig.update_layout(
+            showlegend = False,
+            xaxis=dict(
+            tickmode='array',
+            ticktext=[f'{i:02d}:00' for i in range(24)],  # Format as HH:00
+            tickvals=list(range(24)),
+            title='Hour of Day'
+            ),
+            yaxis=dict(title='Number of Accidents')
+        )
 
-    st.plotly_chart(hour_barfig)
+        chart(hour_barfig)
 
+        hour_weekday = hour_weekday_counts(selected_code)
+        hour_weekday_fig = px.imshow(
+            hour_weekday,
+            labels={'x': 'Hour of Day', 'y': 'Day of Week', 'color': 'Accidents'},
+            title='Accidents by Hour and Day of Week',
+            color_continuous_scale='Tealgrn',
+            aspect='auto'
+        )
+        hour_weekday_fig.update_xaxes(tickmode='array', tickvals=list(range(0, 24, 3)),
+                                      ticktext=[f'{i:02d}:00' for i in range(0, 24, 3)])
+        chart(hour_weekday_fig)
+
+        severity_hour_fig = px.line(severity_hour_counts(selected_code),
+                                    x='Hour',
+                                    y='Count',
+                                    color='Severity',
+                                    category_orders={'Severity': severity_order},
+                                    title='Accidents by Hour and Severity',
+                                    labels={'Count': 'Number of Accidents', 'Hour': 'Hour of Day'},
+                                    markers=True)
+        chart(severity_hour_fig)
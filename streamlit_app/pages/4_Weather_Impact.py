@@ -1,192 +1,236 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
 from scipy.stats import gaussian_kde
-st.set_page_config(layout="wide")
-
-# Get data and weather columns
-S3_BASE = "s3://us-accidents-dashboard-1445/processed"
-
-severity_map = {
-    1: "Low",
-    2: "Medium",
-    3: "High",
-    4: "Critical"
-}
-
-@st.cache_data(ttl=3600)
-def load_table(name: str):
-    return pd.read_parquet(f"{S3_BASE}/{name}/")
-
-weather = load_table("weather_kde_sample")
-weather["Severity"] = weather["Severity"].map(severity_map) 
-
-
-# Filter data for top conditions and create severity distribution
-weather_severity = load_table("weather_severity_counts").rename(columns={"accident_count": "Count"})
-weather_severity["Severity"] = weather_severity["Severity"].map(severity_map)
-
-# Calculate total accidents per weather condition and overall percentage
-total_accidents = (
-    weather_severity.groupby("Weather_Condition", as_index=False)["Count"]
-    .sum()
-    .sort_values("Count", ascending=False)
+from table_store import prefetch_tables
+from views import (
+    weather_families, weather_family_raw_conditions, weather_family_severity, weather_samples, weather_top_conditions,
 )
-total_all = total_accidents["Count"].sum()
-total_accidents["Percentage"] = (total_accidents["Count"] / total_all * 100).round(1)
-
-
-top_conditions = total_accidents.head(15)["Weather_Condition"].tolist()
-
-st.title("Weather Impact Analysis")
-st.write("Analysis of how weather conditions affect accident frequency and severity.")
-
-# Create stacked bar plot with ordered categories
-weather_fig = px.bar(weather_severity,
-                    x='Weather_Condition',
-                    y='Count',
-                    color='Severity',
-                    title='Top 10 Weather Conditions by Severity',
-                    category_orders={
-                        'Severity': ['Critical', 'High', 'Medium', 'Low'],
-                        'Weather_Condition': top_conditions  # This sets the order
-                    },
-                    color_discrete_sequence=px.colors.qualitative.Set2)
-
-# Add percentage text on top of each stacked bar
-for weather_type in top_conditions:
-    total_pct = total_accidents[total_accidents['Weather_Condition'] == weather_type]['Percentage'].iloc[0]
-    weather_fig.add_annotation(
-        x=weather_type,
-        y=total_accidents[total_accidents['Weather_Condition'] == weather_type]['Count'].iloc[0],
-        text=f'{total_pct}%',
-        showarrow=False,
-        yshift=10,
-        font=dict(size=14, color='black') 
-    )
-
-# Update layout
-weather_fig.update_layout(
-    xaxis_title='Weather Condition',
-    yaxis_title='Number of Accidents',
-    xaxis_tickangle=45,
-    showlegend=True,
-    height=600,
-    width=1000,
-    legend_title_text='Severity'
-)
-
-st.plotly_chart(weather_fig, use_container_width=True)
-
+from weather_groups import UNKNOWN_FAMILY
+from cache_warmer import start_cache_warmer
+from figure_cache import cached_figure
+from rerun_stats import chart, timed_page, timed_section
+st.set_page_config(layout="wide")
+with timed_page("weather"):
 
-# Create KDE plots for each weather condition
-numerical_cols = ['Temperature(F)', 'Humidity(%)', 'Pressure(in)', 'Visibility(mi)', 'Wind_Speed(mph)', 'Precipitation(in)']
+    # Get data and weather columns
+    start_cache_warmer()
+    prefetch_tables(["weather_kde_sample", "weather_conditions", "weather_family_severity_counts", "weather_condition_severity_counts"])
 
-def remove_outliers(df, column):
-    q25 = df[column].quantile(0.25)
-    q75 = df[column].quantile(0.75)
-    iqr = q75 - q25
-    lower = q25 - 1.5 * iqr
-    upper = q75 + 1.5 * iqr
-    return df[(df[column] >= lower) & (df[column] <= upper)]
+    # 天气按 family（十几个）汇总，排名在 builder 里预先算好
+    families = weather_families()
+    family_names = dict(zip(families["family_code"].astype(int), families["Family"]))
+    known_families = [f for f in family_names if f != UNKNOWN_FAMILY]
+    severity_order = ['Critical', 'High', 'Medium', 'Low']
 
-def create_kde_plot(data, column):
-    # Skip outlier removal for Visibility and Precipitation
-    if column not in ['Visibility(mi)', 'Precipitation(in)']:
-        data_clean = remove_outliers(data, column)
-    else:
-        data_clean = data
+    st.title("Weather Impact Analysis")
+    st.write("Analysis of how weather conditions affect accident frequency and severity.")
+
+
+    def weather_family_bar(selected):
+        # figure cache 的 builder 只能依赖参数和按 epoch 缓存的 views，不读页面全局变量
+        family_severity = weather_family_severity(selected)
+        all_families = weather_families()
+        totals = all_families[all_families["family_code"].isin(selected)]
+        fig = px.bar(family_severity,
+                     x='Family',
+                     y='Count',
+                     color='Severity',
+                     title='Accidents by Weather Family and Severity',
+                     category_orders={
+                         'Severity': severity_order,
+                         'Family': totals["Family"].tolist()  # builder 的 rank 顺序
+                     },
+                     color_discrete_sequence=px.colors.qualitative.Set2)
+
+        # Add percentage text on top of each stacked bar
+        for _, row in totals.iterrows():
+            fig.add_annotation(
+                x=row["Family"],
+                y=row["Count"],
+                text=f'{row["Percentage"]}%',
+                showarrow=False,
+                yshift=10,
+                font=dict(size=14, color='black')
+            )
+
+        fig.update_layout(
+            xaxis_title='Weather Family',
+            yaxis_title='Number of Accidents',
+            xaxis_tickangle=45,
+            showlegend=True,
+            height=600,
+            width=1000,
+            legend_title_text='Severity'
+        )
+        return fig
+
+
+    def weather_condition_bar(selected, top_n):
+        conditions = weather_top_conditions(selected, top_n)
+        fig = px.bar(conditions,
+                     x='Condition',
+                     y='Count',
+                     color='Severity',
+                     hover_data=['Family'],
+                     title=f'Top {top_n} Conditions per Weather Family',
+                     category_orders={
+                         'Severity': severity_order,
+                         'Condition': conditions["Condition"].unique().tolist()
+                     },
+                     color_discrete_sequence=px.colors.qualitative.Set2)
+        fig.update_layout(
+            xaxis_title='Weather Condition',
+            yaxis_title='Number of Accidents',
+            xaxis_tickangle=45,
+            height=500,
+            legend_title_text='Severity'
+        )
+        return fig
+
+
+    # family 过滤只影响两张柱状图：作为 fragment 单独重跑
+    @st.fragment
+    def weather_family_section():
+        with timed_section("weather", "weather_families"):
+            c1, c2 = st.columns([4, 1])
+            selected = c1.multiselect(
+                "Weather Families",
+                options=list(family_names),
+                default=known_families,
+                format_func=family_names.get,
+                key="weather_families"
+            )
+            top_n = c2.slider("Conditions per family", 1, 10, 3, key="weather_top_n")
+            if not selected:
+                st.warning("Please select at least one weather family")
+                return
+            key = tuple(sorted(selected))
+            chart(cached_figure("weather", weather_family_bar, key), use_container_width=True)
+            chart(cached_figure("weather", weather_condition_bar, key, top_n), use_container_width=True)
+
+    weather_family_section()
+
+
+    # Create KDE plots for each weather condition
+    numerical_cols = ['Temperature(F)', 'Humidity(%)', 'Pressure(in)', 'Visibility(mi)', 'Wind_Speed(mph)', 'Precipitation(in)']
+
+    def remove_outliers(df, column):
+        q25 = df[column].quantile(0.25)
+        q75 = df[column].quantile(0.75)
+        iqr = q75 - q25
+        lower = q25 - 1.5 * iqr
+        upper = q75 + 1.5 * iqr
+        return df[(df[column] >= lower) & (df[column] <= upper)]
+
+    def create_kde_plot(data, column):
+        # Skip outlier removal for Visibility and Precipitation
+        if column not in ['Visibility(mi)', 'Precipitation(in)']:
+            data_clean = remove_outliers(data, column)
+        else:
+            data_clean = data
     
-    fig = go.Figure()
-    colors = px.colors.qualitative.Set2
-    severity_order = ['Critical', 'High', 'Medium', 'Low']
+        fig = go.Figure()
+        colors = px.colors.qualitative.Set2
+        severity_order = ['Critical', 'High', 'Medium', 'Low']
     
-    try:
-        for i, severity in enumerate(severity_order):
-            if severity not in data_clean["Severity"].unique():
-                continue
-            severity_data = data_clean[data_clean['Severity'] == severity][column].dropna()
-
-            MAX_KDE_POINTS = 2000
-            if len(severity_data) > MAX_KDE_POINTS:
-                severity_data = severity_data.sample(MAX_KDE_POINTS, random_state=42)
+        try:
+            for i, severity in enumerate(severity_order):
+                if severity not in data_clean["Severity"].unique():
+                    continue
+                severity_data = data_clean[data_clean['Severity'] == severity][column].dropna()
+
+                MAX_KDE_POINTS = 2000
+                if len(severity_data) > MAX_KDE_POINTS:
+                    severity_data = severity_data.sample(MAX_KDE_POINTS, random_state=42)
             
-            if len(severity_data.unique()) > 1:
-                kde = gaussian_kde(severity_data)
+                if len(severity_data.unique()) > 1:
+                    kde = gaussian_kde(severity_data)
                 
-                # Set different x_range for specific columns
-                if column == 'Precipitation(in)':
-                    x_range = np.linspace(0, 4, 200)
-                else:
-                    x_range = np.linspace(severity_data.min(), severity_data.max(), 200)
+                    # Set different x_range for specific columns
+                    if column == 'Precipitation(in)':
+                        x_range = np.linspace(0, 4, 200)
+                    else:
+                        x_range = np.linspace(severity_data.min(), severity_data.max(), 200)
                 
-                fig.add_trace(
-                    go.Scatter(
-                        x=x_range,
-                        y=kde(x_range),
-                        name=severity,
-                        mode='lines',
-                        line=dict(width=2, color=colors[i])
+                    fig.add_trace(
+                        go.Scatter(
+                            x=x_range,
+                            y=kde(x_range),
+                            name=severity,
+                            mode='lines',
+                            line=dict(width=2, color=colors[i])
+                        )
                     )
-                )
         
-        # Update layout with custom x-axis range
-        layout_dict = {
-            'title': f'Distribution of {column} by Severity',
-            'xaxis_title': column,
-            'yaxis_title': 'Density',
-            'width': 800,
-            'height': 400,
-            'showlegend': True,
-            'template': 'seaborn',
-            'legend_title_text': 'Severity'
-        }
+            # Update layout with custom x-axis range
+            layout_dict = {
+                'title': f'Distribution of {column} by Severity',
+                'xaxis_title': column,
+                'yaxis_title': 'Density',
+                'width': 800,
+                'height': 400,
+                'showlegend': True,
+                'template': 'seaborn',
+                'legend_title_text': 'Severity'
+            }
         
-        if column == 'Precipitation(in)':
-            layout_dict['xaxis'] = dict(range=[0, 4])
+            if column == 'Precipitation(in)':
+                layout_dict['xaxis'] = dict(range=[0, 4])
         
-        fig.update_layout(**layout_dict)
+            fig.update_layout(**layout_dict)
 
-    except np.linalg.LinAlgError:
-        st.warning(f"Could not compute KDE for {column}")
-        return None
+        except np.linalg.LinAlgError:
+            st.warning(f"Could not compute KDE for {column}")
+            return None
     
-    return fig
+        return fig
+
+    # Add "All" option to weather family list
+    ALL_FAMILIES = -1
+    family_options = [ALL_FAMILIES] + known_families
+
+    def weather_kde_plot(families_key, column):
+        """KDE plot for the selected weather families (None = all); data is only loaded on a figure cache miss."""
+        conditions = None if families_key is None else weather_family_raw_conditions(families_key)
+        return create_kde_plot(weather_samples(conditions), column)
+
+    # 天气 family 选择只影响 KDE 图：作为 fragment 单独重跑，不再重画上面的柱状图
+    @st.fragment
+    def weather_kde_section():
+        with timed_section("weather", "weather_kde"):
+            selected_families = st.multiselect(
+                "Select Weather Families",
+                options=family_options,
+                default=known_families[:5],
+                format_func=lambda f: "All Families" if f == ALL_FAMILIES else family_names[f],
+                key="weather_select"
+            )
+
+            if selected_families:
+                if ALL_FAMILIES in selected_families:
+                    families_key = None
+                else:
+                    families_key = tuple(sorted(selected_families))
 
-# Add "All" option to weather conditions list
-all_option = ["All Conditions"]
-condition_options = all_option + top_conditions
+                col1, col2, col3 = st.columns(3)
 
-selected_conditions = st.multiselect(
-    "Select Weather Conditions",
-    options=condition_options,
-    default=top_conditions[:5],  
-    key="weather_select"
-)
+                temp_fig = cached_figure("weather", weather_kde_plot, families_key, "Temperature(F)")
+                humid_fig = cached_figure("weather", weather_kde_plot, families_key, "Humidity(%)")
+                chart(temp_fig, col1, use_container_width=True)
+                chart(humid_fig, col1, use_container_width=True)
+
+                vis_fig = cached_figure("weather", weather_kde_plot, families_key, "Visibility(mi)")
+                precip_fig = cached_figure("weather", weather_kde_plot, families_key, "Precipitation(in)")
+                chart(vis_fig, col2, use_container_width=True)
+                chart(precip_fig, col2, use_container_width=True)
+
+                press_fig = cached_figure("weather", weather_kde_plot, families_key, "Pressure(in)")
+                wind_fig = cached_figure("weather", weather_kde_plot, families_key, "Wind_Speed(mph)")
+                chart(press_fig, col3, use_container_width=True)
+                chart(wind_fig, col3, use_container_width=True)
+            else:
+                st.warning("Please select at least one weather family")
 
-if selected_conditions:
-    if "All Conditions" in selected_conditions:
-        weather_filtered = weather
-    else:
-        weather_filtered = weather[weather["Weather_Condition"].isin(selected_conditions)]
-
-    col1, col2, col3 = st.columns(3)
-
-    temp_fig = create_kde_plot(weather_filtered, "Temperature(F)")
-    humid_fig = create_kde_plot(weather_filtered, "Humidity(%)")
-    col1.plotly_chart(temp_fig, use_container_width=True)
-    col1.plotly_chart(humid_fig, use_container_width=True)
-
-    vis_fig = create_kde_plot(weather_filtered, "Visibility(mi)")
-    precip_fig = create_kde_plot(weather_filtered, "Precipitation(in)")
-    col2.plotly_chart(vis_fig, use_container_width=True)
-    col2.plotly_chart(precip_fig, use_container_width=True)
-
-    press_fig = create_kde_plot(weather_filtered, "Pressure(in)")
-    wind_fig = create_kde_plot(weather_filtered, "Wind_Speed(mph)")
-    col3.plotly_chart(press_fig, use_container_width=True)
-    col3.plotly_chart(wind_fig, use_container_width=True)
-else:
-    st.warning("Please select at least one weather condition")
+    weather_kde_section()
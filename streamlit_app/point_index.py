@@ -0,0 +1,115 @@
+"""
+Radius and nearest-neighbour queries over every accident point.
+
+Points are sorted by their spatial_grid cell at INDEX_RES, keyed row-major
+(cell_y * n_x + cell_x), so the cells of one grid row inside a query box are a
+single contiguous slice of the sorted points: a radius query is one
+`searchsorted` per grid row plus a vectorized haversine over the candidates.
+k nearest = radius queries with a growing radius until k points are inside
+(every point closer than the k-th is then guaranteed to be found).
+
+Only depends on numpy / pandas.
+"""
+import numpy as np
+import pandas as pd
+
+from spatial_grid import MAX_RES, cell_size
+
+EARTH_RADIUS_MI = 3958.8
+INDEX_RES = MAX_RES  # ≈ 0.031° 的格子，2 英里半径大约覆盖 3x3 格
+POINT_COLUMNS = ["City", "State", "year", "hour", "Severity", "Start_Lat", "Start_Lng"]
+
+
+def haversine_mi(lat, lng, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    """Great-circle distance in miles from (lat, lng) to every point."""
+    lat1, lng1 = np.radians(lat), np.radians(lng)
+    lat2, lng2 = np.radians(lats), np.radians(lngs)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MI * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class PointIndex:
+    def __init__(self, points: pd.DataFrame, res: int = INDEX_RES):
+        """points: POINT_COLUMNS (e.g. the accident_points table)."""
+        self.size = cell_size(res)
+        self.n_x = int(round(360.0 / self.size))
+        lat = points["Start_Lat"].to_numpy(np.float64)
+        lng = points["Start_Lng"].to_numpy(np.float64)
+        key = self.cell_key(lat, lng)
+        order = np.argsort(key, kind="stable")
+        self.keys = key[order]
+        self.lat, self.lng = lat[order], lng[order]
+        self.severity = points["Severity"].to_numpy(np.int8)[order]
+        self.hour = points["hour"].to_numpy(np.int8)[order]
+        self.points = points[POINT_COLUMNS].iloc[order].reset_index(drop=True)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _cell_x(self, lng):
+        return np.floor((np.asarray(lng) + 180.0) / self.size).astype(np.int64)
+
+    def _cell_y(self, lat):
+        return np.floor((np.asarray(lat) + 90.0) / self.size).astype(np.int64)
+
+    def cell_key(self, lat, lng) -> np.ndarray:
+        """Row-major key of the index cell containing each point."""
+        return self._cell_y(lat) * self.n_x + self._cell_x(lng)
+
+    def in_cells(self, keys: np.ndarray):
+        """(row ids, position in `keys`) of the points in each of the given cell keys."""
+        lo = np.searchsorted(self.keys, keys, side="left")
+        n = np.searchsorted(self.keys, keys, side="right") - lo
+        owner = np.repeat(np.arange(len(keys)), n)
+        return np.repeat(lo - np.cumsum(n) + n, n) + np.arange(n.sum()), owner
+
+    def _candidates(self, lat: float, lng: float, radius_mi: float) -> np.ndarray:
+        dlat = np.degrees(radius_mi / EARTH_RADIUS_MI)
+        dlng = dlat / max(np.cos(np.radians(min(abs(lat) + dlat, 89.9))), 1e-6)
+        y0, y1 = self._cell_y(lat - dlat), self._cell_y(lat + dlat)
+        x0, x1 = self._cell_x(max(lng - dlng, -180.0)), self._cell_x(min(lng + dlng, 180.0 - 1e-9))
+        rows = np.arange(y0, y1 + 1) * self.n_x
+        lo = np.searchsorted(self.keys, rows + x0, side="left")
+        hi = np.searchsorted(self.keys, rows + x1, side="right")
+        n = hi - lo
+        if n.sum() == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.repeat(lo - np.cumsum(n) + n, n) + np.arange(n.sum())
+
+    def within(self, lat: float, lng: float, radius_mi: float):
+        """(row ids, distances in miles) of every point within `radius_mi`, nearest first."""
+        idx = self._candidates(lat, lng, radius_mi)
+        dist = haversine_mi(lat, lng, self.lat[idx], self.lng[idx])
+        keep = dist <= radius_mi
+        idx, dist = idx[keep], dist[keep]
+        order = np.argsort(dist, kind="stable")
+        return idx[order], dist[order]
+
+    def nearest(self, lat: float, lng: float, k: int, start_radius_mi: float = 1.0):
+        """(row ids, distances in miles) of the k nearest points."""
+        radius = start_radius_mi
+        while True:
+            idx, dist = self.within(lat, lng, radius)
+            if len(idx) >= k or radius > 2 * EARTH_RADIUS_MI * np.pi:
+                return idx[:k], dist[:k]
+            radius *= 2
+
+    def query(self, lat: float, lng: float, radius_mi: float = None, k: int = None, limit: int = 5000) -> dict:
+        """
+        Radius query (`radius_mi`) or k-NN (`k`) around (lat, lng).
+        Returns {"count", "severity": {label: n}, "nearest_mi", "points": DataFrame with distance_mi}
+        with at most `limit` points, nearest first.
+        """
+        if k is not None:
+            idx, dist = self.nearest(lat, lng, k)
+        else:
+            idx, dist = self.within(lat, lng, radius_mi)
+        sev = np.bincount(self.severity[idx], minlength=5)
+        points = self.points.iloc[idx[:limit]].reset_index(drop=True)
+        points["distance_mi"] = dist[:limit]
+        return {
+            "count": int(len(idx)),
+            "severity": {"Critical": int(sev[4]), "High": int(sev[3]), "Medium": int(sev[2]), "Low": int(sev[1])},
+            "nearest_mi": float(dist[0]) if len(dist) else None,
+            "points": points,
+        }
@@ -0,0 +1,102 @@
+"""
+Rerun time / chart payload measurements per page section.
+
+Enabled with DASHBOARD_RERUN_STATS=1. Each `timed_section` records how long the
+section took and how many bytes of figure JSON it sent through `chart`, so a
+fragment rerun can be compared against a full page rerun.
+
+Each section writes a one-line caption of its own stats when it finishes, so
+fragment reruns refresh their numbers too. `timed_page` wraps a whole page
+script and draws the sidebar table once a full run completes.
+"""
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+
+ENABLED = os.environ.get("DASHBOARD_RERUN_STATS") == "1"
+
+_lock = threading.Lock()
+_stats = {}  # (page, section) -> {"runs", "last_s", "total_s", "last_bytes"}
+_current = contextvars.ContextVar("rerun_stats_section", default=None)
+
+
+def begin_section(page: str, section: str):
+    """Start timing a section; pass the returned handle to `end_section`."""
+    if not ENABLED:
+        return None
+    payload = [0]
+    token = _current.set(payload)
+    return (page, section, payload, token, time.perf_counter())
+
+
+def end_section(handle):
+    if handle is None:
+        return
+    page, section, payload, token, start = handle
+    elapsed = time.perf_counter() - start
+    _current.reset(token)
+    # 嵌套 section（整页里的 fragment）的 payload 也计入外层
+    parent = _current.get()
+    if parent is not None:
+        parent[0] += payload[0]
+    with _lock:
+        s = _stats.setdefault((page, section), {"runs": 0, "last_s": 0.0, "total_s": 0.0, "last_bytes": 0})
+        s["runs"] += 1
+        s["last_s"] = elapsed
+        s["total_s"] += elapsed
+        s["last_bytes"] = payload[0]
+
+
+@contextmanager
+def timed_section(page: str, section: str):
+    handle = begin_section(page, section)
+    try:
+        yield
+    finally:
+        end_section(handle)
+    # 写在 section 自己的容器里，fragment 重跑时也会刷新
+    if handle is not None:
+        row = _stat_row(section, get_stats()[(page, section)])
+        st.caption(f"{section}: {row['last_ms']} ms (avg {row['avg_ms']} ms, {row['runs']} runs), {row['last_kb']} KB")
+
+
+@contextmanager
+def timed_page(page: str):
+    """Time a whole page run; the timer is closed even if the script stops early."""
+    handle = begin_section(page, "page")
+    try:
+        yield
+    finally:
+        end_section(handle)
+    show_stats(page)
+
+
+def chart(fig, container=None, **kwargs):
+    """st.plotly_chart (or container.plotly_chart) that also counts the figure JSON toward the current section."""
+    payload = _current.get()
+    if payload is not None and fig is not None:
+        payload[0] += len(fig.to_json())
+    (container or st).plotly_chart(fig, **kwargs)
+
+
+def get_stats() -> dict:
+    with _lock:
+        return {k: dict(v) for k, v in _stats.items()}
+
+
+def _stat_row(section: str, s: dict) -> dict:
+    return {"section": section, "runs": s["runs"], "last_ms": round(s["last_s"] * 1000, 1),
+            "avg_ms": round(s["total_s"] / s["runs"] * 1000, 1), "last_kb": round(s["last_bytes"] / 1024, 1)}
+
+
+def show_stats(page: str):
+    """Sidebar table of this page's section stats (only when enabled)."""
+    if not ENABLED:
+        return
+    rows = [_stat_row(section, s) for (p, section), s in get_stats().items() if p == page]
+    with st.sidebar.expander("Rerun stats"):
+        st.dataframe(rows, hide_index=True)
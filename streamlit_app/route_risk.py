@@ -0,0 +1,132 @@
+"""
+Historical accident risk along a route (polyline of lat / lng vertices).
+
+A route is buffered by `buffer_mi` and scored against point_index.PointIndex:
+
+  1. every segment is sampled at half-cell spacing and the (index cell,
+     segment) pairs within the buffer of each sample are collected (one
+     vectorized pass per route),
+  2. the points of each cell become (point, segment) candidate pairs,
+  3. point-to-segment distances are computed for all pairs at once in a local
+     equirectangular plane (miles); each point within the buffer counts once,
+     for its nearest segment.
+
+Per segment: length, accident count, count per mile, severity mix and a
+24-hour profile. `score_routes` runs many routes on a thread pool (the heavy
+parts are NumPy calls that release the GIL), sharing one index.
+
+Only depends on numpy / pandas.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from point_index import EARTH_RADIUS_MI, PointIndex
+
+SEVERITY_LABELS = {4: "Critical", 3: "High", 2: "Medium", 1: "Low"}
+MAX_ROUTE_WORKERS = 8
+MILES_PER_DEG = np.radians(1.0) * EARTH_RADIUS_MI
+
+
+def _route_cells(index: PointIndex, lat: np.ndarray, lng: np.ndarray, buffer_mi: float):
+    """Unique (cell key, segment) pairs with the cell within `buffer_mi` of the segment."""
+    # 沿每段按半个格子的间距取样，再向四周扩展 buffer 覆盖的格子数
+    step = index.size / 2
+    n_seg = len(lat) - 1
+    seg_deg = np.hypot(np.diff(lat), np.diff(lng))
+    n_samples = np.maximum(1, np.ceil(seg_deg / step).astype(np.int64)) + 1
+    seg = np.repeat(np.arange(n_seg), n_samples)
+    t = np.arange(len(seg)) - np.repeat(np.cumsum(n_samples) - n_samples, n_samples)
+    t = t / (n_samples[seg] - 1)
+    s_lat = lat[seg] + t * (lat[seg + 1] - lat[seg])
+    s_lng = lng[seg] + t * (lng[seg + 1] - lng[seg])
+
+    buffer_deg = buffer_mi / MILES_PER_DEG
+    ry = int(np.ceil(buffer_deg / index.size)) + 1
+    rx = int(np.ceil(buffer_deg / np.cos(np.radians(min(np.abs(lat).max() + buffer_deg, 89.9))) / index.size)) + 1
+    dy, dx = np.meshgrid(np.arange(-ry, ry + 1), np.arange(-rx, rx + 1), indexing="ij")
+    keys = index.cell_key(s_lat, s_lng)[:, None] + (dy * index.n_x + dx).ravel()[None, :]
+    pairs = np.unique(keys * n_seg + seg[:, None])
+    return pairs // n_seg, pairs % n_seg
+
+
+def score_route(index: PointIndex, route, buffer_mi: float = 0.25) -> pd.DataFrame:
+    """
+    route: [(lat, lng), ...] with at least two vertices.
+    Returns one row per segment: segment, start_lat, start_lng, end_lat, end_lng,
+    length_mi, Count, per_mile, Critical, High, Medium, Low, hours (24 counts).
+    """
+    route = np.asarray(route, dtype=np.float64)
+    if route.ndim != 2 or len(route) < 2:
+        raise ValueError("a route needs at least two (lat, lng) vertices")
+    lat, lng = route[:, 0], route[:, 1]
+    n_seg = len(route) - 1
+
+    # 以路线平均纬度做等距投影，单位英里
+    cos0 = np.cos(np.radians(lat.mean()))
+    ax, ay = lng[:-1] * cos0 * MILES_PER_DEG, lat[:-1] * MILES_PER_DEG
+    bx, by = lng[1:] * cos0 * MILES_PER_DEG, lat[1:] * MILES_PER_DEG
+    dx, dy = bx - ax, by - ay
+    len2 = np.maximum(dx * dx + dy * dy, 1e-12)
+
+    cell_keys, cell_seg = _route_cells(index, lat, lng, buffer_mi)
+    pts, owner = index.in_cells(cell_keys)
+    seg = cell_seg[owner]
+    px, py = index.lng[pts] * cos0 * MILES_PER_DEG, index.lat[pts] * MILES_PER_DEG
+    t = np.clip(((px - ax[seg]) * dx[seg] + (py - ay[seg]) * dy[seg]) / len2[seg], 0.0, 1.0)
+    d2 = (px - ax[seg] - t * dx[seg]) ** 2 + (py - ay[seg] - t * dy[seg]) ** 2
+
+    # 在 buffer 内的点只算一次：按 (point, 距离) 排序，取每个点最近的段
+    hit = d2 <= buffer_mi * buffer_mi
+    pts, seg, d2 = pts[hit], seg[hit], d2[hit]
+    order = np.lexsort((d2, pts))
+    first = order[np.r_[True, pts[order][1:] != pts[order][:-1]]] if len(order) else order
+    pts, seg = pts[first], seg[first]
+
+    counts = np.bincount(seg, minlength=n_seg)
+    sev = np.bincount(seg * 5 + index.severity[pts], minlength=n_seg * 5).reshape(n_seg, 5)
+    hours = np.bincount(seg * 24 + index.hour[pts], minlength=n_seg * 24).reshape(n_seg, 24)
+
+    length = np.sqrt(dx * dx + dy * dy)
+    out = pd.DataFrame({
+        "segment": np.arange(1, n_seg + 1),
+        "start_lat": lat[:-1], "start_lng": lng[:-1], "end_lat": lat[1:], "end_lng": lng[1:],
+        "length_mi": length,
+        "Count": counts,
+        "per_mile": counts / np.maximum(length, 1e-6),
+        **{label: sev[:, code] for code, label in SEVERITY_LABELS.items()},
+    })
+    out["hours"] = list(hours)
+    return out
+
+
+def route_summary(segments: pd.DataFrame) -> dict:
+    """Whole-route totals of a score_route result."""
+    length = float(segments["length_mi"].sum())
+    count = int(segments["Count"].sum())
+    return {
+        "length_mi": length,
+        "Count": count,
+        "per_mile": count / length if length > 0 else 0.0,
+        **{label: int(segments[label].sum()) for label in SEVERITY_LABELS.values()},
+        "hours": np.sum(np.stack(segments["hours"].to_numpy()), axis=0),
+    }
+
+
+def score_routes(index: PointIndex, routes: dict, buffer_mi: float = 0.25,
+                 max_workers: int = MAX_ROUTE_WORKERS) -> pd.DataFrame:
+    """
+    Score many routes ({route id: [(lat, lng), ...]}) concurrently.
+    Returns one summary row per route, riskiest (accidents per mile) first.
+    """
+    if not routes:
+        return pd.DataFrame()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(routes))) as pool:
+        futures = {rid: pool.submit(score_route, index, r, buffer_mi) for rid, r in routes.items()}
+        rows = []
+        for rid, fut in futures.items():
+            s = route_summary(fut.result())
+            s["peak_hour"] = int(np.argmax(s.pop("hours")))
+            rows.append({"route": rid, **s})
+    return pd.DataFrame(rows).sort_values("per_mile", ascending=False).reset_index(drop=True)
@@ -0,0 +1,27 @@
+"""
+Deterministic top-N sampling of the point tables.
+
+Every row of `accident_points` carries a stable pseudo-random `sample_priority`
+in [0, 1) (a hash of the accident ID, computed by the builder) and the table is
+stored sorted by it within each City. A sample is then "the first N matching
+rows", read straight from the Parquet file (views._priority_head): the same
+filter always returns the same points, a narrower filter returns a subset of a
+wider one, and no random draw happens on rerun. A stratified sample reads one
+head per stratum, sized by `quotas`.
+
+Only depends on numpy, so it can be used outside Streamlit as well.
+"""
+import numpy as np
+
+PRIORITY_COL = "sample_priority"
+
+
+def quotas(sizes: np.ndarray, n: int) -> np.ndarray:
+    """Split `n` over strata in proportion to their sizes (largest remainder method)."""
+    if sizes.sum() <= n:
+        return sizes
+    exact = sizes / sizes.sum() * n
+    out = np.floor(exact).astype(sizes.dtype)
+    rest = n - out.sum()
+    out[np.argsort(-(exact - out), kind="stable")[:rest]] += 1
+    return out
@@ -0,0 +1,52 @@
+"""
+Hierarchical square grid over lat/lng for the national density tables.
+
+Resolution `res` uses square cells of GRID_BASE_DEG / 2**res degrees, indexed by
+integer (cell_x, cell_y) counted from (-180, -90). Cells nest: the parent of
+(cell_x, cell_y) at `res` is (cell_x >> 1, cell_y >> 1) at `res - 1`, so the
+builder only assigns points to the finest resolution and derives the coarser
+ones by shifting.
+
+Only depends on numpy, so the Spark builder can import it as well.
+"""
+import numpy as np
+
+GRID_BASE_DEG = 4.0
+MIN_RES = 0
+MAX_RES = 7  # 4° / 2**7 ≈ 0.031°，约 3.5 km
+
+# 本土 48 州的大致范围：(min_lng, min_lat, max_lng, max_lat)
+CONTIGUOUS_US_BBOX = (-125.0, 24.0, -66.0, 50.0)
+
+
+def cell_size(res: int) -> float:
+    return GRID_BASE_DEG / (1 << res)
+
+
+def zoom_to_res(zoom: float) -> int:
+    """Grid resolution for a web-map zoom level (roughly 10-20 px per cell)."""
+    return int(min(MAX_RES, max(MIN_RES, round(zoom) - 1)))
+
+
+def cell_range(bbox, res: int):
+    """Inclusive (x0, y0, x1, y1) cell index range covering `bbox` at `res`."""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    size = cell_size(res)
+    return (
+        int(np.floor((min_lng + 180.0) / size)),
+        int(np.floor((min_lat + 90.0) / size)),
+        int(np.floor((max_lng + 180.0) / size)),
+        int(np.floor((max_lat + 90.0) / size)),
+    )
+
+
+def cell_centers(cell_x, cell_y, res: int):
+    """(lat, lng) arrays of the cell centers."""
+    size = cell_size(res)
+    lng = (np.asarray(cell_x, dtype=np.float64) + 0.5) * size - 180.0
+    lat = (np.asarray(cell_y, dtype=np.float64) + 0.5) * size - 90.0
+    return lat, lng
+
+
+def bbox_around(lat: float, lng: float, half_deg: float = 0.5):
+    return (lng - half_deg, lat - half_deg, lng + half_deg, lat + half_deg)
@@ -0,0 +1,255 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import fsspec
+import pandas as pd
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from arrow_bundle import open_bundle
+from point_index import POINT_COLUMNS, PointIndex
+from text_index import TextIndex
+
+# ACCIDENTS_DATA_BASE 指向本地目录（processed 前缀的一份拷贝）时，所有表、bundle、索引都从本地读
+S3_BASE = os.environ.get("ACCIDENTS_DATA_BASE", "s3://us-accidents-dashboard-1445/processed").rstrip("/")
+
+# builder 产出的 Arrow IPC bundle：所有小表打包成一个可 mmap 的文件
+BUNDLE_URL = f"{S3_BASE}/dashboard_bundle.arrow"
+# 部署时可以直接放一份本地 bundle；否则下载到临时目录，同一台机器的所有 worker 共用一份（OS page cache）
+BUNDLE_PATH = os.environ.get("ACCIDENTS_BUNDLE_PATH")
+DOWNLOADED_BUNDLE_PATH = os.path.join(tempfile.gettempdir(), "us_accidents_dashboard_bundle.arrow")
+
+# Description / Street 全文索引（同样是 Arrow bundle，见 text_index.py）
+TEXT_INDEX_URL = f"{S3_BASE}/text_index.arrow"
+TEXT_INDEX_PATH = os.environ.get("ACCIDENTS_TEXT_INDEX_PATH")
+DOWNLOADED_TEXT_INDEX_PATH = os.path.join(tempfile.gettempdir(), "us_accidents_text_index.arrow")
+
+# 缓存按 epoch 分桶：每 CACHE_TTL_SECONDS 换一个 epoch，cache warmer 在换桶前预先填好下一个 epoch，
+# 用户请求永远命中已预热的缓存。条目保留两个 epoch，保证换桶时旧桶仍可用。
+CACHE_TTL_SECONDS = 3600
+
+# Dashboard 读取的全部 processed 表（cache warmer 会全部预热）
+TABLES = [
+    "state_yearly_summary",
+    "severity_counts",
+    "state_yearquarter_severity_counts",
+    "weather_numeric_sample",
+    "city_year_counts_top200",
+    "state_quarter_counts",
+    "accidents_by_year_severity",
+    "accidents_by_year_total",
+    "state_year_severity_counts",
+    "state_year_total_counts",
+    "daily_counts",
+    "anomalies",
+    "temporal_matrix",
+    "weather_kde_sample",
+    "weather_severity_counts",
+    "weather_conditions",
+    "weather_family_severity_counts",
+    "weather_condition_severity_counts",
+    "county_severity_counts",
+    "county_year_severity_counts",
+    "grid_severity_year_counts",
+    "street_rankings",
+    "hotspots",
+    "impact_histograms",
+    "road_feature_counts",
+]
+
+# Parquet 解码和 S3 I/O 都会释放 GIL，线程池足够
+MAX_PREFETCH_WORKERS = 8
+
+# 最近一次加载耗时（秒），按表名记录；"__total__" 为整批 wall time
+LOAD_TIMINGS = {}
+
+# load_table 调用次数 / 实际读取次数（cache miss），load test 用来算命中率
+_stats_lock = threading.Lock()
+LOAD_STATS = {"calls": 0, "misses": 0}
+
+
+def current_epoch() -> int:
+    """Index of the cache bucket that user requests read from right now."""
+    return int(time.time() // CACHE_TTL_SECONDS)
+
+
+def fetch_to_local(url: str, path: str):
+    """Download `url` to `path` unless another worker already fetched it this epoch."""
+    if os.path.exists(path) and time.time() - os.path.getmtime(path) < CACHE_TTL_SECONDS:
+        return
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with fsspec.open(url, "rb") as src, open(tmp, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    # 原子替换：其它 worker 已经 mmap 的旧文件不受影响
+    os.replace(tmp, path)
+
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _open_bundle(epoch: int) -> dict:
+    """{name: pyarrow Table} mapped from the bundle, or {} to fall back to Parquet."""
+    try:
+        path = BUNDLE_PATH
+        if path is None:
+            path = DOWNLOADED_BUNDLE_PATH
+            fetch_to_local(BUNDLE_URL, path)
+        return open_bundle(path)
+    except (OSError, ValueError) as e:
+        print(f"[table_store] Arrow bundle unavailable, reading Parquet instead: {e!r}")
+        return {}
+
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def open_text_index(epoch: int):
+    """The mapped full-text index (text_index.TextIndex), or None when it is unavailable."""
+    try:
+        path = TEXT_INDEX_PATH
+        if path is None:
+            path = DOWNLOADED_TEXT_INDEX_PATH
+            fetch_to_local(TEXT_INDEX_URL, path)
+        return TextIndex(open_bundle(path))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[table_store] text index unavailable: {e!r}")
+        return None
+
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def open_point_index(epoch: int) -> PointIndex:
+    """Grid index over every accident point (point_index.PointIndex), built once per epoch and process."""
+    # 直接读 POINT_COLUMNS，不经过 load_table 的 st.cache_data（避免整表 pickle 副本）
+    return PointIndex(read_columns("accident_points", POINT_COLUMNS, epoch))
+
+
+@st.cache_data(ttl=2 * CACHE_TTL_SECONDS, show_spinner=False)
+def _load_table(name: str, epoch: int, filters=None) -> pd.DataFrame:
+    with _stats_lock:
+        LOAD_STATS["misses"] += 1
+    bundle = _open_bundle(epoch)
+    if name in bundle:
+        tbl = bundle[name]
+        if filters:
+            tbl = tbl.filter(pq.filters_to_expression(list(filters)))
+        return tbl.to_pandas()
+
+    # filters 交给 pyarrow：按 State 分区的表直接跳过无关目录，其余表按 row-group 统计信息裁剪
+    return pd.read_parquet(f"{S3_BASE}/{name}/", filters=list(filters) if filters else None)
+
+
+def load_table(name: str, epoch: int = None, filters=None) -> pd.DataFrame:
+    """
+    Load a processed table into a Pandas DataFrame, from the mapped Arrow bundle
+    when it contains the table, otherwise from its Parquet directory on S3.
+
+    `filters` uses the pyarrow syntax, e.g. [("State", "=", "CA"), ("year", ">=", 2020)],
+    and is pushed down into the Parquet read.
+    """
+    filters = tuple(tuple(f) for f in filters) if filters else None
+    with _stats_lock:
+        LOAD_STATS["calls"] += 1
+    return _load_table(name, current_epoch() if epoch is None else epoch, filters)
+
+
+def _dataset(name: str) -> ds.Dataset:
+    fs, path = fsspec.core.url_to_fs(f"{S3_BASE}/{name}/")
+    return ds.dataset(path, filesystem=fs, format="parquet")
+
+
+def read_columns(name: str, columns, epoch: int = None) -> pd.DataFrame:
+    """`columns` of a whole table straight from the bundle / Parquet, without the `load_table` cache."""
+    bundle = _open_bundle(current_epoch() if epoch is None else epoch)
+    if name in bundle:
+        return bundle[name].select(list(columns)).to_pandas()
+    return _dataset(name).to_table(columns=list(columns)).to_pandas()
+
+
+def head_rows(name: str, n: int, columns=None, filters=None, epoch: int = None) -> pd.DataFrame:
+    """
+    The first `n` rows matching `filters`, in storage order, read straight from
+    the bundle / Parquet without going through the `load_table` cache.
+
+    For the large point tables: they are stored sorted by sample_priority within
+    each City, so the scan stops after the first `n` matches instead of loading
+    the whole filtered slice. Cache the result in the calling view.
+    """
+    expr = pq.filters_to_expression(list(filters)) if filters else None
+    bundle = _open_bundle(current_epoch() if epoch is None else epoch)
+    if name in bundle:
+        tbl = bundle[name]
+        if expr is not None:
+            tbl = tbl.filter(expr)
+        return tbl.slice(0, n).select(columns or tbl.column_names).to_pandas()
+    return _dataset(name).head(n, columns=columns, filter=expr).to_pandas()
+
+
+def count_rows(name: str, filters=None, epoch: int = None) -> int:
+    """Number of rows matching `filters` (only the filter columns are read)."""
+    expr = pq.filters_to_expression(list(filters)) if filters else None
+    bundle = _open_bundle(current_epoch() if epoch is None else epoch)
+    if name in bundle:
+        tbl = bundle[name]
+        return tbl.num_rows if expr is None else tbl.filter(expr).num_rows
+    return _dataset(name).count_rows(filter=expr)
+
+
+def state_filters(state: str = None, years=None, year_col: str = "year"):
+    """
+    Build pushdown filters for the per-state tables.
+
+    state: state code ("CA") or None for all states
+    years: (first_year, last_year) inclusive, or None for all years
+    """
+    filters = []
+    if state is not None:
+        filters.append(("State", "=", state))
+    if years is not None:
+        filters.append((year_col, ">=", int(years[0])))
+        filters.append((year_col, "<=", int(years[1])))
+    return filters or None
+
+
+def _timed_load(name: str, epoch: int, filters, ctx) -> pd.DataFrame:
+    # worker 线程默认没有 ScriptRunContext，挂上当前页面的 ctx
+    if ctx is not None:
+        add_script_run_ctx(ctx=ctx)
+    start = time.perf_counter()
+    df = load_table(name, epoch, filters)
+    LOAD_TIMINGS[name] = time.perf_counter() - start
+    return df
+
+
+def prefetch_tables(names, max_workers: int = MAX_PREFETCH_WORKERS, epoch: int = None, filters=None) -> dict:
+    """
+    Load several tables concurrently and return {name: DataFrame} once all are ready.
+
+    Results go through the shared `load_table` cache, so later `load_table(name)`
+    calls on the same page (with the same `filters`) are cache hits.
+    """
+    names = list(dict.fromkeys(names))  # 去重并保持顺序
+    if not names:
+        return {}
+
+    if epoch is None:
+        epoch = current_epoch()
+    ctx = get_script_run_ctx(suppress_warning=True)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(names))) as pool:
+        futures = {name: pool.submit(_timed_load, name, epoch, filters, ctx) for name in names}
+        tables = {name: fut.result() for name, fut in futures.items()}
+    LOAD_TIMINGS["__total__"] = time.perf_counter() - start
+    return tables
+
+
+def get_load_timings() -> dict:
+    """Per-table load seconds from the most recent loads."""
+    return dict(LOAD_TIMINGS)
+
+
+def load_stats() -> dict:
+    """load_table calls and cache misses since the process started."""
+    with _stats_lock:
+        return dict(LOAD_STATS)
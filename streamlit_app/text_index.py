@@ -0,0 +1,199 @@
+"""
+Inverted index over the accident `Description` and `Street` text.
+
+Built offline by the Spark builder (tokenizing and posting lists run in
+Spark, see `term_postings`) and shipped as one Arrow bundle
+(text_index.arrow, see arrow_bundle.py) with three tables:
+
+    text_docs      one row per accident (State, City, Street, Severity, year,
+                   Start_Lat, Start_Lng), ordered by sample_priority, so the
+                   first N matches of any query are a deterministic sample
+    text_terms     term, doc_count, offset / length into the postings blob,
+                   per-severity counts (Low..Critical) and per-state counts
+    text_postings  a single binary value: every posting list, row ids delta +
+                   varint encoded, concatenated in term order
+
+Queries are AND over the query terms: posting lists are decoded with NumPy and
+intersected, counts come from the precomputed term stats (single term) or from
+a bincount over the matching rows.
+
+Only depends on numpy / pandas / pyarrow, so the builder can import it as well.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# 保留 I-405、US-101 这种带连字符的词
+TOKEN_RE = r"[a-z0-9]+(?:-[a-z0-9]+)*"
+SEVERITY_COLUMNS = ["Low", "Medium", "High", "Critical"]
+DOC_COLUMNS = ["State", "City", "Street", "Severity", "year", "Start_Lat", "Start_Lng"]
+
+
+def tokenize(text: str) -> list:
+    return sorted(set(re.findall(TOKEN_RE, text.lower())))
+
+
+# -------------------------
+# varint codec (vectorized)
+# -------------------------
+def varint_lengths(values: np.ndarray) -> np.ndarray:
+    v = values.astype(np.uint64)
+    return 1 + sum((v >= (1 << (7 * k))).astype(np.int64) for k in range(1, 5))
+
+
+def encode_varints(values: np.ndarray) -> np.ndarray:
+    """uint32 values -> uint8 LEB128 bytes, concatenated."""
+    v = values.astype(np.uint64)
+    nbytes = varint_lengths(v)
+    starts = np.concatenate(([0], np.cumsum(nbytes)[:-1]))
+    out = np.zeros(int(nbytes.sum()), dtype=np.uint8)
+    for k in range(5):
+        has = nbytes > k
+        byte = (v[has] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (nbytes[has] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[has] + k] = (byte | more).astype(np.uint8)
+    return out
+
+
+def decode_varints(buf: np.ndarray) -> np.ndarray:
+    """uint8 LEB128 bytes -> uint64 values."""
+    if len(buf) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    ends = np.flatnonzero(buf < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    pos = np.arange(len(buf)) - np.repeat(starts, ends - starts + 1)
+    parts = (buf & 0x7F).astype(np.uint64) << (7 * pos).astype(np.uint64)
+    return np.add.reduceat(parts, starts)
+
+
+# -------------------------
+# build
+# -------------------------
+# applyInPandas 输出：每个词一行，posting list 已经在 executor 上编码好
+POSTINGS_SCHEMA = (
+    "term string, doc_count int, postings binary, "
+    + ", ".join(f"{c} int" for c in SEVERITY_COLUMNS)
+    + ", states array<string>, state_counts array<int>"
+)
+
+
+def term_postings(rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    applyInPandas body, grouped by term: the (term, doc_id, Severity, State)
+    rows of one term, one per matching document -> one POSTINGS_SCHEMA row.
+    """
+    ids = np.sort(rows["doc_id"].to_numpy(dtype=np.int64))
+    deltas = np.diff(ids, prepend=0)  # 第一个 row id 存绝对值
+    sev = np.bincount(rows["Severity"].to_numpy(dtype=np.int64) - 1, minlength=4)
+    states = rows["State"].astype(str).value_counts().sort_index()
+    return pd.DataFrame({
+        "term": [rows["term"].iloc[0]],
+        "doc_count": [len(ids)],
+        "postings": [encode_varints(deltas).tobytes()],
+        **{c: [int(sev[i])] for i, c in enumerate(SEVERITY_COLUMNS)},
+        "states": [states.index.tolist()],
+        "state_counts": [states.to_numpy(dtype=np.int32).tolist()],
+    })
+
+
+def index_tables(docs: pd.DataFrame, terms: pd.DataFrame) -> dict:
+    """
+    docs: DOC_COLUMNS in row-id order (sample_priority); terms: term_postings
+    rows sorted by term. Returns {table name: pyarrow Table} for
+    arrow_bundle.write_bundle.
+    """
+    lengths = terms["postings"].map(len).to_numpy(dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    term_table = pa.table({
+        "term": pa.array(terms["term"].tolist(), pa.string()),
+        "doc_count": pa.array(terms["doc_count"].to_numpy(dtype=np.int32)),
+        "offset": pa.array(offsets),
+        "length": pa.array(lengths.astype(np.int32)),
+        **{c: pa.array(terms[c].to_numpy(dtype=np.int32)) for c in SEVERITY_COLUMNS},
+        "states": pa.array([list(v) for v in terms["states"]], pa.list_(pa.string())),
+        "state_counts": pa.array([list(v) for v in terms["state_counts"]], pa.list_(pa.int32())),
+    })
+    return {
+        "text_docs": pa.Table.from_pandas(docs[DOC_COLUMNS], preserve_index=False),
+        "text_terms": term_table,
+        "text_postings": pa.table({"postings": pa.array([b"".join(terms["postings"])], pa.large_binary())}),
+    }
+
+
+# -------------------------
+# query
+# -------------------------
+class TextIndex:
+    def __init__(self, tables: dict):
+        self.docs = tables["text_docs"]
+        terms = tables["text_terms"]
+        self.terms = {t: i for i, t in enumerate(terms.column("term").to_pylist())}
+        self.term_stats = terms
+        self.offset = terms.column("offset").to_numpy()
+        self.length = terms.column("length").to_numpy()
+        # 直接引用 bundle 里的 buffer（mmap），不复制
+        self.blob = np.frombuffer(tables["text_postings"].column("postings")[0].as_buffer(), dtype=np.uint8)
+        self._doc_cache = {}
+
+    def _severity(self) -> np.ndarray:
+        if "Severity" not in self._doc_cache:
+            self._doc_cache["Severity"] = self.docs.column("Severity").to_numpy().astype(np.int64)
+        return self._doc_cache["Severity"]
+
+    def _states(self):
+        """(per-row state index, state labels) from the dictionary-encoded State column."""
+        if "State" not in self._doc_cache:
+            col = self.docs.column("State").combine_chunks()
+            if not pa.types.is_dictionary(col.type):
+                col = col.dictionary_encode()
+            self._doc_cache["State"] = (col.indices.to_numpy(), col.dictionary.to_pylist())
+        return self._doc_cache["State"]
+
+    def postings(self, term: str) -> np.ndarray:
+        """Sorted row ids (into text_docs) of the documents containing `term`."""
+        i = self.terms.get(term)
+        if i is None:
+            return np.zeros(0, dtype=np.int64)
+        start = int(self.offset[i])
+        return np.cumsum(decode_varints(self.blob[start:start + int(self.length[i])])).astype(np.int64)
+
+    def search(self, query: str, limit: int = 5000) -> dict:
+        """
+        AND query over the tokens of `query`.
+        Returns {"terms", "count", "severity": {label: n}, "states": {code: n}, "points": DataFrame}
+        with at most `limit` matching points (lowest sample_priority first).
+        """
+        tokens = tokenize(query)
+        result = {"terms": tokens, "count": 0, "severity": {}, "states": {}, "points": pd.DataFrame(columns=DOC_COLUMNS)}
+        if not tokens or any(t not in self.terms for t in tokens):
+            return result
+
+        # 从最短的 posting list 开始求交集
+        lists = sorted((self.postings(t) for t in tokens), key=len)
+        rows = lists[0]
+        for other in lists[1:]:
+            rows = rows[np.isin(rows, other, assume_unique=True)]
+            if len(rows) == 0:
+                return result
+
+        if len(tokens) == 1:
+            i = self.terms[tokens[0]]
+            severity = {c: int(self.term_stats.column(c)[i].as_py()) for c in SEVERITY_COLUMNS}
+            states = dict(zip(self.term_stats.column("states")[i].as_py(),
+                              self.term_stats.column("state_counts")[i].as_py()))
+        else:
+            sev = np.bincount(self._severity()[rows] - 1, minlength=4)
+            severity = dict(zip(SEVERITY_COLUMNS, sev.tolist()))
+            state_idx, labels = self._states()
+            counts = np.bincount(state_idx[rows], minlength=len(labels))
+            states = {labels[i]: int(c) for i, c in enumerate(counts) if c}
+
+        result.update(
+            count=int(len(rows)),
+            severity=severity,
+            states=dict(sorted(states.items(), key=lambda kv: -kv[1])),
+            points=self.docs.take(pa.array(rows[:limit])).to_pandas(),
+        )
+        return result
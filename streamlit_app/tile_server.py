@@ -0,0 +1,106 @@
+"""
+Local HTTP endpoint serving the accident vector tiles.
+
+Started once per Streamlit server process (st.cache_resource), like the cache
+warmer. Serves GET /<layer>/<z>/<x>/<y>.pbf out of the MBTiles file written by
+the builder (see vector_tiles.py), so the browser only downloads the tiles in
+view instead of every point being serialized into the page.
+
+TILE_SERVER_HOST / TILE_SERVER_PORT set the listening address (loopback only
+by default); TILE_SERVER_URL is the address browsers use to reach it (defaults
+to http://localhost:<port>, override it behind a proxy). TILE_SERVER_CORS_ORIGIN
+is the page origin allowed to fetch tiles (defaults to the local Streamlit app,
+empty = no CORS header). ACCIDENTS_MBTILES_PATH points at a local MBTiles file
+instead of the S3 copy.
+"""
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import streamlit as st
+from streamlit import config
+
+from table_store import S3_BASE, fetch_to_local
+from vector_tiles import LAYER_NAME, MAX_ZOOM, MIN_ZOOM, read_tile
+
+MBTILES_URL = f"{S3_BASE}/accident_points.mbtiles"
+MBTILES_PATH = os.environ.get("ACCIDENTS_MBTILES_PATH")
+DOWNLOADED_MBTILES_PATH = os.path.join(tempfile.gettempdir(), "us_accidents_points.mbtiles")
+
+TILE_SERVER_HOST = os.environ.get("TILE_SERVER_HOST", "127.0.0.1")
+TILE_SERVER_PORT = int(os.environ.get("TILE_SERVER_PORT", "8765"))
+TILE_SERVER_URL = os.environ.get("TILE_SERVER_URL", f"http://localhost:{TILE_SERVER_PORT}").rstrip("/")
+
+# 只允许 dashboard 页面跨域取 tile，不用通配符
+TILE_SERVER_CORS_ORIGIN = os.environ.get(
+    "TILE_SERVER_CORS_ORIGIN", f"http://localhost:{config.get_option('server.port')}"
+)
+
+_TILE_PATH = re.compile(rf"^/{LAYER_NAME}/(\d+)/(\d+)/(\d+)\.pbf$")
+
+
+def mbtiles_path() -> str:
+    return MBTILES_PATH or DOWNLOADED_MBTILES_PATH
+
+
+def refresh_tiles():
+    """Fetch the MBTiles file from S3 if the local copy is missing or older than one cache epoch."""
+    if MBTILES_PATH is None:
+        fetch_to_local(MBTILES_URL, DOWNLOADED_MBTILES_PATH)
+
+
+def tile_url_template() -> str:
+    """XYZ URL template for map layers, e.g. plotly mapbox `layers=[{"source": [...]}]`."""
+    return f"{TILE_SERVER_URL}/{LAYER_NAME}/{{z}}/{{x}}/{{y}}.pbf"
+
+
+class _TileHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        m = _TILE_PATH.match(self.path.split("?", 1)[0])
+        if m is None:
+            self.send_error(404)
+            return
+        z, x, y = (int(g) for g in m.groups())
+        tile = None
+        if MIN_ZOOM <= z <= MAX_ZOOM:
+            # 每个请求单独打开：文件被 refresh_tiles 原子替换后自动读到新版本
+            conn = sqlite3.connect(f"file:{mbtiles_path()}?mode=ro", uri=True)
+            try:
+                tile = read_tile(conn, z, x, y)
+            finally:
+                conn.close()
+
+        self.send_response(200 if tile is not None else 204)
+        if TILE_SERVER_CORS_ORIGIN:
+            self.send_header("Access-Control-Allow-Origin", TILE_SERVER_CORS_ORIGIN)
+            self.send_header("Vary", "Origin")
+        self.send_header("Cache-Control", "public, max-age=3600")
+        if tile is not None:
+            self.send_header("Content-Type", "application/vnd.mapbox-vector-tile")
+            self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(tile)))
+        self.end_headers()
+        if tile is not None:
+            self.wfile.write(tile)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@st.cache_resource(show_spinner=False)
+def start_tile_server():
+    """Start the tile endpoint once per process; returns the server, or None if unavailable."""
+    try:
+        refresh_tiles()
+        server = ThreadingHTTPServer((TILE_SERVER_HOST, TILE_SERVER_PORT), _TileHandler)
+    except OSError as e:
+        # 端口被占用时通常是同机的另一个 worker 已经在服务
+        print(f"[tile_server] not started: {e!r}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="tile-server", daemon=True).start()
+    print(f"[tile_server] serving {mbtiles_path()} on {TILE_SERVER_HOST}:{TILE_SERVER_PORT}")
+    return server
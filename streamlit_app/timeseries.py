@@ -0,0 +1,106 @@
+"""
+Daily accident counts as dense arrays indexed by day number, with calendar
+rollups, moving averages and year-over-year deltas computed from cumulative
+sums (no per-row date strings).
+
+`DailyCounts` wraps the builder's `daily_counts` table: one int32 series per
+(State, Severity), all starting on the same `first_day`. Any date range or
+period total is a difference of two prefix sums.
+
+Only depends on numpy / pandas.
+"""
+import numpy as np
+import pandas as pd
+
+# rollup 频率 -> 每年的周期数（用于同比）
+PERIODS_PER_YEAR = {"D": 364, "W": 52, "M": 12, "Q": 4, "Y": 1}
+
+
+class DailyCounts:
+    def __init__(self, counts: np.ndarray, first_day, states, severities):
+        self.counts = counts                      # (n_series, n_days) int32
+        self.first_day = np.datetime64(pd.Timestamp(first_day).date(), "D")
+        self.states = np.asarray(states)          # 每个 series 的州代码
+        self.severities = np.asarray(severities)  # 每个 series 的 severity（1..4）
+
+    @classmethod
+    def from_table(cls, df: pd.DataFrame) -> "DailyCounts":
+        """Build from the daily_counts table (State, Severity, first_day, counts)."""
+        return cls(
+            np.stack(df["counts"].to_numpy()).astype(np.int32),
+            df["first_day"].iloc[0],
+            df["State"].astype(str).to_numpy(),
+            df["Severity"].astype(int).to_numpy(),
+        )
+
+    @property
+    def days(self) -> np.ndarray:
+        return self.first_day + np.arange(self.counts.shape[1])
+
+    def day_index(self, date) -> int:
+        return int((np.datetime64(pd.Timestamp(date).date(), "D") - self.first_day).astype(int))
+
+    def series(self, state=None, severities=None) -> np.ndarray:
+        """Daily totals (int64) over the matching series."""
+        mask = np.ones(len(self.states), dtype=bool)
+        if state is not None:
+            mask &= self.states == state
+        if severities is not None:
+            mask &= np.isin(self.severities, list(severities))
+        return self.counts[mask].sum(axis=0, dtype=np.int64)
+
+    def range_total(self, state=None, start=None, end=None, severities=None) -> int:
+        """Total count over the inclusive date range [start, end]."""
+        cs = np.concatenate(([0], np.cumsum(self.series(state, severities))))
+        lo = 0 if start is None else max(0, self.day_index(start))
+        hi = len(cs) - 1 if end is None else min(len(cs) - 1, self.day_index(end) + 1)
+        return int(cs[hi] - cs[lo]) if hi > lo else 0
+
+
+def period_starts(days: np.ndarray, freq: str) -> np.ndarray:
+    """datetime64[D] start of the period each day falls in."""
+    if freq == "D":
+        return days
+    if freq == "W":
+        # 1970-01-01 是星期四：+3 天后按 7 取整得到周一
+        return ((days.astype(np.int64) + 3) // 7 * 7 - 3).astype("datetime64[D]")
+    if freq == "M":
+        return days.astype("datetime64[M]").astype("datetime64[D]")
+    if freq == "Q":
+        months = days.astype("datetime64[M]").astype(np.int64)
+        return (months - months % 3).astype("datetime64[M]").astype("datetime64[D]")
+    if freq == "Y":
+        return days.astype("datetime64[Y]").astype("datetime64[D]")
+    raise ValueError(f"unknown frequency {freq!r}")
+
+
+def rollup(daily: np.ndarray, days: np.ndarray, freq: str = "M") -> pd.DataFrame:
+    """Period totals of a daily series: Date (period start), Count."""
+    starts = period_starts(days, freq)
+    # days 递增，period 起点也递增：找每段的边界，用前缀和差求和
+    edges = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1], True])
+    cs = np.concatenate(([0], np.cumsum(daily)))
+    return pd.DataFrame({"Date": starts[edges[:-1]], "Count": cs[edges[1:]] - cs[edges[:-1]]})
+
+
+def moving_average(values: np.ndarray, window: int) -> np.ndarray:
+    """Trailing mean over `window` points (NaN until the window is full)."""
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    if window <= len(values):
+        cs = np.concatenate(([0.0], np.cumsum(values)))
+        out[window - 1:] = (cs[window:] - cs[:-window]) / window
+    return out
+
+
+def yoy_delta(values: np.ndarray, freq: str):
+    """(absolute, percent) change against the same period one year earlier."""
+    lag = PERIODS_PER_YEAR[freq]
+    values = np.asarray(values, dtype=np.float64)
+    prev = np.full(len(values), np.nan)
+    if lag < len(values):
+        prev[lag:] = values[:-lag]
+    delta = values - prev
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = np.where(prev > 0, delta / prev * 100, np.nan)
+    return delta, pct
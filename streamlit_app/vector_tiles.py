@@ -0,0 +1,203 @@
+"""
+Mapbox Vector Tiles (MVT) of accident points, stored in a single MBTiles file.
+
+Points are cut into Web Mercator tiles for every zoom in [MIN_ZOOM, MAX_ZOOM].
+A tile keeps at most MAX_FEATURES_PER_TILE points, chosen by lowest
+`sample_priority` (see sampler.py), so every point visible at zoom z is also
+visible at z + 1 and the thinning is stable between builds.
+
+The MVT protobuf is encoded by hand (points only) and MBTiles is plain SQLite,
+so this only depends on numpy / pandas and the standard library; the Spark
+builder imports it to write the file and tile_server.py to read it.
+"""
+import gzip
+import json
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+LAYER_NAME = "accidents"
+MIN_ZOOM = 3
+MAX_ZOOM = 12
+EXTENT = 4096
+MAX_FEATURES_PER_TILE = 4096
+MAX_LAT = 85.0511287798  # Web Mercator 的纬度上限
+
+
+# -------------------------
+# protobuf encoding
+# -------------------------
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def _zigzag(n: int) -> int:
+    return (n << 1) ^ (n >> 63)
+
+
+def _field(number: int, payload: bytes) -> bytes:
+    """Length-delimited field (wire type 2)."""
+    return _varint((number << 3) | 2) + _varint(len(payload)) + payload
+
+
+def _uint_field(number: int, value: int) -> bytes:
+    """Varint field (wire type 0)."""
+    return _varint(number << 3) + _varint(value)
+
+
+def _packed(values) -> bytes:
+    return b"".join(_varint(v) for v in values)
+
+
+def _value(v) -> bytes:
+    # Layer.Value: string_value = 1, uint_value = 5
+    if isinstance(v, str):
+        return _field(1, v.encode())
+    return _uint_field(5, int(v))
+
+
+def encode_tile(px: np.ndarray, py: np.ndarray, attrs: dict) -> bytes:
+    """
+    One MVT tile with a single point layer.
+
+    px, py: integer coordinates inside the tile, 0..EXTENT
+    attrs:  {key: array of str / non-negative int}, one entry per point
+    """
+    keys = list(attrs)
+    values, value_index = [], {}
+    features = []
+    for i in range(len(px)):
+        tags = []
+        for k, key in enumerate(keys):
+            v = attrs[key][i]
+            ident = (type(v) is str, v)
+            if ident not in value_index:
+                value_index[ident] = len(values)
+                values.append(v)
+            tags += (k, value_index[ident])
+        # MoveTo(1) = command 1 | count 1 << 3
+        geometry = (9, _zigzag(int(px[i])), _zigzag(int(py[i])))
+        features.append(
+            _field(2, _packed(tags))
+            + _uint_field(3, 1)  # GeomType.POINT
+            + _field(4, _packed(geometry))
+        )
+
+    layer = (
+        _uint_field(15, 2)
+        + _field(1, LAYER_NAME.encode())
+        + b"".join(_field(2, f) for f in features)
+        + b"".join(_field(3, k.encode()) for k in keys)
+        + b"".join(_field(4, _value(v)) for v in values)
+        + _uint_field(5, EXTENT)
+    )
+    return _field(3, layer)
+
+
+# -------------------------
+# tiling
+# -------------------------
+def _mercator(lat: np.ndarray, lng: np.ndarray):
+    """Normalized Web Mercator x, y in [0, 1) (y grows southwards)."""
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -MAX_LAT, MAX_LAT)
+    x = (np.asarray(lng, dtype=np.float64) + 180.0) / 360.0
+    s = np.sin(np.radians(lat))
+    y = 0.5 - np.log((1 + s) / (1 - s)) / (4 * np.pi)
+    return np.clip(x, 0, 1 - 1e-12), np.clip(y, 0, 1 - 1e-12)
+
+
+def iter_tiles(points: pd.DataFrame, zooms=range(MIN_ZOOM, MAX_ZOOM + 1)):
+    """
+    Yield (z, x, y, tile bytes) for every non-empty tile.
+
+    points: Start_Lat, Start_Lng, Severity, year, City, sample_priority
+    """
+    mx, my = _mercator(points["Start_Lat"].to_numpy(), points["Start_Lng"].to_numpy())
+    attrs = {
+        "severity": points["Severity"].astype(int).to_numpy(),
+        "year": points["year"].astype(int).to_numpy(),
+        "city": points["City"].astype(str).to_numpy(),
+    }
+    priority = points["sample_priority"].to_numpy()
+
+    for z in zooms:
+        n = 1 << z
+        gx, gy = mx * n, my * n
+        tx, ty = gx.astype(np.int64), gy.astype(np.int64)
+        tile_id = tx * n + ty
+        # 按 (tile, priority) 排序：每个 tile 的前 MAX_FEATURES_PER_TILE 个就是保留的点
+        order = np.lexsort((priority, tile_id))
+        tile_sorted = tile_id[order]
+        starts = np.flatnonzero(np.r_[True, tile_sorted[1:] != tile_sorted[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        for start, end in zip(starts, ends):
+            idx = order[start:min(end, start + MAX_FEATURES_PER_TILE)]
+            x, y = int(tx[idx[0]]), int(ty[idx[0]])
+            px = np.round((gx[idx] - x) * EXTENT).astype(np.int64)
+            py = np.round((gy[idx] - y) * EXTENT).astype(np.int64)
+            yield z, x, y, encode_tile(px, py, {k: v[idx] for k, v in attrs.items()})
+
+
+# -------------------------
+# MBTiles
+# -------------------------
+def write_mbtiles(points: pd.DataFrame, path: str, zooms=range(MIN_ZOOM, MAX_ZOOM + 1)) -> dict:
+    """Write all tiles of `points` into an MBTiles file at `path`; returns {zoom: tile count}."""
+    zooms = list(zooms)
+    counts = {z: 0 for z in zooms}
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript("""
+            DROP TABLE IF EXISTS metadata;
+            DROP TABLE IF EXISTS tiles;
+            CREATE TABLE metadata (name TEXT, value TEXT);
+            CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB);
+        """)
+        rows = []
+        for z, x, y, tile in iter_tiles(points, zooms):
+            # MBTiles 用 TMS 行号（y 轴向北）
+            rows.append((z, x, (1 << z) - 1 - y, gzip.compress(tile, compresslevel=6)))
+            counts[z] += 1
+            if len(rows) >= 10_000:
+                conn.executemany("INSERT INTO tiles VALUES (?, ?, ?, ?)", rows)
+                rows = []
+        conn.executemany("INSERT INTO tiles VALUES (?, ?, ?, ?)", rows)
+        conn.execute("CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)")
+
+        bounds = [
+            float(points["Start_Lng"].min()), float(points["Start_Lat"].min()),
+            float(points["Start_Lng"].max()), float(points["Start_Lat"].max()),
+        ]
+        metadata = {
+            "name": LAYER_NAME,
+            "format": "pbf",
+            "minzoom": str(min(zooms)),
+            "maxzoom": str(max(zooms)),
+            "bounds": ",".join(f"{b:.6f}" for b in bounds),
+            "json": json.dumps({"vector_layers": [{
+                "id": LAYER_NAME,
+                "fields": {"severity": "Number", "year": "Number", "city": "String"},
+                "minzoom": min(zooms),
+                "maxzoom": max(zooms),
+            }]}),
+        }
+        conn.executemany("INSERT INTO metadata VALUES (?, ?)", metadata.items())
+        conn.commit()
+    finally:
+        conn.close()
+    return counts
+
+
+def read_tile(conn: sqlite3.Connection, z: int, x: int, y: int):
+    """Gzipped tile bytes for XYZ tile (z, x, y), or None."""
+    row = conn.execute(
+        "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+        (z, x, (1 << z) - 1 - y),
+    ).fetchone()
+    return None if row is None else row[0]
@@ -0,0 +1,652 @@
+"""
+Cached page views built on top of `table_store`.
+
+Every view is cached per epoch (see `table_store.CACHE_TTL_SECONDS`) so that the
+cache warmer can compute the default views of the next epoch ahead of time.
+
+Bundle-backed tables may carry pandas Categoricals, hence observed=True on
+every groupby.
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from constants import ROAD_FEATURES, US_STATES
+from data_processing import state_code
+from log_histogram import DISTANCE_BINS, DURATION_BINS
+from route_risk import route_summary, score_route, score_routes
+from sampler import PRIORITY_COL, quotas
+from spatial_grid import cell_centers, cell_range, zoom_to_res
+from timeseries import DailyCounts, moving_average, rollup, yoy_delta
+from table_store import (
+    CACHE_TTL_SECONDS, count_rows, current_epoch, head_rows, load_table, open_point_index, open_text_index,
+)
+from weather_groups import WEATHER_FAMILIES
+
+SEVERITY_MAP = {1: "Low", 2: "Medium", 3: "High", 4: "Critical"}
+SEVERITY_CODES = {label: code for code, label in SEVERITY_MAP.items()}
+SEVERITY_ORDER = ["Critical", "High", "Medium", "Low"]
+MAX_POINTS = 50000  # 推荐 20k-80k 之间
+LA_CITY = "Los Angeles"
+NATIONAL = "US"  # anomalies 表里全国序列的 State
+WEEKDAY_ORDER = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+_cache = st.cache_data(ttl=2 * CACHE_TTL_SECONDS, show_spinner=False)
+
+
+def _epoch(epoch):
+    return current_epoch() if epoch is None else epoch
+
+
+def _years_key(years):
+    return None if years is None else tuple(sorted(int(y) for y in years))
+
+
+# -------------------------
+# State / City (Regional + Severity)
+# -------------------------
+@_cache
+def _state_severity_totals(years, epoch):
+    df = load_table("state_yearly_summary", epoch)
+    if years is not None:
+        df = df[df["Year"].isin(years)]
+    agg = (
+        df.groupby("State_Code", as_index=False, observed=True)[["Accident_Count", "Low", "Medium", "High", "Critical"]]
+          .sum()
+    )
+    agg["State"] = agg["State_Code"].map(US_STATES)
+    return agg
+
+
+def state_severity_totals(years=None, epoch=None) -> pd.DataFrame:
+    """Accident and per-severity counts by state, summed over `years` (None = all years)."""
+    return _state_severity_totals(_years_key(years), _epoch(epoch))
+
+
+@_cache
+def _city_rank(years, epoch):
+    df = load_table("city_year_counts_top200", epoch)
+    if years is not None:
+        df = df[df["Year"].isin(years)]
+    return (
+        df.groupby("City", as_index=False, observed=True)["Accident_Count"]
+          .sum()
+          .sort_values("Accident_Count", ascending=False)
+    )
+
+
+def city_rank(years=None, epoch=None) -> pd.DataFrame:
+    """Cities ranked by accident count over `years` (None = all years)."""
+    return _city_rank(_years_key(years), _epoch(epoch))
+
+
+def _priority_head(filters, n, epoch, stratified=False, columns=("Start_Lat", "Start_Lng")):
+    """
+    First `n` accident_points rows matching `filters`: the table is sorted by
+    sample_priority within each City, so this is the deterministic sample.
+    `stratified` gives each severity a proportional quota (one head per severity).
+    """
+    columns = list(columns) + [PRIORITY_COL]
+    if not stratified:
+        return head_rows("accident_points", n, columns, filters, epoch)
+    codes = sorted(SEVERITY_MAP)
+    sizes = np.array([count_rows("accident_points", filters + [("Severity", "=", c)], epoch) for c in codes])
+    heads = [
+        head_rows("accident_points", int(q), columns, filters + [("Severity", "=", c)], epoch)
+        for c, q in zip(codes, quotas(sizes, n)) if q > 0
+    ]
+    if not heads:
+        return head_rows("accident_points", 0, columns, filters, epoch)
+    return pd.concat(heads, ignore_index=True).sort_values(PRIORITY_COL, kind="stable")
+
+
+@_cache
+def _city_points(city, years, stratified, epoch):
+    filters = [("City", "=", city)]
+    if years is not None:
+        filters.append(("year", "in", list(years)))
+    pts = _priority_head(filters, MAX_POINTS, epoch, stratified)
+    return pts[["Start_Lat", "Start_Lng"]].reset_index(drop=True)
+
+
+def city_points(city: str, years=None, stratified: bool = False, epoch=None) -> pd.DataFrame:
+    """
+    Heatmap points for one city, capped at MAX_POINTS. The same filter always
+    returns the same points; `stratified` keeps each severity's share.
+    """
+    return _city_points(city, _years_key(years), stratified, _epoch(epoch))
+
+
+@_cache
+def _city_hotspots(city, bbox, epoch):
+    # 同名城市（Portland OR / ME 等）按质心落在 bbox 内区分
+    min_lng, min_lat, max_lng, max_lat = bbox
+    filters = [
+        ("City", "=", city),
+        ("lat", ">=", min_lat), ("lat", "<=", max_lat),
+        ("lng", ">=", min_lng), ("lng", "<=", max_lng),
+    ]
+    return load_table("hotspots", epoch, filters=filters).sort_values("cluster").reset_index(drop=True)
+
+
+def city_hotspots(city: str, bbox, epoch=None) -> pd.DataFrame:
+    """
+    Accident clusters of one city from the builder (all years), largest first.
+    Only clusters centred inside `bbox` (min_lng, min_lat, max_lng, max_lat)
+    are returned, so a city name shared by several states draws one of them.
+    """
+    return _city_hotspots(city, tuple(float(v) for v in bbox), _epoch(epoch))
+
+
+# -------------------------
+# National density grid (Regional)
+# -------------------------
+@_cache
+def _grid_cells(res, years, cells, epoch):
+    filters = [("res", "=", res)]
+    if years is not None:
+        filters.append(("year", "in", years))
+    if cells is not None:
+        # 表按 cell_y, cell_x 排序，bbox 范围下推后可以跳过 row group
+        x0, y0, x1, y1 = cells
+        filters += [("cell_y", ">=", y0), ("cell_y", "<=", y1), ("cell_x", ">=", x0), ("cell_x", "<=", x1)]
+    df = load_table("grid_severity_year_counts", epoch, filters=filters)
+    df["Severity"] = df["Severity"].map(SEVERITY_MAP)
+    cells = (
+        df.pivot_table(index=["cell_x", "cell_y"], columns="Severity", values="accident_count",
+                       aggfunc="sum", fill_value=0, observed=True)
+          .reindex(columns=SEVERITY_ORDER, fill_value=0)
+          .reset_index()
+    )
+    cells.columns.name = None
+    cells["lat"], cells["lng"] = cell_centers(cells["cell_x"], cells["cell_y"], res)
+    return cells
+
+
+def grid_cells(bbox=None, zoom: float = 4, years=None, severities=None, epoch=None) -> pd.DataFrame:
+    """
+    Exact accident counts per grid cell for a map view.
+
+    bbox: (min_lng, min_lat, max_lng, max_lat), or None for every cell
+    zoom: web-map zoom level, mapped to a grid resolution by spatial_grid.zoom_to_res
+    Returns cell_x, cell_y, lat, lng (cell center), one column per severity and
+    Count (summed over `severities`, None = all severities).
+    """
+    res = zoom_to_res(zoom)
+    cells = _grid_cells(res, _years_key(years), None if bbox is None else cell_range(bbox, res), _epoch(epoch))
+    cells = cells.copy()
+    cells["Count"] = cells[list(severities or SEVERITY_ORDER)].sum(axis=1)
+    return cells[cells["Count"] > 0]
+
+
+# -------------------------
+# Street ranking (Regional)
+# -------------------------
+@_cache
+def _street_ranking(scope, state, city, year, epoch):
+    df = load_table("street_rankings", epoch, filters=[("scope", "=", scope)])
+    mask = df["year"].isna() if year is None else df["year"] == year
+    if state is not None:
+        mask &= df["State"] == state
+    if city is not None:
+        mask &= df["City"] == city
+    return df[mask].sort_values("rank")[["rank", "Street", "Count", *SEVERITY_ORDER]].reset_index(drop=True)
+
+
+def street_ranking(state=None, city=None, year=None, epoch=None) -> pd.DataFrame:
+    """
+    Most frequent accident streets, ranked by the builder (top 25 per scope).
+
+    state: state code, city: city name (needs `state`); both None = national.
+    year: a single year, or None for all years.
+    """
+    scope = "city" if city is not None else "state" if state is not None else "national"
+    return _street_ranking(scope, state, city, None if year is None else int(year), _epoch(epoch))
+
+
+@_cache
+def _street_ranking_cities(epoch):
+    df = load_table("street_rankings", epoch, filters=[("scope", "=", "city")])
+    return (
+        df.groupby(["State", "City"], as_index=False, observed=True)["Count"].max()
+          .sort_values("Count", ascending=False)[["State", "City"]]
+          .reset_index(drop=True)
+    )
+
+
+def street_ranking_cities(epoch=None) -> pd.DataFrame:
+    """(State, City) pairs that have a city-level street ranking, by their top street's count."""
+    return _street_ranking_cities(_epoch(epoch))
+
+
+# -------------------------
+# Nearby accidents (Regional)
+# -------------------------
+def accidents_near(lat: float, lng: float, radius_mi: float = 2.0, k: int = None, limit: int = 5000, epoch=None) -> dict:
+    """
+    Accidents within `radius_mi` of (lat, lng), or the `k` nearest when k is given;
+    see point_index.PointIndex.query. Answered from the in-memory index, not cached.
+    """
+    return open_point_index(_epoch(epoch)).query(lat, lng, radius_mi=radius_mi, k=k, limit=limit)
+
+
+def route_risk(route, buffer_mi: float = 0.25, epoch=None):
+    """(per-segment DataFrame, whole-route summary) for one polyline; see route_risk.score_route."""
+    segments = score_route(open_point_index(_epoch(epoch)), route, buffer_mi)
+    return segments, route_summary(segments)
+
+
+def route_risk_batch(routes: dict, buffer_mi: float = 0.25, epoch=None) -> pd.DataFrame:
+    """One summary row per route ({route id: polyline}), riskiest per mile first."""
+    return score_routes(open_point_index(_epoch(epoch)), routes, buffer_mi)
+
+
+# -------------------------
+# Full-text search (Regional)
+# -------------------------
+@_cache
+def _search_accidents(query, limit, epoch):
+    index = open_text_index(epoch)
+    if index is None:
+        return None
+    return index.search(query, limit)
+
+
+def search_accidents(query: str, limit: int = 5000, epoch=None):
+    """
+    Keyword (AND) search over Description / Street; see text_index.TextIndex.search.
+    None when the index is unavailable.
+    """
+    return _search_accidents(" ".join(sorted(set(query.lower().split()))), limit, _epoch(epoch))
+
+
+# -------------------------
+# Severity
+# -------------------------
+@_cache
+def _severity_by_yearquarter(epoch):
+    df = load_table("state_yearquarter_severity_counts", epoch)
+    df["Severity"] = df["Severity"].map(SEVERITY_MAP)
+    out = (
+        df.groupby(["YearQuarter", "Severity"], as_index=False, observed=True)["Severity_Count"]
+          .sum()
+          .rename(columns={"Severity_Count": "Count"})
+    )
+    out["Severity"] = pd.Categorical(out["Severity"], categories=SEVERITY_ORDER, ordered=True)
+    return out
+
+
+def severity_by_yearquarter(epoch=None) -> pd.DataFrame:
+    """National accident counts by YearQuarter x Severity."""
+    return _severity_by_yearquarter(_epoch(epoch))
+
+
+@_cache
+def _county_severity_totals(years, epoch):
+    if years is None:
+        # 全部年份：builder 已经汇总好的宽表
+        return load_table("county_severity_counts", epoch)
+    df = load_table("county_year_severity_counts", epoch, filters=[("year", "in", years)])
+    df["Severity"] = df["Severity"].map(SEVERITY_MAP)
+    wide = (
+        df.pivot_table(index=["fips", "County", "State", "lat", "lng"], columns="Severity",
+                       values="accident_count", aggfunc="sum", fill_value=0, observed=True)
+          .reindex(columns=SEVERITY_ORDER, fill_value=0)
+          .reset_index()
+    )
+    wide.columns.name = None
+    wide["Count"] = wide[SEVERITY_ORDER].sum(axis=1)
+    return wide[["fips", "County", "State", "lat", "lng", "Count", *SEVERITY_ORDER]]
+
+
+def county_severity_totals(years=None, epoch=None) -> pd.DataFrame:
+    """Accident and per-severity counts by county (with centroid), summed over `years` (None = all years)."""
+    return _county_severity_totals(_years_key(years), _epoch(epoch))
+
+
+IMPACT_METRICS = {"duration": ("duration_counts", DURATION_BINS), "distance": ("distance_counts", DISTANCE_BINS)}
+IMPACT_QUANTILES = {"p50": 0.5, "p75": 0.75, "p90": 0.9, "p99": 0.99}
+
+
+@_cache
+def _impact_counts(metric, state, years, weathers, epoch):
+    col, bins = IMPACT_METRICS[metric]
+    filters = []
+    if state is not None:
+        filters.append(("State", "=", state))
+    if years is not None:
+        filters.append(("year", "in", years))
+    df = load_table("impact_histograms", epoch, filters=filters or None)
+    if weathers is not None:
+        df = df[df["Weather_Condition"].isin(weathers)]
+    # 同一套分箱：按 severity 直接把直方图数组相加
+    counts = np.zeros((5, bins.n), dtype=np.int64)
+    if len(df):
+        np.add.at(counts, df["Severity"].astype(int).to_numpy(), np.stack(df[col].to_numpy()))
+    return counts
+
+
+def impact_distribution(metric: str = "duration", state=None, years=None, weathers=None, epoch=None):
+    """
+    Clearance time (metric="duration", minutes) or impact distance ("distance", miles)
+    by severity, merged from the builder's log-bin histograms.
+
+    Returns (histogram: Severity, Bin, Low_Edge, Count, Share, quantiles: Severity, n, p50, p75, p90, p99).
+    """
+    bins = IMPACT_METRICS[metric][1]
+    weathers = None if weathers is None else tuple(sorted(weathers))
+    counts = _impact_counts(metric, state, _years_key(years), weathers, _epoch(epoch))
+
+    labels = bins.labels()
+    hist, quant = [], []
+    for sev in SEVERITY_ORDER:
+        c = counts[SEVERITY_CODES[sev]]
+        total = c.sum()
+        hist.append(pd.DataFrame({
+            "Severity": sev, "Bin": labels, "Low_Edge": bins.edges[:-1], "Count": c,
+            "Share": c / total * 100 if total else np.zeros(len(c)),
+        }))
+        quant.append({"Severity": sev, "n": int(total),
+                      **dict(zip(IMPACT_QUANTILES, bins.quantiles(c, list(IMPACT_QUANTILES.values()))))})
+    return pd.concat(hist, ignore_index=True), pd.DataFrame(quant)
+
+
+@_cache
+def _road_feature_stats(state, years, epoch):
+    filters = []
+    if state is not None:
+        filters.append(("State", "=", state))
+    if years is not None:
+        filters.append(("year", "in", years))
+    df = load_table("road_feature_counts", epoch, filters=filters or None)
+    flags = df["flags"].to_numpy(np.int64)
+    count = df["accident_count"].to_numpy(np.float64)
+    sev = df["Severity"].astype(int).to_numpy()
+
+    # flags 按位展开：bits[i, f] = 第 i 种组合是否带 feature f
+    bits = (flags[:, None] >> np.arange(len(ROAD_FEATURES))) & 1
+    with_feature = np.zeros((5, len(ROAD_FEATURES)))
+    np.add.at(with_feature, sev, bits * count[:, None])
+    sev_total = np.bincount(sev, weights=count, minlength=5)
+    feature_total = with_feature.sum(axis=0)
+    n = count.sum()
+
+    rows = []
+    for label in SEVERITY_ORDER:
+        s = SEVERITY_CODES[label]
+        # 2x2 表：a = feature 且该 severity，b = feature 其它 severity，c = 无 feature 该 severity，d = 其余
+        a = with_feature[s]
+        b = feature_total - a
+        c = sev_total[s] - a
+        d = n - a - b - c
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rows.append(pd.DataFrame({
+                "Severity": label,
+                "Feature": ROAD_FEATURES,
+                "Count": a.astype(np.int64),
+                "Share": np.where(sev_total[s] > 0, a / sev_total[s] * 100, 0.0),
+                "Lift": np.where((feature_total > 0) & (sev_total[s] > 0), (a / feature_total) / (sev_total[s] / n), np.nan),
+                # Haldane 修正（各格 +0.5），避免 0 格导致的无穷大
+                "Odds_Ratio": ((a + 0.5) * (d + 0.5)) / ((b + 0.5) * (c + 0.5)),
+            }))
+    return pd.concat(rows, ignore_index=True)
+
+
+def road_feature_stats(state=None, years=None, epoch=None) -> pd.DataFrame:
+    """
+    Per (Severity, road Feature): Count of accidents with the feature, Share (% of
+    that severity's accidents), Lift = P(severity | feature) / P(severity) and
+    the odds ratio of the severity with vs. without the feature.
+    """
+    return _road_feature_stats(state, _years_key(years), _epoch(epoch))
+
+
+@_cache
+def _la_severity_points(severity, epoch):
+    filters = [("City", "=", LA_CITY), ("Severity", "=", SEVERITY_CODES[severity])]
+    pts = _priority_head(filters, MAX_POINTS, epoch)
+    return pts.assign(Severity=severity)[["Start_Lat", "Start_Lng", "Severity"]]
+
+
+def la_severity_points(severity: str, epoch=None) -> pd.DataFrame:
+    """Los Angeles accident points of one severity, capped at MAX_POINTS."""
+    return _la_severity_points(severity, _epoch(epoch))
+
+
+# -------------------------
+# Temporal
+# -------------------------
+@_cache
+def _top_states_by_quarter(epoch):
+    state_time_counts = load_table("state_quarter_counts", epoch).rename(columns={
+        "State": "State_Code",
+        "year": "Year",
+        "quarter": "Quarter",
+        "accident_count": "Count"
+    })
+    state_time_counts["State"] = state_time_counts["State_Code"].apply(state_code)
+    state_time_counts["YearQuarter"] = (
+        state_time_counts["Year"].astype(str) + "-Q" + state_time_counts["Quarter"].astype(str)
+    )
+
+    # Get top 10 states for each time period and sort them
+    top_10 = (state_time_counts.groupby("YearQuarter")
+              .apply(lambda x: x.nlargest(10, "Count").sort_values("Count", ascending=True))
+              .reset_index(drop=True))
+
+    severity_counts = load_table("state_yearquarter_severity_counts", epoch)
+    severity_counts["Severity"] = severity_counts["Severity"].map(SEVERITY_MAP)
+    severity_counts["State"] = severity_counts["State"].apply(state_code)
+    return state_time_counts, top_10, severity_counts
+
+
+def top_states_by_quarter(epoch=None):
+    """(state_time_counts, top 10 states per YearQuarter, state x YearQuarter x Severity counts)."""
+    return _top_states_by_quarter(_epoch(epoch))
+
+
+@_cache
+def _temporal_matrix(epoch):
+    df = load_table("temporal_matrix", epoch)
+    states = sorted(df["State"].astype(str).unique())
+    years = sorted(int(y) for y in df["year"].unique())
+    matrix = np.zeros((len(states), len(years), 7, 24, 4), dtype=np.int32)
+    s_idx = pd.Index(states).get_indexer(df["State"].astype(str))
+    y_idx = pd.Index(years).get_indexer(df["year"].astype(int))
+    matrix[s_idx, y_idx] = np.stack(df["counts"].to_numpy()).reshape(-1, 7, 24, 4)
+    return matrix, states, years
+
+
+def temporal_matrix(epoch=None):
+    """
+    (counts, state codes, years): counts is an int32 array of shape
+    state x year x weekday (0=Monday) x hour x severity (0=Low ... 3=Critical).
+    """
+    return _temporal_matrix(_epoch(epoch))
+
+
+def temporal_slice(state=None, years=None, severities=None, epoch=None) -> np.ndarray:
+    """weekday x hour x severity counts for one state code (None = all states), summed over `years`."""
+    matrix, states, all_years = temporal_matrix(epoch)
+    if state is not None:
+        if state not in states:
+            return np.zeros(matrix.shape[2:], dtype=np.int64)
+        matrix = matrix[states.index(state)][None]
+    if years is not None:
+        matrix = matrix[:, [i for i, y in enumerate(all_years) if y in set(years)]]
+    counts = matrix.sum(axis=(0, 1), dtype=np.int64)
+    if severities is not None:
+        keep = np.isin(np.arange(1, 5), [SEVERITY_CODES[s] for s in severities])
+        counts = counts * keep
+    return counts
+
+
+def weekday_counts(state=None, years=None, epoch=None) -> pd.DataFrame:
+    counts = temporal_slice(state, years, epoch=epoch).sum(axis=(1, 2))
+    return pd.DataFrame({"Day of Week": WEEKDAY_ORDER, "Total_Count": counts})
+
+
+def hour_counts(state=None, years=None, epoch=None) -> pd.DataFrame:
+    counts = temporal_slice(state, years, epoch=epoch).sum(axis=(0, 2))
+    return pd.DataFrame({"Hour": np.arange(24), "Total_Count": counts})
+
+
+def hour_weekday_counts(state=None, years=None, severities=None, epoch=None) -> pd.DataFrame:
+    """Weekday x hour grid (index = weekday names, columns = hours 0..23)."""
+    counts = temporal_slice(state, years, severities, epoch).sum(axis=2)
+    return pd.DataFrame(counts, index=WEEKDAY_ORDER, columns=range(24))
+
+
+def severity_hour_counts(state=None, years=None, epoch=None) -> pd.DataFrame:
+    """Long Hour x Severity counts."""
+    counts = temporal_slice(state, years, epoch=epoch).sum(axis=0)
+    return pd.DataFrame({
+        "Hour": np.repeat(np.arange(24), 4),
+        "Severity": np.tile([SEVERITY_MAP[code] for code in range(1, 5)], 24),
+        "Count": counts.reshape(-1),
+    })
+
+
+@_cache
+def _daily_counts(epoch):
+    return DailyCounts.from_table(load_table("daily_counts", epoch))
+
+
+def daily_counts(epoch=None) -> DailyCounts:
+    """Daily counts per (State, Severity) as dense arrays (see timeseries.py)."""
+    return _daily_counts(_epoch(epoch))
+
+
+def time_series(state=None, freq: str = "M", start=None, end=None, severities=None,
+                ma_window: int = None, epoch=None) -> pd.DataFrame:
+    """
+    Accident counts per period for one state code (None = all states).
+
+    freq: "D", "W" (weeks start Monday), "M", "Q" or "Y"
+    start / end: inclusive date range of the returned periods (None = full range)
+    Returns Date (period start), Count, YoY and YoY_pct, plus MA when `ma_window`
+    is given. Moving averages and YoY use the history before `start` as well.
+    """
+    dc = daily_counts(epoch)
+    codes = None if severities is None else [SEVERITY_CODES[s] for s in severities]
+    out = rollup(dc.series(state, codes), dc.days, freq)
+    out["YoY"], out["YoY_pct"] = yoy_delta(out["Count"].to_numpy(), freq)
+    if ma_window:
+        out["MA"] = moving_average(out["Count"].to_numpy(), ma_window)
+    if start is not None:
+        out = out[out["Date"] >= np.datetime64(pd.Timestamp(start).date(), "D")]
+    if end is not None:
+        out = out[out["Date"] <= np.datetime64(pd.Timestamp(end).date(), "D")]
+    return out.reset_index(drop=True)
+
+
+@_cache
+def _anomalies(state, epoch):
+    df = load_table("anomalies", epoch, filters=[("State", "=", state)])
+    return df.sort_values("month").reset_index(drop=True)
+
+
+def anomalies(state=None, epoch=None) -> pd.DataFrame:
+    """Flagged months (spike / drop / change_point) for one state code, None = national total."""
+    return _anomalies(state or NATIONAL, _epoch(epoch))
+
+
+# -------------------------
+# Weather
+# -------------------------
+@_cache
+def _weather_condition_totals(epoch):
+    weather_severity = load_table("weather_severity_counts", epoch).rename(columns={"accident_count": "Count"})
+    total_accidents = (
+        weather_severity.groupby("Weather_Condition", as_index=False, observed=True)["Count"]
+        .sum()
+        .sort_values("Count", ascending=False)
+    )
+    total_accidents["Percentage"] = (total_accidents["Count"] / total_accidents["Count"].sum() * 100).round(1)
+    return total_accidents
+
+
+def weather_condition_totals(epoch=None) -> pd.DataFrame:
+    """Weather conditions ranked by accident count, with share of all accidents."""
+    return _weather_condition_totals(_epoch(epoch))
+
+
+def _families_key(families):
+    return None if families is None else tuple(sorted(int(f) for f in families))
+
+
+@_cache
+def _weather_families(epoch):
+    df = load_table("weather_family_severity_counts", epoch)
+    totals = (
+        df.groupby(["family_code", "Family", "rank"], as_index=False, observed=True)["accident_count"]
+          .sum()
+          .rename(columns={"accident_count": "Count"})
+          .sort_values("rank")
+          .reset_index(drop=True)
+    )
+    totals["Percentage"] = (totals["Count"] / totals["Count"].sum() * 100).round(1)
+    return totals
+
+
+def weather_families(epoch=None) -> pd.DataFrame:
+    """Weather families (family_code, Family, Count, Percentage, rank), most accidents first."""
+    return _weather_families(_epoch(epoch))
+
+
+@_cache
+def _weather_family_severity(families, epoch):
+    filters = None if families is None else [("family_code", "in", list(families))]
+    df = load_table("weather_family_severity_counts", epoch, filters=filters).rename(columns={"accident_count": "Count"})
+    df["Severity"] = df["Severity"].map(SEVERITY_MAP)
+    return df.sort_values(["rank", "Severity"]).reset_index(drop=True)
+
+
+def weather_family_severity(families=None, epoch=None) -> pd.DataFrame:
+    """Per (family, Severity label) accident counts for the given family codes (None = all)."""
+    return _weather_family_severity(_families_key(families), _epoch(epoch))
+
+
+@_cache
+def _weather_top_conditions(families, top_n, epoch):
+    filters = [("family_rank", "<=", top_n)]
+    if families is not None:
+        filters.append(("family_code", "in", list(families)))
+    df = load_table("weather_condition_severity_counts", epoch, filters=filters).rename(columns={"accident_count": "Count"})
+    df["Severity"] = df["Severity"].map(SEVERITY_MAP)
+    df["Family"] = df["family_code"].astype(int).map(WEATHER_FAMILIES)
+    return df.sort_values(["rank", "Severity"]).reset_index(drop=True)
+
+
+def weather_top_conditions(families=None, top_n: int = 5, epoch=None) -> pd.DataFrame:
+    """
+    Per (condition, Severity label) counts of the `top_n` conditions of each
+    family (precomputed family_rank), ordered by overall rank.
+    """
+    return _weather_top_conditions(_families_key(families), int(top_n), _epoch(epoch))
+
+
+@_cache
+def _weather_family_raw_conditions(families, epoch):
+    lookup = load_table("weather_conditions", epoch, filters=[("family_code", "in", list(families))])
+    return sorted(lookup["Weather_Condition"].dropna().astype(str).unique())
+
+
+def weather_family_raw_conditions(families, epoch=None) -> list:
+    """Raw Weather_Condition strings that normalize into the given family codes."""
+    return _weather_family_raw_conditions(_families_key(families), _epoch(epoch))
+
+
+@_cache
+def _weather_samples(conditions, epoch):
+    weather = load_table("weather_kde_sample", epoch)
+    weather["Severity"] = weather["Severity"].map(SEVERITY_MAP)
+    if conditions is not None:
+        weather = weather[weather["Weather_Condition"].isin(conditions)]
+    return weather
+
+
+def weather_samples(conditions=None, epoch=None) -> pd.DataFrame:
+    """KDE sample rows for the selected weather conditions (None = all conditions)."""
+    key = None if conditions is None else tuple(sorted(conditions))
+    return _weather_samples(key, _epoch(epoch))
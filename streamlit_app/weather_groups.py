@@ -0,0 +1,115 @@
+"""
+Canonical weather hierarchy: raw Weather_Condition string -> condition -> family.
+
+The raw column has ~100 spellings of a few dozen conditions ("Light Rain",
+"Light Rain / Windy", "Rain Showers", "T-Storm", "Thunderstorm" ...).
+`normalize_condition` drops the " / Windy" suffix and folds synonyms into a
+canonical condition name, then the first matching keyword rule in
+FAMILY_RULES picks one of the fixed WEATHER_FAMILIES (thunder beats rain,
+freezing rain is ice, and so on).
+
+`build_lookup` turns the distinct raw strings of a build into a small table
+with integer codes. The builder broadcast-joins it at ingest, so every table
+can carry `family_code` / `condition_code`. Family codes are fixed.
+Condition codes are family * 100 + position within the family, so they are
+stable only within one build; pages read names from the `weather_conditions`
+table of the same build.
+
+Only depends on pandas.
+"""
+import re
+
+import pandas as pd
+
+UNKNOWN_FAMILY = 0
+WEATHER_FAMILIES = {
+    0: "Unknown",
+    1: "Clear",
+    2: "Cloudy",
+    3: "Fog / Mist",
+    4: "Haze / Smoke",
+    5: "Drizzle",
+    6: "Rain",
+    7: "Thunderstorm",
+    8: "Snow",
+    9: "Freezing / Ice",
+    10: "Hail",
+    11: "Dust / Sand",
+    12: "Wind / Tornado",
+}
+
+# 按顺序匹配，第一个命中的关键字决定 family（雷暴优先于雨，冻雨 / 冰粒优先于雨和雪）
+FAMILY_RULES = [
+    (7, ("thunder",)),
+    (12, ("tornado", "funnel", "squall")),
+    (10, ("hail",)),
+    (9, ("freezing", "ice pellets", "sleet", "wintry")),
+    (8, ("snow",)),
+    (5, ("drizzle",)),
+    (6, ("rain", "shower")),
+    (3, ("fog", "mist")),
+    (4, ("haze", "smoke", "volcanic")),
+    (11, ("dust", "sand")),
+    (2, ("cloud", "overcast")),
+    (1, ("fair", "clear")),
+    (12, ("wind",)),
+]
+
+# 同义写法 -> 统一写法（大小写不敏感）
+SYNONYMS = [
+    (r"\bt-?storms?\b", "Thunderstorm"),
+    (r"\bthunderstorms\b", "Thunderstorm"),
+    (r"\bshowers\b", "Shower"),
+    (r"\bfair\b", "Clear"),
+    (r"\bn/a precipitation\b", ""),
+]
+_WINDY_SUFFIX = re.compile(r"\s*/\s*windy$", re.IGNORECASE)
+_SYNONYMS = [(re.compile(p, re.IGNORECASE), r) for p, r in SYNONYMS]
+
+LOOKUP_COLUMNS = ["Weather_Condition", "family_code", "Family", "condition_code", "Condition"]
+
+
+def normalize_condition(raw):
+    """(family code, canonical condition name) of one raw Weather_Condition value."""
+    if raw is None or not isinstance(raw, str):
+        return UNKNOWN_FAMILY, "Unknown"
+    s = " ".join(raw.split())
+    # "Windy" 单独出现时保留，作为 Wind family
+    stripped = _WINDY_SUFFIX.sub("", s)
+    s = stripped or s
+    for pattern, repl in _SYNONYMS:
+        s = pattern.sub(repl, s)
+    s = " ".join(s.split())
+    if not s:
+        return UNKNOWN_FAMILY, "Unknown"
+
+    lower = s.lower()
+    for family, keywords in FAMILY_RULES:
+        if any(k in lower for k in keywords):
+            return family, s
+    return UNKNOWN_FAMILY, s
+
+
+def build_lookup(raw_values) -> pd.DataFrame:
+    """
+    One row per distinct raw value (None included):
+    Weather_Condition, family_code, Family, condition_code, Condition.
+    """
+    # 空值也占一行（Unknown），join 之后不用再单独 coalesce
+    raw = list(dict.fromkeys(raw_values))
+    raw = pd.Series(raw + ([None] if None not in raw else []), dtype=object)
+    normalized = [normalize_condition(v) for v in raw]
+    lookup = pd.DataFrame({
+        "Weather_Condition": raw,
+        "family_code": [f for f, _ in normalized],
+        "Condition": [c for _, c in normalized],
+    })
+    lookup["Family"] = lookup["family_code"].map(WEATHER_FAMILIES)
+
+    conditions = lookup[["family_code", "Condition"]].drop_duplicates().sort_values(["family_code", "Condition"])
+    position = conditions.groupby("family_code").cumcount()
+    if position.max() >= 100:
+        raise ValueError("more than 99 conditions in one weather family")
+    conditions["condition_code"] = conditions["family_code"] * 100 + position
+    lookup = lookup.merge(conditions, on=["family_code", "Condition"], how="left")
+    return lookup[LOOKUP_COLUMNS]